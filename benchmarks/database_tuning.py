@@ -0,0 +1,80 @@
+# Benchmarks settings writes and uncached reads under different [database]
+# tuning profiles (see docs/bot.conf.example), with a commit after every write
+# and with group commit committing every 10 writes like a busy event loop
+# would. fsync costs depend on the disk, so run it with --directory on the
+# disk the bot's database is on
+# usage: $ python3 benchmarks/database_tuning.py [--directory DIR]
+#    [--profile name:key=value,key=value]
+
+import argparse, os, sys, tempfile, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import src.utils.consts
+from src import Database, Logging
+
+PROFILES = [
+    ("defaults", {}),
+    ("wal, synchronous=full", {"journal-mode": "wal"}),
+    ("wal, synchronous=normal", {"journal-mode": "wal",
+        "synchronous": "normal"}),
+    ("wal, normal, 16MB cache, 256MB mmap, memory temp", {
+        "journal-mode": "wal", "synchronous": "normal",
+        "cache-size": "-16000", "mmap-size": "268435456",
+        "temp-store": "memory"})
+]
+
+parser = argparse.ArgumentParser(
+    description="Compare settings throughput under [database] profiles")
+parser.add_argument("--directory", "-d",
+    help="Where to make the benchmark's database")
+parser.add_argument("--writes", "-w", type=int, default=1000,
+    help="How many writes (and reads) to time")
+parser.add_argument("--profile", "-p", action="append", default=[],
+    help="Time this profile instead, as name:key=value,key=value")
+args = parser.parse_args()
+
+profiles = PROFILES
+if args.profile:
+    profiles = []
+    for profile in args.profile:
+        name, _, options = profile.partition(":")
+        profiles.append((name, dict(option.split("=", 1)
+            for option in options.split(",") if option)))
+
+USERS = 100
+for name, options in profiles:
+    with tempfile.TemporaryDirectory(dir=args.directory) as directory:
+        log = Logging.Log(False, "warn", directory, [])
+        database = Database.Database(log,
+            "sqlite3:%s" % os.path.join(directory, "bot.db"),
+            options=options)
+        server_id = database.servers.add("server", "localhost", 6667, None,
+            False, None, "bitbot")
+        for i in range(USERS):
+            database.users.add(server_id, "user%d" % i)
+
+        start = time.perf_counter()
+        for i in range(args.writes):
+            database.user_settings.set(1+i%USERS, "seen-%d" % i, time.time())
+        per_write = time.perf_counter()-start
+
+        database.set_group_commit(0)
+        start = time.perf_counter()
+        for i in range(args.writes):
+            database.user_settings.set(1+i%USERS, "seen-%d" % i, time.time())
+            if i % 10 == 9:
+                database.commit()
+        database.commit()
+        group_commit = time.perf_counter()-start
+
+        database.settings_cache.flush()
+        start = time.perf_counter()
+        for i in range(args.writes):
+            database.user_settings.get(1+i%USERS, "seen-%d" % i)
+        reads = time.perf_counter()-start
+
+        print(name)
+        print("    %s" % ", ".join("%s=%s" % item
+            for item in database.tuning().items()))
+        print("    per-write commit %6.0f writes/s, group commit %6.0f "
+            "writes/s, uncached reads %6.0f/s" % (args.writes/per_write,
+            args.writes/group_commit, args.writes/reads))
@@ -0,0 +1,90 @@
+# Benchmarks what module reloads do to EventManager: purging a context's hooks
+# and hooking them again, for every hook modules/ registers (modules that
+# can't be imported are skipped) and for a synthetic 100 modules x 30 hooks.
+# Also times get_children(), which commands uses to list commands.
+# Importing the modules themselves, the rest of a reload, isn't timed
+# usage: $ python3 benchmarks/event_hooks.py
+
+import glob, importlib, inspect, os, sys, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import src.utils.consts
+from src import EventManager, utils
+
+class Log(object):
+    def trace(self, *args, **kwargs):
+        pass
+    def tracing(self, *args):
+        return False
+
+ROUNDS = 5
+DIRECTORY = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# (context name, [(hook path, function, kwargs)])
+MODULES = []
+for path in sorted(glob.glob(os.path.join(DIRECTORY, "modules", "*"))):
+    name = os.path.basename(path)
+    if name.endswith(".py"):
+        name = name[:-3]
+    elif not os.path.isfile(os.path.join(path, "__init__.py")):
+        continue
+    try:
+        module = importlib.import_module("modules.%s" % name)
+    except Exception as e:
+        print("skipping %s: %s" % (name, e))
+        continue
+
+    hooks = []
+    module_class = getattr(module, "Module", None)
+    for _, function in inspect.getmembers(module_class, inspect.isfunction):
+        if utils.decorators.has_magic(function):
+            magic = utils.decorators.get_magic(function)
+            hooks.extend((hook, function, kwargs)
+                for hook, kwargs in magic.get_hooks())
+    MODULES.append((name, hooks))
+
+def noop(event):
+    pass
+SYNTHETIC = []
+for i in range(100):
+    hooks = []
+    for j in range(30):
+        if j < 10:
+            hooks.append(("received.command.command%d_%d" % (i, j), noop, []))
+        elif j < 20:
+            hooks.append(("received.message.channel", noop, []))
+        else:
+            hooks.append(("raw.received.command%d" % j, noop, []))
+    SYNTHETIC.append(("module%d" % i, hooks))
+
+def reload(modules) -> float:
+    root = EventManager.EventRoot(Log())
+    events = root.wrap()
+    def load(name, hooks):
+        context = events.new_context(name)
+        for hook, function, kwargs in hooks:
+            context.on(hook)._hook(function, kwargs=kwargs)
+    for name, hooks in modules:
+        load(name, hooks)
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for name, hooks in modules:
+            root._purge_context(name)
+            load(name, hooks)
+    return (time.perf_counter()-start)*1000/ROUNDS
+
+for label, modules in [("modules/", MODULES), ("synthetic", SYNTHETIC)]:
+    print("%-9s %3d modules, %4d hooks: purge and re-hook all %.1fms" % (
+        label, len(modules), sum(len(hooks) for _, hooks in modules),
+        reload(modules)))
+
+events = EventManager.EventRoot(Log()).wrap()
+for name, hooks in MODULES+SYNTHETIC:
+    context = events.new_context(name)
+    for hook, function, kwargs in hooks:
+        context.on(hook)._hook(function, kwargs=kwargs)
+start = time.perf_counter()
+for _ in range(200):
+    children = events.on("received.command").get_children()
+print("get_children(received.command), %d children: %.1fus" % (
+    len(children), (time.perf_counter()-start)*1000000/200))
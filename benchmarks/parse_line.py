@@ -0,0 +1,48 @@
+# Benchmarks IRCLine.parse_line() over a mix of tagged PRIVMSGs, JOIN/PART
+# and NAMES replies, both as lines are usually handled and with every line's
+# id read (what every line paid before ids were generated lazily), and
+# measures the memory that keeping parsed lines takes
+# usage: $ python3 benchmarks/parse_line.py
+
+import os, sys, time, tracemalloc
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import src.utils.consts
+from src import IRCLine
+
+LINES = []
+for i in range(1000):
+    LINES.append("@time=2020-01-01T00:00:00.000Z;msgid=%d "
+        ":nick%d!user@host%d.example PRIVMSG #channel :hello there %d" % (
+        i, i%100, i%100, i))
+    if i % 10 == 0:
+        LINES.append(":nick%d!user@host%d.example JOIN #channel" % (i, i))
+        LINES.append(":nick%d!user@host%d.example PART #channel :bye" % (i,
+            i))
+LINES.extend([":irc.example 353 bitbot = #channel :%s" % " ".join(
+    "@nick%d" % j for j in range(20))]*200)
+ROUNDS = 7
+REPEAT = 50
+
+def lines_per_second(read_id: bool) -> float:
+    best = 0.0
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        for _ in range(REPEAT):
+            for line in LINES:
+                parsed = IRCLine.parse_line(line)
+                if read_id:
+                    parsed.id
+        best = max(best, REPEAT*len(LINES)/(time.perf_counter()-start))
+    return best
+
+print("%d lines, best of %d runs" % (len(LINES), ROUNDS))
+print("parse_line():           %.0f lines/s" % lines_per_second(False))
+print("parse_line() and .id:   %.0f lines/s" % lines_per_second(True))
+
+tracemalloc.start()
+before = tracemalloc.get_traced_memory()[0]
+kept = [IRCLine.parse_line(line) for line in LINES*10]
+after = tracemalloc.get_traced_memory()[0]
+tracemalloc.stop()
+print("%d parsed lines kept: %.0f bytes each" % (len(kept),
+    (after-before)/len(kept)))
@@ -0,0 +1,100 @@
+# Benchmarks SendableLine.push_last() splitting long multibyte command output
+# in to (more ...) chunks the way commands does, against the per-char loop it
+# replaced. Both are first checked to split random and edge case input the
+# same way
+# usage: $ python3 benchmarks/push_last.py
+
+import codecs, os, random, sys, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import src.utils.consts
+from src import IRCLine
+
+def old_push_last(line: IRCLine.SendableLine, arg: str, extra_margin: int=0,
+        human_trunc: bool=False):
+    # push_last() before it encoded the argument once
+    last_arg = line.args[-1]
+    tags, formatted = line._format()
+    n = len(formatted.encode("utf8"))
+    n += line._margin
+    if " " in arg and not " " in last_arg:
+        n += 1
+    n += extra_margin
+
+    overflow = None
+    if (n+len(arg.encode("utf8"))) > IRCLine.LINE_MAX:
+        for i, char in enumerate(codecs.iterencode(arg, "utf8")):
+            n += len(char)
+            if n > IRCLine.LINE_MAX:
+                arg, overflow = arg[:i], arg[i:]
+                if human_trunc and not overflow[0] == " ":
+                    new_arg, sep, new_overflow = arg.rpartition(" ")
+                    if sep:
+                        arg = new_arg
+                        overflow = new_overflow+overflow
+                break
+    if arg:
+        line.args[-1] = last_arg+arg
+    return overflow
+
+def compare(first: str, arg: str, margin: int, extra_margin: int,
+        human_trunc: bool):
+    new = IRCLine.SendableLine("PRIVMSG", ["#channel", first], margin=margin)
+    old = IRCLine.SendableLine("PRIVMSG", ["#channel", first], margin=margin)
+    new_overflow = new.push_last(arg, extra_margin, human_trunc)
+    old_overflow = old_push_last(old, arg, extra_margin, human_trunc)
+    if not (new_overflow, new.format()) == (old_overflow, old.format()):
+        raise AssertionError("push_last(%r) differs: %r != %r" % (arg,
+            (new_overflow, new.format()), (old_overflow, old.format())))
+
+# a line that's already at or over LINE_MAX before anything is pushed
+FULL = "x"*IRCLine.LINE_MAX
+EDGE_CASES = [
+    ("", "", 0, 0), ("", "", 0, 600), (FULL, "", 0, 0), (FULL, "", 30, 10),
+    (FULL, "abc", 0, 0), (FULL, " abc", 0, 0), ("", "中"*300, 0, 0),
+    ("", "a"*500+" "+"b"*20, 0, 0), ("a b", "\U0001f600"*200, 10, 0)
+]
+
+random.seed(0)
+checked = 0
+for first, arg, margin, extra_margin in EDGE_CASES:
+    for human_trunc in [False, True]:
+        compare(first, arg, margin, extra_margin, human_trunc)
+        checked += 1
+alphabet = "ab cdé中\U0001f600 "
+for _ in range(3000):
+    arg = "".join(random.choice(alphabet) for _ in range(
+        random.randint(0, 700)))
+    compare(random.choice(["", "x", "a b", FULL]), arg,
+        random.randint(0, 60), random.choice([0, 10, 600]),
+        random.random() < 0.5)
+    checked += 1
+print("%d inputs split the same way" % checked)
+
+OUTPUTS = {
+    "ascii": "lorem ipsum dolor sit amet "*4000,
+    "cjk": "中文 "*20000,
+    "emoji": "\U0001f600\U0001f680 word "*10000
+}
+ROUNDS = 5
+
+def split_all(push, output: str) -> int:
+    splits = 0
+    while output:
+        line = IRCLine.SendableLine("PRIVMSG", ["#channel", ""], margin=100)
+        output = push(line, output, 10, True)
+        splits += 1
+    return splits
+
+for name, output in OUTPUTS.items():
+    results = []
+    for label, push in [("before", old_push_last),
+            ("after", IRCLine.SendableLine.push_last)]:
+        best = None
+        for _ in range(ROUNDS):
+            start = time.perf_counter()
+            splits = split_all(push, output)
+            took = time.perf_counter()-start
+            best = took if best == None else min(best, took)
+        results.append("%s %.1fms" % (label, best*1000))
+    print("%-5s %d chars, %d splits: %s" % (name, len(output), splits,
+        ", ".join(results)))
@@ -0,0 +1,98 @@
+# Benchmarks threads reading uncached settings while the main thread handles
+# IRC-like traffic (a few hot settings reads and a write per line, with group
+# commit), with the threads' reads either going through the read pool or
+# bounced through the main thread the way bot.trigger() does without one
+# usage: $ python3 benchmarks/read_pool.py [--threads 8] [--seconds 5]
+
+import argparse, os, queue, random, sys, tempfile, threading, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import src.utils.consts
+from src import Database, Logging
+
+parser = argparse.ArgumentParser(
+    description="Compare off-main-thread reads with and without a read pool")
+parser.add_argument("--threads", "-t", type=int, default=8,
+    help="How many threads to read from")
+parser.add_argument("--seconds", "-s", type=float, default=5,
+    help="How long to run each mode for")
+parser.add_argument("--users", "-u", type=int, default=50000,
+    help="How many users' settings the threads read")
+args = parser.parse_args()
+
+def run(read_connections: int) -> str:
+    directory = tempfile.TemporaryDirectory()
+    log = Logging.Log(False, "warn", directory.name, [])
+    database = Database.Database(log,
+        "sqlite3:%s" % os.path.join(directory.name, "bot.db"),
+        options={"journal-mode": "wal", "synchronous": "normal",
+        "read-connections": str(read_connections)})
+    server_id = database.servers.add("server", "localhost", 6667, None,
+        False, None, "bitbot")
+    database.execute_many("INSERT INTO users (server_id, nickname) "
+        "VALUES (?, ?)", [[server_id, "user%d" % i]
+        for i in range(args.users)])
+    database.user_settings.set_many(
+        [(i+1, "karma", i) for i in range(args.users)]+
+        [(i+1, "location", {"lat": i, "lon": i}) for i in range(args.users)])
+    database.set_group_commit(0.1)
+
+    # functions for the main thread to call, like bot.trigger()
+    triggers = queue.Queue() # type: queue.Queue
+    def trigger(func):
+        result = queue.Queue(1) # type: queue.Queue
+        triggers.put((func, result))
+        return result.get()
+    def run_triggers(block: bool=False):
+        while True:
+            try:
+                func, result = triggers.get(block, 0.01)
+            except queue.Empty:
+                return
+            result.put(func())
+
+    stop = threading.Event()
+    reads = []
+    def reader(seed: int):
+        random_ = random.Random(seed)
+        n = 0
+        while not stop.is_set():
+            user_id = random_.randint(1, args.users)
+            read = lambda: database.user_settings.get_many(
+                [(user_id, "karma"), (user_id, "location")])
+            if read_connections:
+                read()
+            else:
+                trigger(read)
+            n += 1
+        reads.append(n)
+
+    threads = [threading.Thread(target=reader, args=(i,))
+        for i in range(args.threads)]
+    for thread in threads:
+        thread.start()
+
+    lines = 0
+    random_ = random.Random(0)
+    end = time.monotonic()+args.seconds
+    while time.monotonic() < end:
+        run_triggers()
+        # one IRC line from one of a channel's users
+        user_id = random_.randint(1, 300)
+        database.user_settings.get(user_id, "karma")
+        database.user_settings.get(user_id, "ignore")
+        database.channel_settings.get(1, "command-prefix")
+        database.user_settings.set(user_id, "last-seen", time.time())
+        if database.next() == 0:
+            database.call()
+        lines += 1
+
+    stop.set()
+    while any(thread.is_alive() for thread in threads):
+        run_triggers(True)
+    database.commit()
+    return "main thread %.0f lines/s, %d threads %.0f reads/s" % (
+        lines/args.seconds, args.threads, sum(reads)/args.seconds)
+
+print("bounced through the main thread: %s" % run(0))
+print("read pool of %d connections:      %s" % (
+    Database.READ_CONNECTIONS, run(Database.READ_CONNECTIONS)))
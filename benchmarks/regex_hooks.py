@@ -0,0 +1,112 @@
+# Benchmarks matching channel messages against every command.regex hook that
+# modules/ registers, the way commands' channel_message() does, with and
+# without regex_filter's literal prefilter. Both are first checked to match
+# the same hooks for every message. Modules that can't be imported (missing
+# optional dependencies) are skipped. Messages are generated chat lines
+# unless a file of messages, one per line (e.g. a channel log), is given
+# usage: $ python3 benchmarks/regex_hooks.py [messages.txt]
+
+import glob, importlib, inspect, os, random, re, sys, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import src.utils.consts
+from src import EventManager, utils
+from src.core_modules.commands import regex_filter
+
+class Log(object):
+    def tracing(self, *args):
+        return False
+
+events = EventManager.EventRoot(Log()).wrap()
+directory = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+modules = []
+for path in sorted(glob.glob(os.path.join(directory, "modules", "*"))):
+    name = os.path.basename(path)
+    if name.endswith(".py"):
+        name = name[:-3]
+    elif not os.path.isfile(os.path.join(path, "__init__.py")):
+        continue
+
+    try:
+        module = importlib.import_module("modules.%s" % name)
+    except Exception as e:
+        print("skipping %s: %s" % (name, e))
+        continue
+    module_class = getattr(module, "Module", None)
+    if module_class == None:
+        continue
+
+    context = events.new_context(name)
+    for _, function in inspect.getmembers(module_class, inspect.isfunction):
+        if utils.decorators.has_magic(function):
+            magic = utils.decorators.get_magic(function)
+            for hook, kwargs in magic.get_hooks():
+                if hook == "command.regex":
+                    context.on(hook)._hook(function, kwargs=kwargs)
+                    modules.append(name)
+
+hooks = events.on("command.regex").get_hooks()
+print("%d command.regex hooks from %s" % (len(hooks),
+    ", ".join(sorted(set(modules)))))
+
+if len(sys.argv) > 1:
+    with open(sys.argv[1], encoding="utf8", errors="replace") as messages:
+        corpus = [line.rstrip("\r\n") for line in messages if line.strip()]
+else:
+    random.seed(0)
+    WORDS = ("the a to is it that and of you i this for on with but just like "
+        "what so have not was be do are lol yeah ok think there").split()
+    def message() -> str:
+        words = " ".join(random.choice(WORDS)
+            for _ in range(random.randint(3, 14)))
+        r = random.random()
+        if r < 0.04:
+            return "%s https://example.com/page?x=%d" % (words,
+                random.randint(0, 999))
+        elif r < 0.05:
+            return "%s https://www.youtube.com/watch?v=dQw4w9WgXcQ" % words
+        elif r < 0.06:
+            return "s/%s/%s/" % (random.choice(WORDS), random.choice(WORDS))
+        elif r < 0.07:
+            return "%s++" % random.choice(WORDS)
+        elif r < 0.08:
+            return "%s fixed in #%d" % (words, random.randint(1, 999))
+        elif r < 0.09:
+            return "%s héhé ünïcode 中文" % words
+        return words
+    corpus = [message() for _ in range(20000)]
+
+def before(message: str) -> int:
+    # channel_message() before the prefilter, for a non-action message
+    matched = 0
+    for hook in hooks:
+        pattern = hook.get_kwarg("pattern", None)
+        if pattern and re.search(pattern, message):
+            matched += 1
+    return matched
+
+regex_hooks = regex_filter.RegexFilter(hooks)
+def after(message: str) -> int:
+    matched = 0
+    for regex_hook in regex_hooks.candidates(message):
+        if regex_hook.pattern.search(message):
+            matched += 1
+    return matched
+
+for message in corpus:
+    if not before(message) == after(message):
+        raise AssertionError("prefilter differs for %r" % message)
+print("%d messages matched the same hooks" % len(corpus))
+
+ROUNDS = 3
+for label, match in [("before", before), ("after", after)]:
+    best = None
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        for message in corpus:
+            match(message)
+        took = time.perf_counter()-start
+        best = took if best == None else min(best, took)
+    print("%-6s %.2fus/message" % (label, best*1000000/len(corpus)))
+searched = sum(len(regex_hooks.candidates(m)) for m in corpus)
+print("%.2f of %d hooks searched per message" % (searched/len(corpus),
+    len(hooks)))
@@ -0,0 +1,141 @@
+# Seeds a database with 1M user settings (plus bot, server, channel and
+# user-channel settings), checks with EXPLAIN QUERY PLAN that each settings
+# lookup uses an index MIGRATIONS made for it, then times prefix lookups
+# against the LIKE queries they replaced. Exits non-zero if a lookup doesn't
+# use its index
+# usage: $ python3 benchmarks/settings_indexes.py [--users 10000]
+
+import argparse, os, sys, tempfile, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import src.utils.consts
+from src import Database, Logging
+
+parser = argparse.ArgumentParser(
+    description="Check and time settings lookups on a big database")
+parser.add_argument("--users", "-u", type=int, default=10000,
+    help="How many users to seed, with 100 settings each")
+parser.add_argument("--database", "-d",
+    help="Seed this sqlite3 file instead of a temporary one")
+args = parser.parse_args()
+
+USERS = args.users
+CHANNELS = 100
+TABLES = ["bot_settings", "server_settings", "channel_settings",
+    "user_settings", "user_channel_settings"]
+
+directory = tempfile.TemporaryDirectory()
+path = args.database or os.path.join(directory.name, "bot.db")
+log = Logging.Log(False, "warn", directory.name, [])
+database = Database.Database(log, "sqlite3:%s" % path,
+    settings_cache_size=0)
+if database.execute_fetchone("SELECT COUNT(*) FROM users")[0]:
+    sys.stderr.write("%s already has users\n" % path)
+    sys.exit(1)
+
+start = time.perf_counter()
+server_id = database.servers.add("server", "localhost", 6667, None, False,
+    None, "bitbot")
+database.execute_many("INSERT INTO users (server_id, nickname) VALUES (?, ?)",
+    [[server_id, "user%d" % i] for i in range(USERS)])
+database.execute_many("INSERT INTO channels (server_id, name) VALUES (?, ?)",
+    [[server_id, "#channel%d" % i] for i in range(CHANNELS)])
+
+rows = []
+for user_id in range(1, USERS+1):
+    rows.extend((user_id, "setting-%02d" % i, i) for i in range(94))
+    rows.extend((user_id, "timer-%d" % i, {"due": i}) for i in range(5))
+    rows.append((user_id, "karma", user_id))
+database.user_settings.set_many(rows)
+database.user_channel_settings.set_many([(user_id, 1+user_id%CHANNELS,
+    "seen-%d" % i, i) for user_id in range(1, USERS+1) for i in range(5)])
+database.channel_settings.set_many([(channel_id, "setting-%02d" % i, i)
+    for channel_id in range(1, CHANNELS+1) for i in range(50)])
+database.server_settings.set_many([(server_id, "setting-%02d" % i, i)
+    for i in range(50)])
+database.bot_settings.set_many([("setting-%d" % i, i) for i in range(100000)]
+    +[("api-key-%d" % i, {"key": i}) for i in range(20)])
+print("seeded %d settings in %.1fs" % (
+    sum(database.execute_fetchone("SELECT COUNT(*) FROM %s" % table)[0]
+    for table in TABLES), time.perf_counter()-start))
+
+# the query each lookup runs, captured so the plan checked is the real one
+queries = []
+execute_fetchall = database.execute_fetchall
+def capture(query, params=[]):
+    queries.append((query, params))
+    return execute_fetchall(query, params)
+database.execute_fetchall = capture # type: ignore
+
+LOOKUPS = [
+    ("bot find_prefix", "bot_settings_covering",
+        lambda i: database.bot_settings.find_prefix("api-key-")),
+    ("server find_prefix", "server_settings_covering",
+        lambda i: database.server_settings.find_prefix(server_id,
+        "setting-1")),
+    ("channel find_prefix", "channel_settings_covering",
+        lambda i: database.channel_settings.find_prefix(1+i%CHANNELS,
+        "setting-1")),
+    ("user find_prefix", "user_settings_covering",
+        lambda i: database.user_settings.find_prefix(1+(i*37)%USERS,
+        "timer-")),
+    ("user-channel find_prefix", "user_channel_settings_covering",
+        lambda i: database.user_channel_settings.find_prefix(1+(i*37)%USERS,
+        1+((i*37)%USERS+1)%CHANNELS, "seen-")),
+    ("channel find_by_setting", "channel_settings_by_setting",
+        lambda i: database.channel_settings.find_by_setting("setting-07")),
+    ("user find_all_by_setting", "user_settings_by_setting",
+        lambda i: database.user_settings.find_all_by_setting(server_id,
+        "karma")),
+    # either index narrows this to one user's few rows
+    ("user-channel find_by_setting", "user_channel_settings_covering "
+        "user_channel_settings_by_setting",
+        lambda i: database.user_channel_settings.find_by_setting(
+        1+(i*37)%USERS, "seen-1")),
+    ("user-channel find_all_by_setting", "user_channel_settings_by_setting",
+        lambda i: database.user_channel_settings.find_all_by_setting(
+        server_id, "seen-1"))
+]
+
+failed = False
+for name, indexes, lookup in LOOKUPS:
+    queries.clear()
+    lookup(0)
+    query, params = queries[-1]
+    plan = " | ".join(row[-1] for row in execute_fetchall(
+        "EXPLAIN QUERY PLAN %s" % query, params))
+    uses = any(("INDEX %s " % index) in ("%s " % plan)
+        for index in indexes.split())
+    failed = failed or not uses
+    print("%-5s %-33s %s" % ("ok" if uses else "FAIL", name, plan))
+database.execute_fetchall = execute_fetchall # type: ignore
+
+def timed(lookup, calls: int) -> float:
+    start = time.perf_counter()
+    for i in range(calls):
+        lookup(i)
+    return (time.perf_counter()-start)*1000/calls
+
+# find_prefix() before it was a range scan
+def like(table: str, columns: list, ids: list, prefix: str):
+    where = "".join("%s=? AND " % column for column in columns)
+    return execute_fetchall("SELECT setting, value FROM %s WHERE %s"
+        "setting LIKE ?" % (table, where), ids+["%s%%" % prefix])
+
+for name, calls, before, after in [
+        ("bot find_prefix", 50,
+            lambda i: like("bot_settings", [], [], "api-key-"),
+            lambda i: database.bot_settings.find_prefix("api-key-")),
+        ("user find_prefix", 2000,
+            lambda i: like("user_settings", ["user_id"],
+                [1+(i*37)%USERS], "timer-"),
+            lambda i: database.user_settings.find_prefix(1+(i*37)%USERS,
+                "timer-"))]:
+    print("%-20s LIKE %.3fms/call, range %.3fms/call" % (name,
+        timed(before, calls), timed(after, calls)))
+print("user find_all_by_setting %.3fms/call" % timed(
+    lambda i: database.user_settings.find_all_by_setting(server_id, "karma"),
+    20))
+
+database.commit()
+print("database is %.0fMB" % (os.path.getsize(path)/1000000))
+sys.exit(1 if failed else 0)
@@ -0,0 +1,115 @@
+# Replays the settings reads and writes from a captured trace log against each
+# settings storage engine (see *-settings-storage in docs/bot.conf.example),
+# with and without group commit. The settings cache is disabled so every read
+# reaches the storage engine.
+# To capture a trace, enable TRACE in [log] levels, run
+# `bitbotctl log -l trace` and `bitbotctl trace-filter _settings`, then use
+# the data directory's logs/trace.log. benchmarks/traces/settings.log.gz is a
+# capture of a bot answering commands in a busy channel
+# usage: $ python3 benchmarks/settings_storage.py [trace.log[.gz]] [--rounds 5]
+
+import argparse, ast, gzip, json, os, re, sys, tempfile, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import src.utils.consts
+from src import Database, Logging
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+parser = argparse.ArgumentParser(
+    description="Replay a settings trace against each storage engine")
+parser.add_argument("trace", nargs="?",
+    default=os.path.join(HERE, "traces", "settings.log.gz"))
+parser.add_argument("--rounds", "-r", type=int, default=5,
+    help="How many times to replay the trace")
+parser.add_argument("--synchronous", "-s", default="normal",
+    help="[database] synchronous to replay with")
+args = parser.parse_args()
+
+QUERY = re.compile(r'executed query in [0-9.]+ms: "(.*)" \(params: (.*)\)$')
+TABLE = re.compile(r"\b(%s)\b" % "|".join(Database.SETTINGS_TABLES))
+
+ID_COLUMNS = {
+    "bot_settings": 0, "server_settings": 1, "channel_settings": 1,
+    "user_settings": 1, "user_channel_settings": 2
+}
+
+# (op, table, ids, setting, value)
+ops = []
+opener = gzip.open if args.trace.endswith(".gz") else open
+with opener(args.trace, "rt", encoding="utf8") as trace:
+    for line in trace:
+        match = QUERY.search(line.rstrip("\n"))
+        if not match:
+            continue
+        query, params = match.group(1), ast.literal_eval(match.group(2))
+        table = TABLE.search(query)
+        if not table or not isinstance(params, list):
+            continue
+        table = table.group(1)
+        n = ID_COLUMNS[table]
+        ids, rest = tuple(params[:n]), params[n:]
+        if query.startswith("SELECT value"):
+            ops.append(("get", table, ids, rest[0], None))
+        elif query.startswith("INSERT OR REPLACE"):
+            ops.append(("set", table, ids, rest[0], json.loads(rest[1])))
+        elif query.startswith("DELETE") and len(rest) == 1:
+            ops.append(("delete", table, ids, rest[0], None))
+if not ops:
+    sys.stderr.write("No settings queries found in %s\n" % args.trace)
+    sys.exit(1)
+
+counts = dict((op, sum(1 for o in ops if o[0] == op))
+    for op in ["get", "set", "delete"])
+print("replaying %d settings queries (%s) %d times, synchronous = %s" % (
+    len(ops), ", ".join("%d %s" % (c, op) for op, c in counts.items()),
+    args.rounds, args.synchronous))
+
+# owners that have to exist for the database's foreign keys
+max_user = max([o[2][0] for o in ops if o[1] in ["user_settings",
+    "user_channel_settings"]] or [0])
+max_channel = max([o[2][0] for o in ops if o[1] == "channel_settings"] +
+    [o[2][1] for o in ops if o[1] == "user_channel_settings"] or [0])
+max_server = max([o[2][0] for o in ops if o[1] == "server_settings"] or [1])
+
+def replay(storage: str, group_commit: bool) -> float:
+    with tempfile.TemporaryDirectory() as directory:
+        options = {"journal-mode": "wal", "synchronous": args.synchronous}
+        if not storage == "sqlite3":
+            for table in Database.SETTINGS_TABLES:
+                options["%s-storage" % table.replace("_", "-")] = storage
+        log = Logging.Log(False, "warn", directory, [])
+        database = Database.Database(log, "sqlite3:%s/bot.db" % directory,
+            settings_cache_size=0, options=options)
+        for i in range(max_server):
+            database.servers.add("server%d" % i, "localhost", 6667, None,
+                False, None, "bitbot")
+        database.execute_many("INSERT INTO users (server_id, nickname) "
+            "VALUES (1, ?)", [["user%d" % i] for i in range(max_user)])
+        database.execute_many("INSERT INTO channels (server_id, name) "
+            "VALUES (1, ?)", [["#channel%d" % i] for i in range(max_channel)])
+        if group_commit:
+            database.set_group_commit(0)
+
+        tables = dict((table, getattr(database, table))
+            for table in Database.SETTINGS_TABLES)
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            for i, (op, table, ids, setting, value) in enumerate(ops):
+                if op == "get":
+                    tables[table].get(*ids, setting)
+                elif op == "set":
+                    tables[table].set(*ids, setting, value)
+                else:
+                    tables[table].delete(*ids, setting)
+                # a group commit at the end of every "event loop iteration"
+                if group_commit and i % 10 == 9:
+                    database.commit()
+        database.commit()
+        return time.perf_counter()-start
+
+total = len(ops)*args.rounds
+for group_commit in [False, True]:
+    for storage in Database.KEY_VALUE_ENGINES.keys():
+        took = replay(storage, group_commit)
+        print("%-7s %-12s %8.0f queries/s (%.1fus each)" % (storage,
+            "group-commit" if group_commit else "per-write", total/took,
+            took*1000000/total))
@@ -0,0 +1,95 @@
+# Benchmarks Timers and the Scheduler heap under them: adding timers,
+# redoing and cancelling some, and firing the rest once due. First checks
+# that timers which are cancelled, redone after removal or cancelled by
+# another timer's callback in the same Scheduler.call() are dropped (from
+# Timers and from the database, for persistent ones) and never fire
+# usage: $ python3 benchmarks/timers.py [--timers 10000]
+
+import argparse, os, sys, tempfile, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import src.utils.consts
+from src import Database, EventManager, Logging, Scheduler, Timers
+
+parser = argparse.ArgumentParser(description="Check and time Timers")
+parser.add_argument("--timers", "-t", type=int, default=10000,
+    help="How many timers to time")
+args = parser.parse_args()
+
+directory = tempfile.TemporaryDirectory()
+log = Logging.Log(False, "warn", directory.name, [])
+database = Database.Database(log,
+    "sqlite3:%s" % os.path.join(directory.name, "bot.db"))
+events = EventManager.EventRoot(log).wrap()
+
+def new_timers():
+    scheduler = Scheduler.Scheduler()
+    return scheduler, Timers.Timers(database, events, log, scheduler)
+def call_due(scheduler: Scheduler.Scheduler, wait: float=0.02):
+    time.sleep(wait)
+    scheduler.call()
+def check(description: str, condition: bool):
+    if not condition:
+        raise AssertionError(description)
+
+fired = []
+# a timer redone after it's been cancelled stays cancelled
+scheduler, timers = new_timers()
+timer = timers.add("redo", lambda timer: fired.append("redo"), 0.01)
+timer.cancel()
+timer.redo()
+# ...and after its context's been purged
+context = timers.new_context("module")
+timer = context.add("purged", lambda timer: fired.append("purged"), 0.01)
+timers.purge_context("module")
+timer.redo()
+call_due(scheduler)
+check("removed timers fired", not fired)
+check("removed timers are kept", not timers.get_timers())
+check("removed timers are scheduled", len(scheduler) == 0)
+
+# a timer cancelling another that's due in the same Scheduler.call()
+scheduler, timers = new_timers()
+cancelled = timers.add_persistent("cancelled", 0.05)
+events.on("timer.cancelled").hook(lambda event: fired.append("cancelled"))
+# well before the other, as persisting it can take a few milliseconds
+first = timers.add("first", lambda timer: cancelled.cancel(), 0.01)
+call_due(scheduler, 0.1)
+check("cancelled timer fired", not fired)
+check("cancelled timer is kept", not timers.get_timers())
+check("cancelled timer is still persisted", database.bot_settings.get(
+    "timer-%s" % cancelled.id, None) == None)
+
+# a timer redoing itself from its callback fires again
+scheduler, timers = new_timers()
+repeat = timers.add("repeat",
+    lambda timer: (fired.append("repeat"), timer.redo()), 0.01)
+call_due(scheduler)
+call_due(scheduler)
+repeat.cancel()
+check("redone timer didn't fire again", fired == ["repeat", "repeat"])
+check("cancelled redone timer is kept", not timers.get_timers())
+print("timers checked")
+
+scheduler, timers = new_timers()
+start = time.perf_counter()
+added = [timers.add("timer", lambda timer: None, 0.05+(i%100)/10000)
+    for i in range(args.timers)]
+adding = time.perf_counter()-start
+
+start = time.perf_counter()
+for i, timer in enumerate(added):
+    if i % 4 == 0:
+        timer.cancel()
+    elif i % 4 == 1:
+        timer.redo()
+changing = time.perf_counter()-start
+
+time.sleep(0.1)
+start = time.perf_counter()
+scheduler.call()
+firing = time.perf_counter()-start
+check("timers left", not timers.get_timers() and len(scheduler) == 0)
+
+print("%d timers: add %.1fus, redo/cancel %.1fus, fire %.1fus each" % (
+    args.timers, adding*1000000/args.timers,
+    changing*1000000/(args.timers//2), firing*1000000/(args.timers*3//4)))
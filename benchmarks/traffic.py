@@ -0,0 +1,152 @@
+# Runs bitbotd against a minimal local IRC server that has a channel of users
+# send it commands, then reports how fast they were answered and how many
+# database queries each one took (counted from TRACE logging, after startup).
+# Config keys can be given to compare, e.g. `--bot settings-cache-size=0`
+# against the default settings cache. TRACE logging slows the bot down, so
+# compare runs with each other rather than with a production bot
+# usage: $ python3 benchmarks/traffic.py [--messages 1000] [--bot key=value]
+
+import argparse, os, socket, subprocess, sys, tempfile, threading, time, typing
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import src.utils.consts
+from src import Database, Logging
+
+DIRECTORY = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+CHANNEL = "#bench"
+
+parser = argparse.ArgumentParser(
+    description="Measure bitbotd answering commands from a busy channel")
+parser.add_argument("--messages", "-m", type=int, default=1000,
+    help="How many commands to send")
+parser.add_argument("--users", "-u", type=int, default=300,
+    help="How many users to send them from")
+parser.add_argument("--modules", default="echo,ping,stats,message_filter,"
+    "tell,command_suggestions", help="Modules to load, comma separated")
+parser.add_argument("--bot", "-b", action="append", default=[],
+    help="A key=value to add to bot.conf's [bot] section")
+parser.add_argument("--database", "-d", action="append", default=[],
+    help="A key=value to add to bot.conf's [database] section")
+parser.add_argument("--timeout", "-t", type=float, default=120,
+    help="Seconds to wait for the bot to answer")
+args = parser.parse_args()
+
+class Server(object):
+    # just enough of an IRC server to register a client, put it in a channel
+    # and count what it says there
+    def __init__(self):
+        self._listen = socket.socket()
+        self._listen.bind(("127.0.0.1", 0))
+        self._listen.listen(1)
+        self.port = self._listen.getsockname()[1]
+        self.joined = threading.Event()
+        self.replies = 0
+        self.last_reply = 0.0
+        self._client = None # type: typing.Optional[socket.socket]
+
+    def send(self, line: str):
+        self._client.sendall(("%s\r\n" % line).encode("utf8"))
+
+    def run(self):
+        self._client, _ = self._listen.accept()
+        nickname = None
+        for line in self._client.makefile("rb"):
+            line = line.decode("utf8").rstrip("\r\n")
+            command, _, rest = line.partition(" ")
+            if command.startswith("@"):
+                command, _, rest = rest.partition(" ")
+
+            if command == "NICK" and nickname == None:
+                nickname = rest.lstrip(":")
+                self.send(":server 001 %s :Welcome" % nickname)
+                self.send(":server 005 %s CASEMAPPING=rfc1459 CHANTYPES=# "
+                    "PREFIX=(ov)@+ :are supported" % nickname)
+                self.send(":server 376 %s :End of MOTD" % nickname)
+                self.send(":%s!bitbot@host JOIN %s" % (nickname, CHANNEL))
+                self.send(":server 353 %s = %s :@%s %s" % (nickname, CHANNEL,
+                    nickname, " ".join("user%d" % i
+                    for i in range(args.users))))
+                self.send(":server 366 %s %s :End of /NAMES" % (nickname,
+                    CHANNEL))
+                self.joined.set()
+            elif command == "PING":
+                self.send(":server PONG server %s" % rest)
+            elif command == "PRIVMSG" and rest.startswith(CHANNEL+" "):
+                self.replies += 1
+                self.last_reply = time.monotonic()
+
+def wait(condition, timeout: float) -> bool:
+    deadline = time.monotonic()+timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+server = Server()
+threading.Thread(target=server.run, daemon=True).start()
+
+data = tempfile.TemporaryDirectory()
+with open(os.path.join(data.name, "bot.conf"), "w") as config:
+    config.write("[bot]\ndata-directory = %s\n" % data.name)
+    config.write("".join("%s = %s\n" % tuple(kv.split("=", 1))
+        for kv in args.bot))
+    config.write("[database]\n")
+    config.write("".join("%s = %s\n" % tuple(kv.split("=", 1))
+        for kv in args.database))
+with open(os.path.join(data.name, "modules.conf"), "w") as config:
+    config.write("[modules]\nwhitelist = %s\n" % args.modules)
+os.mkdir(os.path.join(data.name, "logs"))
+log = Logging.Log(False, "warn", os.path.join(data.name, "logs"), [])
+database = Database.Database(log, "sqlite3:%s/bot.db" % data.name)
+server_id = database.servers.add("bench", "127.0.0.1", server.port, None,
+    False, None, "bitbot")
+# measure the bot, not its flood protection
+database.server_settings.set(server_id, "throttle", [1000000, 1])
+del database
+
+queries = 0
+def read_log(stdout):
+    global queries
+    for line in stdout:
+        if "executed query" in line:
+            queries += 1
+
+environment = dict(os.environ, PYTHONUNBUFFERED="1")
+bot = subprocess.Popen([sys.executable, os.path.join(DIRECTORY, "bitbotd"),
+    "-c", os.path.join(data.name, "bot.conf"), "-L", "trace", "-N"],
+    stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+    universal_newlines=True, env=environment)
+threading.Thread(target=read_log, args=(bot.stdout,), daemon=True).start()
+
+try:
+    if not server.joined.wait(args.timeout):
+        raise Exception("bot didn't connect")
+    # let startup's queries (e.g. loading the channel) finish
+    last = -1
+    while not last == queries:
+        last = queries
+        time.sleep(0.5)
+
+    start_queries = queries
+    start = time.monotonic()
+    for i in range(args.messages):
+        if i % 10 == 9:
+            message = "!ping"
+        else:
+            message = "!echo hello %d" % i
+        server.send(":user%d!user@host%d PRIVMSG %s :%s" % (i%args.users,
+            i%args.users, CHANNEL, message))
+    answered = wait(lambda: server.replies >= args.messages, args.timeout)
+    took = server.last_reply-start
+    time.sleep(0.5)
+    message_queries = queries-start_queries
+finally:
+    bot.terminate()
+    bot.wait()
+
+print("%d/%d commands answered in %.2fs (%.0f/s)" % (server.replies,
+    args.messages, took, server.replies/took))
+print("%d database queries, %.2f per command" % (message_queries,
+    message_queries/args.messages))
+if not answered:
+    sys.exit(1)
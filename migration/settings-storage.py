@@ -0,0 +1,76 @@
+# Used to move a family of settings between storage engines, e.g. from the
+# database's user_settings table to a log file. Run it with the bot stopped,
+# then set the family's *-settings-storage in bot.conf to the new engine
+# usage: $ python3 migration/settings-storage.py ~/.bitbot/bot.conf user-settings log
+
+import argparse, atexit, os, sys, time
+parser = argparse.ArgumentParser(
+    description="Move settings between storage engines")
+parser.add_argument("config", help="Location of bot.conf")
+parser.add_argument("family", help="e.g. user-settings")
+parser.add_argument("storage", help="Storage engine to move settings to")
+args = parser.parse_args()
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import src.utils.consts
+from src import Config, Database, DatabaseEngines, LockFile, Logging
+
+table = args.family.replace("-", "_")
+if not table in Database.SETTINGS_TABLES:
+    sys.stderr.write("Unknown settings family '%s'\n" % args.family)
+    sys.exit(1)
+if not args.storage in DatabaseEngines.KEY_VALUE_ENGINES:
+    sys.stderr.write("Unknown storage engine '%s'\n" % args.storage)
+    sys.exit(1)
+
+config = Config.Config("bot", args.config)
+config.load()
+database_config = Config.Config("database", args.config)
+database_config.load()
+
+def _expand(s: str, data: str=""):
+    return os.path.expanduser(s).format(DATA=data)
+data_directory = _expand(config.get("data-directory", "~/.bitbot"))
+database_location = _expand(config.get("database", "sqlite3:{DATA}/bot.db"),
+    data_directory)
+lock_file = LockFile.LockFile(_expand(config.get("lock-file",
+    "{DATA}/bot.lock"), data_directory))
+if not lock_file.available():
+    sys.stderr.write("Database is locked. Is BitBot running?\n")
+    sys.exit(1)
+atexit.register(lock_file.unlock)
+lock_file.lock()
+
+log = Logging.Log(False, "warn", "", [])
+key = "%s-storage" % args.family
+source_options = database_config.get_all()
+target_options = dict(source_options)
+target_options[key] = args.storage
+if source_options.get(key, "sqlite3") == args.storage:
+    sys.stderr.write("%s are already in '%s'\n" % (args.family,
+        args.storage))
+    sys.exit(1)
+
+source = getattr(Database.Database(log, database_location,
+    options=source_options), table)
+target_database = Database.Database(log, database_location,
+    options=target_options)
+target = getattr(target_database, table)
+
+rows = source.all()
+print("Moving %d %s from '%s' to '%s'" % (len(rows), args.family,
+    source_options.get(key, "sqlite3"), args.storage))
+target_database.set_group_commit(0)
+target.clear()
+# rows end with when they expire, None for settings that don't
+target.set_many([row[:-1] for row in rows if row[-1] == None])
+for row in rows:
+    if not row[-1] == None:
+        target.set_many([row[:-1]], ttl=row[-1]-time.time())
+target_database.set_group_commit(None)
+
+print()
+print("Migration successful! Set '%s = %s' in the [database] section of %s" %
+    (key, args.storage, args.config))
+print("The settings are still in '%s' too, until you remove them" %
+    source_options.get(key, "sqlite3"))
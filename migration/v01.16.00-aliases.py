@@ -23,7 +23,8 @@ for server_id, value in results:
     for alias, command in aliases.items():
         print("[%s] Migrating '%s' ('%s')" %
             (servers[server_id], alias, command))
-        cursor.execute("INSERT INTO server_settings VALUES (?, ?, ?)",
+        cursor.execute("""INSERT INTO server_settings
+            (server_id, setting, value) VALUES (?, ?, ?)""",
             [server_id, "command-alias-%s" % alias, json.dumps(command)])
 database.commit()
 database.close()
@@ -35,7 +35,8 @@ for server_id, setting, karma in results:
     print("[%s] Migrating '%s' (%s)" %
         (servers[server_id], setting.replace("karma-", "", 1), karma))
     cursor.execute(
-        "INSERT INTO user_settings VALUES (?, ?, ?)",
+        """INSERT INTO user_settings (user_id, setting, value)
+        VALUES (?, ?, ?)""",
         [server_users[server_id], setting, karma])
 
 database.commit()
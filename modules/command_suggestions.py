@@ -9,7 +9,7 @@ SETTING = utils.BoolSetting("command-suggestions",
 @utils.export("channelset", SETTING)
 class Module(ModuleManager.BaseModule):
     def _all_command_hooks(self):
-        return self.events.on("received.command").get_children()
+        return list(self.exports.get("all-commands")().keys())
 
     @utils.hook("unknown.command")
     def unknown_command(self, event):
@@ -83,12 +83,18 @@ class Handler(http.server.BaseHTTPRequestHandler):
             _module._url_for(route, endpoint, args, get_params,
             headers.get("Host", None)))
 
-    def _handle(self, method, path, endpoint, args):
+    def _settings(self, params):
+        return self._key_settings(params.get("key", None)
+            ), self._minify_setting()
+
+    def _handle(self, method, path, endpoint, args, params, data, settings):
         headers = utils.CaseInsensitiveDict(dict(self.headers.items()))
-        params = self._url_params()
-        data = self._body()
 
-        response = Response(compact=self._minify_setting())
+        if settings == None:
+            settings = self._settings(params)
+        key_setting, minify = settings
+
+        response = Response(compact=minify)
         response.code = 404
 
         hooks = _events.on("api").on(method).on(endpoint).get_hooks()
@@ -97,7 +103,6 @@ class Handler(http.server.BaseHTTPRequestHandler):
             hook = hooks[0]
             authenticated = hook.get_kwarg("authenticated", True)
             key = params.get("key", None)
-            key_setting = self._key_settings(key)
             permissions = key_setting.get("permissions", [])
 
             if key_setting:
@@ -129,8 +134,16 @@ class Handler(http.server.BaseHTTPRequestHandler):
         _log.debug("[HTTP] starting _handle for %s from %s:%d: %s",
             [method, self.client_address[0], self.client_address[1], path])
 
+        params = self._url_params()
+        data = self._body()
+        settings = None
+        if _bot.database.can_read():
+            # read these here, through the database's read pool, rather than
+            # making the main thread do it
+            settings = self._settings(params)
+
         response = _bot.trigger(lambda: self._handle(method, path, endpoint,
-            args))
+            args, params, data, settings))
         self._respond(response)
 
         _log.debug("[HTTP] finishing _handle for %s from %s:%d (%d)",
@@ -1,11 +1,46 @@
 #--depends-on commands
 
-import time
-from src import ModuleManager, utils
+import time, typing
+from src import IRCLine, ModuleManager, utils
 
 HIDDEN_MODES = set(["s", "p"])
 
+# internal stats served at api.get.<name> and by `bitbotctl command <name>`:
+# (name, a function from the bot to a dict of stats or None when disabled,
+# what to say when the dict is empty)
+INTERNALS = [
+    ("event-queue", lambda bot: bot.event_queue_stats(), None),
+    ("hostmask-cache", lambda bot: IRCLine.HOSTMASKS.stats(), None),
+    ("settings-cache", lambda bot: bot.database.settings_cache.stats(), None),
+    ("database", lambda bot: bot.database.tuning(), None),
+    ("read-pool", lambda bot: bot.database.read_pool_stats(), None),
+    ("settings-storage", lambda bot: bot.database.storage_stats(),
+        "all settings are in the database"),
+    ("expiry", lambda bot: bot.database.expiry_stats(), None),
+    ("group-commit", lambda bot: bot.database.group_commit_stats(), None)
+]
+
+def _format_internals(stats: typing.Optional[dict],
+        empty: typing.Optional[str]) -> str:
+    if stats == None:
+        return "disabled"
+    elif not stats and empty:
+        return empty
+    elif any(isinstance(value, dict) for value in stats.values()):
+        # e.g. stats for each settings table
+        return "; ".join("%s: %s" % (key, _format_internals(value, None))
+            for key, value in stats.items())
+    return ", ".join("%s: %s" % (key, value) for key, value in stats.items())
+
 class Module(ModuleManager.BaseModule):
+    def on_load(self):
+        for name, get_stats, empty in INTERNALS:
+            self.events.on("api.get.%s" % name).hook(
+                lambda event, get_stats=get_stats: get_stats(self.bot))
+            self.events.on("control.%s" % name).hook(
+                lambda event, get_stats=get_stats, empty=empty:
+                _format_internals(get_stats(self.bot), empty))
+
     def _uptime(self):
         return utils.datetime.format.to_pretty_since(
             int(time.time()-self.bot.start_time))
@@ -1,11 +1,10 @@
 import hashlib, time, typing, uuid
-from src import PollHook
+from src import Scheduler
 
-class Cache(PollHook.PollHook):
-    def __init__(self):
-        self._items = {}
-
-        self._cached_expiration = None
+class Cache(object):
+    def __init__(self, scheduler: Scheduler.Scheduler):
+        self._items = {} # type: typing.Dict[str, typing.List[typing.Any]]
+        self._scheduler = scheduler
 
     def cache_key(self, key: str):
         return "sha1:%s" % hashlib.sha1(key.encode("utf8")).hexdigest()
@@ -18,35 +17,24 @@ class Cache(PollHook.PollHook):
     def _cache(self, key: str, value: typing.Any,
             expiration: typing.Optional[float]) -> str:
         id = self.cache_key(key)
-        self._cached_expiration = None
         self._items[id] = [key, value, expiration]
-        return id
-
-    def next(self) -> typing.Optional[float]:
-        if not self._cached_expiration == None:
-            return self._cached_expiration
-
-        expirations = [value[-1] for value in self._items.values()]
-        expirations = list(filter(None, expirations))
-        if not expirations:
-            return None
-        now = time.time()
-        expirations = [e-now for e in expirations]
 
-        expiration = max(min(expirations), 0)
-        self._cached_expiration = expiration
-        return expiration
+        if expiration:
+            self._scheduler.schedule((self, id), expiration-time.time(),
+                lambda: self._expire(id))
+        else:
+            self._scheduler.unschedule((self, id))
+        return id
 
-    def call(self):
-        now = time.time()
-        expired = []
-        for id in self._items.keys():
+    def _expire(self, id: str):
+        if id in self._items:
             key, value, expiration = self._items[id]
-            if expiration and expiration <= now:
-                expired.append(id)
-        for id in expired:
-            self._cached_expiration = None
-            del self._items[id]
+            if expiration and expiration <= time.time():
+                del self._items[id]
+            elif expiration:
+                # wall clock went backwards, try again later
+                self._scheduler.schedule((self, id), expiration-time.time(),
+                    lambda: self._expire(id))
 
     def has_item(self, key: typing.Any) -> bool:
         return self.cache_key(key) in self._items
@@ -55,8 +43,9 @@ class Cache(PollHook.PollHook):
         key, value, expiration = self._items[self.cache_key(key)]
         return value
     def remove(self, key: str):
-        self._cached_expiration = None
-        del self._items[self.cache_key(key)]
+        id = self.cache_key(key)
+        del self._items[id]
+        self._scheduler.unschedule((self, id))
 
     def get_expiration(self, key: typing.Any) -> float:
         key, value, expiration = self._items[self.cache_key(key)]
@@ -16,9 +16,11 @@ class Config(object):
                 parser = self._parser()
                 parser.read_string(config_file.read())
                 self._config.clear()
-                for k, v in parser[self._name].items():
-                    if v:
-                        self._config[k] = v
+                # sections other than [bot] are optional
+                if self._name in parser:
+                    for k, v in parser[self._name].items():
+                        if v:
+                            self._config[k] = v
 
     def save(self):
         with utils.io.open(self.location, "w") as config_file:
@@ -37,6 +39,8 @@ class Config(object):
 
     def get(self, key: str, default: typing.Any=None) -> typing.Any:
         return self._config.get(key, default)
+    def get_all(self) -> typing.Dict[str, str]:
+        return self._config.copy()
 
     def get_list(self, key: str):
         if key in self and self[key]:
@@ -1,5 +1,7 @@
-import json, os, socket, typing
-from src import IRCBot, Logging, PollSource
+import json, os, re, socket, typing
+from src import EventManager, IRCBot, Logging, PollSource
+
+PROFILE_TOP_DEFAULT = 20
 
 class ControlClient(object):
     def __init__(self, sock: socket.socket):
@@ -8,6 +10,7 @@ class ControlClient(object):
         self._write_buffer = b""
         self.version = -1
         self.log_level = None # type: typing.Optional[int]
+        self.connected = True
 
     def fileno(self) -> int:
         return self._socket.fileno()
@@ -28,6 +31,7 @@ class ControlClient(object):
         self._socket.send(("%s\n" % line).encode("utf8"))
 
     def disconnect(self):
+        self.connected = False
         try:
             self._socket.shutdown(socket.SHUT_RDWR)
         except:
@@ -47,6 +51,11 @@ class Control(PollSource.PollSource):
         self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
         self._clients: typing.Dict[int, ControlClient] = {}
 
+    def _update_log_level(self):
+        levels = [client.log_level for client in self._clients.values() if
+            not client.log_level == None]
+        self._bot.log.set_hook_level(min(levels) if levels else None)
+
     def _on_log(self, levelno: int, line: str):
         for client in self._clients.values():
             if client.log_level is not None and client.log_level <= levelno:
@@ -70,11 +79,17 @@ class Control(PollSource.PollSource):
             client = self._clients[fileno]
             lines = client.read_lines()
             if lines is None:
-                client.disconnect()
-                del self._clients[fileno]
+                self._disconnect(fileno)
             else:
                 for line in lines:
                     response = self._parse_line(client, line)
+                    if not client.connected:
+                        self._disconnect(fileno)
+                        break
+
+    def _disconnect(self, fileno: int):
+        self._clients.pop(fileno).disconnect()
+        self._update_log_level()
 
     def _parse_line(self, client: ControlClient, line: str):
         id, _, command = line.partition(" ")
@@ -93,9 +108,28 @@ class Control(PollSource.PollSource):
             client.version = int(data)
         elif command == "log":
             client.log_level = Logging.LEVELS[data.lower()]
+            self._update_log_level()
+        elif command == "profile":
+            response_data = self._profile(data)
+            keepalive = False
+        elif command == "trace-filter":
+            try:
+                self._bot.log.set_trace_filter(data or None)
+            except re.error as e:
+                # the filter we already had is left as it was
+                response_data = "invalid trace filter: %s" % e
+            else:
+                response_data = "trace filter: %s" % (
+                    self._bot.log.get_trace_filter() or "(none)")
+            keepalive = False
         elif command == "rehash":
             self._bot.log.info("Reloading config file")
             self._bot.config.load()
+            self._bot._events.set_slow_hook_threshold(
+                self._bot.slow_hook_threshold())
+            self._bot.database.settings_cache.resize(
+                self._bot.settings_cache_size())
+            self._bot.database.set_group_commit(*self._bot.group_commit())
             self._bot.log.info("Reloaded config file")
             keepalive = False
         elif command == "reload":
@@ -116,6 +150,51 @@ class Control(PollSource.PollSource):
         if not keepalive:
             client.disconnect()
 
+    def _profile(self, data: str) -> str:
+        subcommand, _, data = data.partition(" ")
+        if subcommand == "reset":
+            self._bot._events.reset_hook_stats()
+            return "hook stats reset"
+        elif subcommand == "slow":
+            threshold = None # type: typing.Optional[float]
+            if data:
+                try:
+                    threshold = float(data)
+                except ValueError:
+                    return "invalid threshold"
+                if not threshold >= 0:
+                    return "invalid threshold"
+            self._bot._events.set_slow_hook_threshold(threshold)
+            return "slow hook threshold: %s" % (
+                "%sms" % threshold if not threshold == None else "(none)")
+
+        top = PROFILE_TOP_DEFAULT
+        if subcommand:
+            try:
+                top = int(subcommand)
+            except ValueError:
+                return "invalid number of hooks"
+            if top < 0:
+                return "invalid number of hooks"
+        stats = self._bot._events.hook_stats()
+        ordered = sorted(stats.items(), key=lambda item: item[1].total,
+            reverse=True)[:top]
+
+        bucket_names = ["<%sms" % b for b in EventManager.HISTOGRAM_BUCKETS]
+        bucket_names.append(">=%sms" % EventManager.HISTOGRAM_BUCKETS[-1])
+
+        lines = []
+        for (path, context), hook_stats in ordered:
+            module = None
+            if not context == None:
+                module = self._bot.modules.from_context(context)
+            histogram = " ".join("%s:%d" % (name, count) for name, count in
+                zip(bucket_names, hook_stats.histogram) if count)
+            lines.append("%s (%s): %d calls, %.2fms total, %.2fms max, %s" %
+                (path, module.name if module else (context or "-"),
+                hook_stats.count, hook_stats.total, hook_stats.max, histogram))
+        return "\n".join(lines) or "no hooks called"
+
     def _send_action(self, client: ControlClient, action: str,
             data: typing.Optional[str], id: typing.Optional[str]=None):
         try:
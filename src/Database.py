@@ -1,27 +1,617 @@
-import json, os, threading, time, typing, urllib.parse
-from src import Logging, utils
+import collections, contextlib, json, os, queue, re, threading, time, typing
+import urllib.parse
+from src import Logging, PollHook, utils
 
 from .DatabaseEngines import DatabaseEngine, DatabaseEngineCursor
 from .DatabaseEngines import SQLite3Engine
+from .DatabaseEngines import KeyValueEngine, KEY_VALUE_ENGINES, T_KV_VALUE
+
+# commit a group commit transaction early once it has this many writes
+GROUP_COMMIT_WRITES = 1000
+
+SETTINGS_CACHE_SIZE = 4*1024*1024
+# rough bytes for one cached setting on top of its name and value
+SETTINGS_CACHE_ENTRY_SIZE = 200
+
+# bulk reads look up at most this many query parameters at a time, well under
+# sqlite's default limit of 999
+BULK_CHUNK_VARIABLES = 900
+
+# schema changes, in order, for databases made before them. a database's
+# version is how many of these it has had applied
+MIGRATIONS = [
+    # indexes that only duplicated a primary key or unique constraint's own
+    # index, replaced with ones that cover settings lookups (so the value
+    # doesn't need fetching from the table) and ones for finding settings by
+    # name across every channel/user
+    [
+        "DROP INDEX IF EXISTS channels_index",
+        "DROP INDEX IF EXISTS users_index",
+        "DROP INDEX IF EXISTS bot_settings_index",
+        "DROP INDEX IF EXISTS server_settings_index",
+        "DROP INDEX IF EXISTS channel_settings_index",
+        "DROP INDEX IF EXISTS user_settings_index",
+        "DROP INDEX IF EXISTS user_channel_settings_index",
+        """CREATE INDEX bot_settings_covering
+            ON bot_settings (setting, value)""",
+        """CREATE INDEX server_settings_covering
+            ON server_settings (server_id, setting, value)""",
+        """CREATE INDEX channel_settings_covering
+            ON channel_settings (channel_id, setting, value)""",
+        """CREATE INDEX user_settings_covering
+            ON user_settings (user_id, setting, value)""",
+        """CREATE INDEX user_channel_settings_covering
+            ON user_channel_settings (user_id, channel_id, setting, value)""",
+        """CREATE INDEX channel_settings_by_setting
+            ON channel_settings (setting)""",
+        """CREATE INDEX user_settings_by_setting
+            ON user_settings (setting)""",
+        """CREATE INDEX user_channel_settings_by_setting
+            ON user_channel_settings (setting, user_id)"""
+    ],
+    # settings that are deleted once they've expired (a unix time), with
+    # the expiry added to covering indexes and indexed on its own for the
+    # settings that have one
+    [
+        "ALTER TABLE bot_settings ADD COLUMN expires_at REAL",
+        "ALTER TABLE server_settings ADD COLUMN expires_at REAL",
+        "ALTER TABLE channel_settings ADD COLUMN expires_at REAL",
+        "ALTER TABLE user_settings ADD COLUMN expires_at REAL",
+        "ALTER TABLE user_channel_settings ADD COLUMN expires_at REAL",
+        "DROP INDEX IF EXISTS bot_settings_covering",
+        "DROP INDEX IF EXISTS server_settings_covering",
+        "DROP INDEX IF EXISTS channel_settings_covering",
+        "DROP INDEX IF EXISTS user_settings_covering",
+        "DROP INDEX IF EXISTS user_channel_settings_covering",
+        """CREATE INDEX bot_settings_covering
+            ON bot_settings (setting, value, expires_at)""",
+        """CREATE INDEX server_settings_covering
+            ON server_settings (server_id, setting, value, expires_at)""",
+        """CREATE INDEX channel_settings_covering
+            ON channel_settings (channel_id, setting, value, expires_at)""",
+        """CREATE INDEX user_settings_covering
+            ON user_settings (user_id, setting, value, expires_at)""",
+        """CREATE INDEX user_channel_settings_covering
+            ON user_channel_settings (user_id, channel_id, setting, value,
+            expires_at)""",
+        """CREATE INDEX bot_settings_expiry ON bot_settings (expires_at)
+            WHERE expires_at IS NOT NULL""",
+        """CREATE INDEX server_settings_expiry ON server_settings (expires_at)
+            WHERE expires_at IS NOT NULL""",
+        """CREATE INDEX channel_settings_expiry
+            ON channel_settings (expires_at) WHERE expires_at IS NOT NULL""",
+        """CREATE INDEX user_settings_expiry ON user_settings (expires_at)
+            WHERE expires_at IS NOT NULL""",
+        """CREATE INDEX user_channel_settings_expiry
+            ON user_channel_settings (expires_at)
+            WHERE expires_at IS NOT NULL"""
+    ]
+] # type: typing.List[typing.List[str]]
+
+SETTINGS_TABLES = ["bot_settings", "server_settings", "channel_settings",
+    "user_settings", "user_channel_settings"]
+
+# read-only connections other threads can read through at once
+READ_CONNECTIONS = 4
+
+# seconds between deleting expired settings, and how many to delete from
+# each table at a time. when a table has more than that expired, the rest
+# are deleted over the next event loop iterations
+EXPIRY_INTERVAL = 60.0
+EXPIRY_BATCH = 500
+
+# setting values that can't be changed in place
+SCALAR_TYPES = (str, int, float, bool, type(None))
+
+# (table, owner ids)
+T_SETTINGS_OWNER = typing.Tuple[str, typing.Tuple[int, ...]]
+# (table, owner ids, setting)
+T_SETTINGS_KEY = typing.Tuple[str, typing.Tuple[int, ...], str]
+# (value, value is json, size, expires at)
+T_SETTINGS_ENTRY = typing.Tuple[typing.Any, bool, int,
+    typing.Optional[float]]
+
+class SettingsCache(object):
+    # get() result for settings that aren't cached
+    MISS = object()
+    # cached for settings that don't exist
+    ABSENT = object()
+
+    def __init__(self, max_size: int=SETTINGS_CACHE_SIZE):
+        self._max_size = max_size
+        self.size = 0
+        self._entries = collections.OrderedDict(
+            ) # type: typing.OrderedDict[T_SETTINGS_KEY, T_SETTINGS_ENTRY]
+        # cached settings for each owner, to invalidate them without a scan
+        self._owners = {} # type: typing.Dict[T_SETTINGS_OWNER, typing.Set[str]]
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, table: str, ids: typing.Tuple[int, ...], setting: str
+            ) -> typing.Any:
+        key = (table, ids, setting)
+        entry = self._entries.get(key, None)
+        if not entry == None and not entry[3] == None and (
+                entry[3] <= time.time()):
+            self._remove(key)
+            entry = None
+        if entry == None:
+            self.misses += 1
+            return SettingsCache.MISS
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        value, is_json, _, _ = entry
+        # values that can be changed in place are kept as json so callers
+        # never share (and change) the cached copy
+        return json.loads(value) if is_json else value
+
+    def set(self, table: str, ids: typing.Tuple[int, ...], setting: str,
+            value: typing.Any, value_json: typing.Optional[str],
+            expires_at: typing.Optional[float]=None):
+        key = (table, ids, setting)
+        self._remove(key)
+
+        size = SETTINGS_CACHE_ENTRY_SIZE+len(setting)+len(value_json or "")
+        if value is SettingsCache.ABSENT or type(value) in SCALAR_TYPES:
+            entry = (value, False, size, expires_at)
+        else:
+            entry = (value_json, True, size, expires_at)
+        self._entries[key] = entry
+        self.size += entry[2]
+
+        owner = (table, ids)
+        if not owner in self._owners:
+            self._owners[owner] = set([])
+        self._owners[owner].add(setting)
+
+        while self.size > self._max_size and self._entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def remove(self, table: str, ids: typing.Tuple[int, ...], setting: str):
+        self._remove((table, ids, setting))
+    def _remove(self, key: T_SETTINGS_KEY):
+        entry = self._entries.pop(key, None)
+        if not entry == None:
+            self.size -= entry[2]
+            owner = (key[0], key[1])
+            settings = self._owners[owner]
+            settings.discard(key[2])
+            if not settings:
+                del self._owners[owner]
+
+    def invalidate(self, table: str, ids: typing.Tuple[int, ...],
+            prefix: str=""):
+        # forget an owner's settings that start with `prefix`
+        for setting in list(self._owners.get((table, ids), [])):
+            if setting.startswith(prefix):
+                self._remove((table, ids, setting))
+    def invalidate_table(self, table: str):
+        for owner in [o for o in self._owners.keys() if o[0] == table]:
+            self.invalidate(*owner)
+
+    def flush(self):
+        self._entries.clear()
+        self._owners.clear()
+        self.size = 0
+
+    def resize(self, max_size: int):
+        self._max_size = max_size
+        while self.size > self._max_size and self._entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def stats(self) -> typing.Dict[str, int]:
+        return {"entries": len(self._entries), "size": self.size,
+            "max-size": self._max_size, "hits": self.hits,
+            "misses": self.misses, "evictions": self.evictions}
+
+class ReadPool(object):
+    # read-only connections, opened as they're needed, for threads other than
+    # the main thread. they only see committed writes
+    def __init__(self, engine: DatabaseEngine, size: int):
+        self._engine = engine
+        self._size = size
+        self._idle = queue.LifoQueue() # type: queue.LifoQueue
+        self._lock = threading.Lock()
+        self._connections = 0
+        self.reads = 0
+        self.waits = 0
+
+    def _take(self) -> DatabaseEngine:
+        with self._lock:
+            self.reads += 1
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_open = self._connections < self._size
+            if can_open:
+                self._connections += 1
+            else:
+                self.waits += 1
+
+        if not can_open:
+            return self._idle.get()
+        try:
+            return typing.cast(DatabaseEngine, self._engine.reader())
+        except:
+            with self._lock:
+                self._connections -= 1
+            raise
+
+    @contextlib.contextmanager
+    def connection(self) -> typing.Iterator[DatabaseEngine]:
+        reader = self._take()
+        try:
+            yield reader
+        finally:
+            self._idle.put(reader)
+
+    def stats(self) -> typing.Dict[str, int]:
+        return {"connections": self._connections, "max-connections":
+            self._size, "idle": self._idle.qsize(), "reads": self.reads,
+            "waits": self.waits}
+
+def _like_regex(pattern: str) -> typing.Pattern:
+    # a LIKE pattern as a regex, for tables that aren't in sqlite
+    return re.compile("".join(".*" if c == "%" else "." if c == "_" else
+        re.escape(c) for c in pattern), re.I|re.S)
+
+def _prefix_end(prefix: str) -> typing.Optional[str]:
+    # the first string after every string that starts with `prefix`
+    prefix = prefix.rstrip(chr(0x10FFFF))
+    if not prefix:
+        return None
+    return prefix[:-1]+chr(ord(prefix[-1])+1)
+
+class IdentityMap(object):
+    # (server_id, name): id for the users or channels table, loaded a whole
+    # server at a time and only used on the main thread
+    def __init__(self):
+        self._ids = {} # type: typing.Dict[int, typing.Dict[str, int]]
+        self._names = {} # type: typing.Dict[int, typing.Tuple[int, str]]
+
+    def loaded(self, server_id: int) -> bool:
+        return server_id in self._ids
+    def load(self, server_id: int,
+            rows: typing.List[typing.Tuple[int, str]]):
+        self._ids[server_id] = {}
+        for id, name in rows:
+            self.add(server_id, name, id)
+
+    def get(self, server_id: int, name: str) -> typing.Optional[int]:
+        return self._ids[server_id].get(name, None)
+    def by_id(self, id: int) -> typing.Optional[typing.Tuple[int, str]]:
+        return self._names.get(id, None)
+
+    def add(self, server_id: int, name: str, id: int):
+        self._ids[server_id][name] = id
+        self._names[id] = (server_id, name)
+    def remove(self, id: int):
+        if id in self._names:
+            server_id, name = self._names.pop(id)
+            del self._ids[server_id][name]
+    def rename(self, id: int, new_name: str):
+        if id in self._names:
+            server_id, _ = self._names[id]
+            self.remove(id)
+            self.add(server_id, new_name, id)
+    def remove_server(self, server_id: int):
+        for id in self._ids.pop(server_id, {}).values():
+            del self._names[id]
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+def _live(table: str="") -> str:
+    # a query condition for settings that haven't expired, given now
+    column = "%s.expires_at" % table if table else "expires_at"
+    return "(%s IS NULL OR %s > ?)" % (column, column)
+def _expires_at(ttl: typing.Optional[float]) -> typing.Optional[float]:
+    return None if ttl == None else time.time()+typing.cast(float, ttl)
 
 class Table(object):
     def __init__(self, database):
         self.database = database
 
+class SettingsTable(Table):
+    _table = ""
+    _id_columns = [] # type: typing.List[str]
+
+    def __init__(self, database):
+        Table.__init__(self, database)
+        # when not None, this table's settings are kept here rather than in
+        # the database's own table
+        self._kv = database.key_value_engine(self._table
+            ) # type: typing.Optional[KeyValueEngine]
+
+    def _fetch(self, ids: typing.Tuple[int, ...], setting: str, query: str
+            ) -> typing.Optional[T_KV_VALUE]:
+        # (value json, expires at), None when it's unset or expired
+        if not self._kv == None:
+            return self._kv.get(ids, setting)
+        row = self.database.execute_fetchone(query, list(ids)+[setting])
+        if row and (row[1] == None or row[1] > time.time()):
+            return row[0], row[1]
+        return None
+
+    def _get(self, ids: typing.Tuple[int, ...], setting: str, query: str,
+            default: typing.Any) -> typing.Any:
+        setting = setting.lower()
+        if not utils.is_main_thread():
+            # the settings cache is only used (and kept up to date) on the
+            # main thread
+            fetched = self._fetch(ids, setting, query)
+            return default if fetched == None else json.loads(fetched[0])
+
+        cache = self.database.settings_cache
+        value = cache.get(self._table, ids, setting)
+        if value is SettingsCache.MISS:
+            fetched = self._fetch(ids, setting, query)
+            if not fetched == None:
+                value_json, expires_at = typing.cast(T_KV_VALUE, fetched)
+                value = json.loads(value_json)
+                cache.set(self._table, ids, setting, value, value_json,
+                    expires_at)
+            else:
+                value = SettingsCache.ABSENT
+                cache.set(self._table, ids, setting, value, None)
+
+        if value is SettingsCache.ABSENT:
+            return default
+        return value
+    def _writing(self):
+        # writes are main thread only, which the database checks for itself
+        # but key-value engines and the settings cache don't
+        if not utils.is_main_thread():
+            raise RuntimeError("Can't access Database outside of main thread")
+
+    def _set(self, ids: typing.Tuple[int, ...], setting: str,
+            value: typing.Any, query: str, ttl: typing.Optional[float]):
+        self._writing()
+        setting = setting.lower()
+        value_json = json.dumps(value)
+        expires_at = _expires_at(ttl)
+        if not self._kv == None:
+            self._kv.set(ids, setting, value_json, expires_at)
+            self.database.key_value_wrote(self._kv)
+        else:
+            self.database.execute(query, list(ids)+[setting, value_json,
+                expires_at])
+        self.database.settings_cache.set(self._table, ids, setting, value,
+            value_json, expires_at)
+    def _delete(self, ids: typing.Tuple[int, ...], setting: str, query: str):
+        self._writing()
+        setting = setting.lower()
+        if not self._kv == None:
+            self._kv.delete(ids, setting)
+            self.database.key_value_wrote(self._kv)
+        else:
+            self.database.execute(query, list(ids)+[setting])
+        self.database.settings_cache.set(self._table, ids, setting,
+            SettingsCache.ABSENT, None)
+    def delete_owners(self, match: typing.Callable[[typing.Tuple[int, ...]],
+            bool]):
+        # the key-value equivalent of ON DELETE CASCADE
+        self._writing()
+        if not self._kv == None:
+            kv = typing.cast(KeyValueEngine, self._kv)
+            for ids in kv.owners():
+                if match(ids):
+                    kv.delete_owner(ids)
+            self.database.key_value_wrote(kv)
+
+    def _find(self, ids: typing.Tuple[int, ...], pattern: str, query: str,
+            default: typing.Any) -> typing.Any:
+        pattern = pattern.lower()
+        if not self._kv == None:
+            regex = _like_regex(pattern)
+            values = [(setting, value) for setting, value in
+                self._kv.owner(ids) if regex.fullmatch(setting)]
+        else:
+            values = self.database.execute_fetchall(query,
+                list(ids)+[pattern, time.time()])
+        if values:
+            return [(setting, json.loads(value)) for setting, value in values]
+        return default
+
+    def _find_prefix(self, ids: typing.Tuple[int, ...], prefix: str,
+            default: typing.Any) -> typing.Any:
+        prefix = prefix.lower()
+        if not self._kv == None:
+            values = [(setting, json.loads(value)) for setting, value in
+                self._kv.owner(ids) if setting.startswith(prefix)]
+            return values or default
+
+        where = ["%s=?" % column for column in self._id_columns]+[_live()]
+        params = list(ids)+[time.time()] # type: typing.List[typing.Any]
+        if prefix:
+            # settings that start with `prefix` sort between it and the end
+            # of its range, so this is a range scan of an index where LIKE
+            # (which is case insensitive) can't always use one
+            where.append("setting >= ?")
+            params.append(prefix)
+            end = _prefix_end(prefix)
+            if not end == None:
+                where.append("setting < ?")
+                params.append(end)
+
+        values = self.database.execute_fetchall(
+            "SELECT setting, value FROM %s WHERE %s" % (self._table,
+            " AND ".join(where)), params)
+        if values:
+            return [(setting, json.loads(value)) for setting, value in values]
+        return default
+
+    def all(self) -> typing.List[typing.Tuple[typing.Any, ...]]:
+        # every setting in the table as (*ids, setting, value, expires at)
+        rows = [] # type: typing.List[typing.Tuple[typing.Any, ...]]
+        if not self._kv == None:
+            kv = typing.cast(KeyValueEngine, self._kv)
+            for ids in kv.owners():
+                for setting, _ in kv.owner(ids):
+                    value_json, expires_at = typing.cast(T_KV_VALUE,
+                        kv.get(ids, setting))
+                    rows.append(ids+(setting, json.loads(value_json),
+                        expires_at))
+            return rows
+        for row in self.database.execute_fetchall(
+                "SELECT %ssetting, value, expires_at FROM %s WHERE %s" % (
+                "".join("%s, " % c for c in self._id_columns), self._table,
+                _live()), [time.time()]):
+            rows.append(tuple(row[:-2])+(json.loads(row[-2]), row[-1]))
+        return rows
+    def clear(self):
+        self._writing()
+        if not self._kv == None:
+            self.delete_owners(lambda ids: True)
+        else:
+            self.database.execute("DELETE FROM %s" % self._table)
+        self.database.settings_cache.invalidate_table(self._table)
+
+    # bulk versions of set()/get()/delete() that take a row of the same
+    # arguments for each setting. they skip filling the settings cache so a
+    # big import doesn't push everything else out of it
+
+    def _split_key(self, key: typing.Sequence[typing.Any]
+            ) -> typing.Tuple[typing.Tuple[int, ...], str]:
+        n = len(self._id_columns)
+        return tuple(key[:n]), key[n].lower()
+
+    def set_many(self, rows: typing.Iterable[typing.Sequence[typing.Any]],
+            ttl: typing.Optional[float]=None):
+        self._writing()
+        cache = self.database.settings_cache
+        expires_at = _expires_at(ttl)
+        params = [] # type: typing.List[typing.List[typing.Any]]
+        for row in rows:
+            ids, setting = self._split_key(row)
+            params.append(list(ids)+[setting, json.dumps(row[-1]),
+                expires_at])
+            cache.remove(self._table, ids, setting)
+
+        if not self._kv == None:
+            n = len(self._id_columns)
+            for param in params:
+                self._kv.set(tuple(param[:n]), param[n], param[n+1],
+                    expires_at)
+            self.database.key_value_wrote(self._kv, len(params))
+        elif params:
+            columns = self._id_columns+["setting", "value", "expires_at"]
+            self.database.execute_many(
+                "INSERT OR REPLACE INTO %s (%s) VALUES (%s)" % (self._table,
+                ", ".join(columns), ", ".join(["?"]*len(columns))), params)
+
+    def get_many(self, keys: typing.Iterable[typing.Sequence[typing.Any]],
+            default: typing.Any=None) -> typing.List[typing.Any]:
+        cache = self.database.settings_cache
+        use_cache = utils.is_main_thread()
+        split_keys = [self._split_key(key) for key in keys]
+        values = [] # type: typing.List[typing.Any]
+        # ids: setting: indexes in `values`
+        missing = {
+            } # type: typing.Dict[tuple, typing.Dict[str, typing.List[int]]]
+        for i, (ids, setting) in enumerate(split_keys):
+            value = SettingsCache.MISS
+            if use_cache:
+                value = cache.get(self._table, ids, setting)
+            if value is SettingsCache.MISS:
+                if not ids in missing:
+                    missing[ids] = {}
+                if not setting in missing[ids]:
+                    missing[ids][setting] = []
+                missing[ids][setting].append(i)
+                value = default
+            elif value is SettingsCache.ABSENT:
+                value = default
+            values.append(value)
+
+        # settings are looked up per set of ids as "ids=? AND setting IN
+        # (...)", which sqlite answers from the primary key index. matching
+        # all the columns at once with a row-value IN scans the whole table
+        if not self._kv == None:
+            for ids, settings in missing.items():
+                for setting, indexes in settings.items():
+                    fetched = self._kv.get(ids, setting)
+                    if not fetched == None:
+                        value = json.loads(typing.cast(T_KV_VALUE,
+                            fetched)[0])
+                        for index in indexes:
+                            values[index] = value
+            return values
+
+        where_ids = "".join("%s=? AND " % column
+            for column in self._id_columns)
+        for ids, settings in missing.items():
+            setting_names = list(settings.keys())
+            for i in range(0, len(setting_names), BULK_CHUNK_VARIABLES):
+                chunk = setting_names[i:i+BULK_CHUNK_VARIABLES]
+                rows = self.database.execute_fetchall(
+                    "SELECT setting, value FROM %s WHERE %ssetting IN (%s) "
+                    "AND %s" % (self._table, where_ids,
+                    ", ".join(["?"]*len(chunk)), _live()),
+                    list(ids)+chunk+[time.time()])
+                for setting, value_json in rows:
+                    value = json.loads(value_json)
+                    for index in settings[setting]:
+                        values[index] = value
+        return values
+
+    def delete_many(self, keys: typing.Iterable[typing.Sequence[typing.Any]]):
+        self._writing()
+        cache = self.database.settings_cache
+        params = [] # type: typing.List[typing.List[typing.Any]]
+        for key in keys:
+            ids, setting = self._split_key(key)
+            params.append(list(ids)+[setting])
+            cache.remove(self._table, ids, setting)
+
+        if not self._kv == None:
+            n = len(self._id_columns)
+            for param in params:
+                self._kv.delete(tuple(param[:n]), param[n])
+            self.database.key_value_wrote(self._kv, len(params))
+        elif params:
+            self.database.execute_many("DELETE FROM %s WHERE %s" % (
+                self._table, " AND ".join("%s=?" % column for column in
+                self._id_columns+["setting"])), params)
+
+    def reap(self, now: float, limit: int) -> int:
+        # delete up to `limit` settings that expired by `now`
+        if not self._kv == None:
+            keys = [ids+(setting,) for ids, setting in
+                self._kv.expired(now, limit)] # type: typing.List[typing.Any]
+        else:
+            keys = self.database.execute_fetchall(
+                """SELECT %ssetting FROM %s WHERE expires_at <= ?
+                LIMIT ?""" % ("".join("%s, " % c for c in self._id_columns),
+                self._table), [now, limit])
+        if keys:
+            self.delete_many(keys)
+        return len(keys)
+
 class Servers(Table):
     def add(self, alias: str, hostname: str, port: int, password: str,
             tls: bool, bindhost: str, nickname: str, username: str=None,
             realname: str=None):
         username = username or nickname
         realname = realname or nickname
-        self.database.execute(
+        return self.database.execute_insert(
             """INSERT INTO servers (alias, hostname, port, password, tls,
             bindhost, nickname, username, realname) VALUES (
             ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
             [alias, hostname, port, password, tls, bindhost, nickname, username,
             realname])
-        return self.database.execute_fetchone(
-            "SELECT server_id FROM servers ORDER BY server_id DESC LIMIT 1")[0]
     def by_alias(self, alias: str) -> typing.Optional[int]:
         ids = self.database.execute_fetchone(
             "SELECT server_id FROM servers WHERE alias=?", [alias])
@@ -51,235 +641,318 @@ class Servers(Table):
         self.database.execute(
             "UPDATE servers SET %s=? WHERE server_id=?" % column, [value, id])
     def delete(self, id: int):
+        channel_ids = set(row[0] for row in self.database.execute_fetchall(
+            "SELECT channel_id FROM channels WHERE server_id=?", [id]))
+        user_ids = set(row[0] for row in self.database.execute_fetchall(
+            "SELECT user_id FROM users WHERE server_id=?", [id]))
+
         self.database.execute("DELETE FROM servers WHERE server_id=?", [id])
+        # settings for this server's channels and users go with it
+        self.database.server_settings.delete_owners(
+            lambda ids: ids[0] == id)
+        self.database.channel_settings.delete_owners(
+            lambda ids: ids[0] in channel_ids)
+        self.database.user_settings.delete_owners(
+            lambda ids: ids[0] in user_ids)
+        self.database.user_channel_settings.delete_owners(
+            lambda ids: ids[0] in user_ids or ids[1] in channel_ids)
+        self.database.settings_cache.flush()
+        self.database.channels.forget_server(id)
+        self.database.users.forget_server(id)
+
+class ServerNames(Table):
+    # a table of names (channel names, nicknames) per server, each with an id
+    _table = ""
+    _id_column = ""
+    _name_column = ""
+
+    def __init__(self, database):
+        Table.__init__(self, database)
+        self._map = IdentityMap()
+
+    def _use_map(self, server_id: int) -> bool:
+        if not utils.is_main_thread():
+            return False
+        if not self._map.loaded(server_id):
+            self.preload(server_id)
+        return True
+
+    def preload(self, server_id: int):
+        self._map.load(server_id, self.database.execute_fetchall(
+            "SELECT %s, %s FROM %s WHERE server_id=?" % (self._id_column,
+            self._name_column, self._table), [server_id]))
+    def forget_server(self, server_id: int):
+        self._map.remove_server(server_id)
+
+    def _add(self, server_id: int, name: str) -> int:
+        if self._use_map(server_id):
+            id = self._map.get(server_id, name)
+            if not id == None:
+                return typing.cast(int, id)
+
+        id = self.database.execute_insert(
+            "INSERT OR IGNORE INTO %s (server_id, %s) VALUES (?, ?)" % (
+            self._table, self._name_column), [server_id, name])
+        if id == None:
+            # it was already there
+            id = self._select_id(server_id, name)
+        if self._use_map(server_id):
+            self._map.add(server_id, name, typing.cast(int, id))
+        return typing.cast(int, id)
 
-class Channels(Table):
-    def add(self, server_id: int, name: str):
-        self.database.execute("""INSERT OR IGNORE INTO channels
-            (server_id, name) VALUES (?, ?)""",
-            [server_id, name.lower()])
+    def _select_id(self, server_id: int, name: str) -> typing.Optional[int]:
+        value = self.database.execute_fetchone(
+            "SELECT %s FROM %s WHERE server_id=? AND %s=?" % (self._id_column,
+            self._table, self._name_column), [server_id, name])
+        return value if value == None else value[0]
+    def _get_id(self, server_id: int, name: str) -> typing.Optional[int]:
+        if self._use_map(server_id):
+            return self._map.get(server_id, name)
+        return self._select_id(server_id, name)
+
+    def _by_id(self, id: int) -> typing.Optional[typing.Tuple[int, str]]:
+        if utils.is_main_thread():
+            value = self._map.by_id(id)
+            if not value == None:
+                return value
         return self.database.execute_fetchone(
-            "SELECT channel_id FROM channels ORDER BY channel_id DESC LIMIT 1")[0]
+            "SELECT server_id, %s FROM %s WHERE %s=?" % (self._name_column,
+            self._table, self._id_column), [id])
+
+    def _delete(self, id: int):
+        self.database.execute("DELETE FROM %s WHERE %s=?" % (self._table,
+            self._id_column), [id])
+        self._map.remove(id)
+
+class Channels(ServerNames):
+    _table = "channels"
+    _id_column = "channel_id"
+    _name_column = "name"
+
+    def add(self, server_id: int, name: str) -> int:
+        return self._add(server_id, name.lower())
     def delete(self, channel_id: int):
-        self.database.execute("DELETE FROM channels WHERE channel_id=?",
-            [channel_id])
+        self._delete(channel_id)
+        self.database.channel_settings.delete_owners(
+            lambda ids: ids[0] == channel_id)
+        self.database.user_channel_settings.delete_owners(
+            lambda ids: ids[1] == channel_id)
+        self.database.settings_cache.invalidate("channel_settings",
+            (channel_id,))
+        self.database.settings_cache.invalidate_table("user_channel_settings")
     def get_id(self, server_id: int, name: str):
-        value = self.database.execute_fetchone("""SELECT channel_id FROM
-            channels WHERE server_id=? AND name=?""",
-            [server_id, name.lower()])
-        return value if value == None else value[0]
+        return self._get_id(server_id, name.lower())
     def by_id(self, channel_id: int):
-        value = self.database.execute_fetchone(
-            "SELECT server_id, name FROM channels WHERE channel_id=?",
-            [channel_id])
-        return value
+        return self._by_id(channel_id)
     def rename(self, channel_id: int, new_name: str):
         self.database.execute("UPDATE channels SET name=? where channel_id=?",
             [new_name.lower(), channel_id])
+        self._map.rename(channel_id, new_name.lower())
+
+class Users(ServerNames):
+    _table = "users"
+    _id_column = "user_id"
+    _name_column = "nickname"
 
-class Users(Table):
-    def add(self, server_id: int, nickname: str):
-        self.database.execute("""INSERT OR IGNORE INTO users
-            (server_id, nickname) VALUES (?, ?)""",
-            [server_id, nickname])
+    def add(self, server_id: int, nickname: str) -> int:
+        return self._add(server_id, nickname)
     def delete(self, user_id: int):
-        self.database.execute("DELETE FROM users WHERE user_id=?",
-            [user_id])
+        self._delete(user_id)
+        self.database.user_settings.delete_owners(
+            lambda ids: ids[0] == user_id)
+        self.database.user_channel_settings.delete_owners(
+            lambda ids: ids[0] == user_id)
+        self.database.settings_cache.invalidate("user_settings", (user_id,))
+        self.database.settings_cache.invalidate_table("user_channel_settings")
     def get_id(self, server_id: int, nickname: str):
-        value = self.database.execute_fetchone(
-            "SELECT user_id FROM users WHERE server_id=? and nickname=?",
-            [server_id, nickname])
-        return value if value == None else value[0]
+        return self._get_id(server_id, nickname)
     def by_id(self, user_id: int):
-        return self.database.execute_fetchone(
-            "SELECT server_id, nickname FROM users WHERE user_id=?",
-            [user_id])
+        return self._by_id(user_id)
     def get_nickname(self, server_id: int, user_id: int):
-        value = self.database.execute_fetchone(
-            "SELECT nickname FROM users WHERe server_id=? AND user_id=?",
-            [server_id, user_id])
-        return (value or [None])[0]
+        value = self._by_id(user_id)
+        if value and value[0] == server_id:
+            return value[1]
+        return None
 
-class BotSettings(Table):
-    def set(self, setting: str, value: typing.Any):
-        self.database.execute(
-            "INSERT OR REPLACE INTO bot_settings VALUES (?, ?)",
-            [setting.lower(), json.dumps(value)])
+class BotSettings(SettingsTable):
+    _table = "bot_settings"
+    _id_columns = []
+
+    def set(self, setting: str, value: typing.Any,
+            ttl: typing.Optional[float]=None):
+        self._set((), setting, value,
+            """INSERT OR REPLACE INTO bot_settings
+            (setting, value, expires_at) VALUES (?, ?, ?)""", ttl)
     def get(self, setting: str, default: typing.Any=None):
-        value = self.database.execute_fetchone(
-            "SELECT value FROM bot_settings WHERE setting=?",
-            [setting.lower()])
-        if value:
-            return json.loads(value[0])
-        return default
+        return self._get((), setting,
+            "SELECT value, expires_at FROM bot_settings WHERE setting=?",
+            default)
     def find(self, pattern: str, default: typing.Any=[]):
-        values = self.database.execute_fetchall(
-            "SELECT setting, value FROM bot_settings WHERE setting LIKE ?",
-            [pattern.lower()])
-        if values:
-            for i, value in enumerate(values):
-                values[i] = value[0], json.loads(value[1])
-            return values
-        return default
+        return self._find((), pattern,
+            """SELECT setting, value FROM bot_settings WHERE setting LIKE ?
+            AND %s""" % _live(), default)
     def find_prefix(self, prefix: str, default: typing.Any=[]):
-        return self.find("%s%%" % prefix, default)
+        return self._find_prefix((), prefix, default)
     def delete(self, setting: str):
-        self.database.execute(
-            "DELETE FROM bot_settings WHERE setting=?",
-            [setting.lower()])
+        self._delete((), setting, "DELETE FROM bot_settings WHERE setting=?")
 
-class ServerSettings(Table):
-    def set(self, server_id: int, setting: str, value: typing.Any):
-        self.database.execute(
-            "INSERT OR REPLACE INTO server_settings VALUES (?, ?, ?)",
-            [server_id, setting.lower(), json.dumps(value)])
+class ServerSettings(SettingsTable):
+    _table = "server_settings"
+    _id_columns = ["server_id"]
+
+    def set(self, server_id: int, setting: str, value: typing.Any,
+            ttl: typing.Optional[float]=None):
+        self._set((server_id,), setting, value,
+            """INSERT OR REPLACE INTO server_settings
+            (server_id, setting, value, expires_at) VALUES (?, ?, ?, ?)""",
+            ttl)
     def get(self, server_id: int, setting: str, default: typing.Any=None):
-        value = self.database.execute_fetchone(
-            """SELECT value FROM server_settings WHERE
-            server_id=? AND setting=?""",
-            [server_id,setting.lower()])
-        if value:
-            return json.loads(value[0])
-        return default
+        return self._get((server_id,), setting,
+            """SELECT value, expires_at FROM server_settings WHERE
+            server_id=? AND setting=?""", default)
     def find(self, server_id: int, pattern: str, default: typing.Any=[]):
-        values = self.database.execute_fetchall(
+        return self._find((server_id,), pattern,
             """SELECT setting, value FROM server_settings WHERE
-            server_id=? AND setting LIKE ?""",
-            [server_id, pattern.lower()])
-        if values:
-            for i, value in enumerate(values):
-                values[i] = value[0], json.loads(value[1])
-            return values
-        return default
+            server_id=? AND setting LIKE ? AND %s""" % _live(), default)
     def find_prefix(self, server_id: int, prefix: str, default: typing.Any=[]):
-        return self.find(server_id, "%s%%" % prefix, default)
+        return self._find_prefix((server_id,), prefix, default)
     def delete(self, server_id: int, setting: str):
-        self.database.execute(
-            "DELETE FROM server_settings WHERE server_id=? AND setting=?",
-            [server_id, setting.lower()])
+        self._delete((server_id,), setting,
+            "DELETE FROM server_settings WHERE server_id=? AND setting=?")
 
-class ChannelSettings(Table):
-    def set(self, channel_id: int, setting: str, value: typing.Any):
-        self.database.execute(
-            "INSERT OR REPLACE INTO channel_settings VALUES (?, ?, ?)",
-            [channel_id, setting.lower(), json.dumps(value)])
+class ChannelSettings(SettingsTable):
+    _table = "channel_settings"
+    _id_columns = ["channel_id"]
+
+    def set(self, channel_id: int, setting: str, value: typing.Any,
+            ttl: typing.Optional[float]=None):
+        self._set((channel_id,), setting, value,
+            """INSERT OR REPLACE INTO channel_settings
+            (channel_id, setting, value, expires_at) VALUES (?, ?, ?, ?)""",
+            ttl)
     def get(self, channel_id: int, setting: str, default: typing.Any=None):
-        value = self.database.execute_fetchone(
-            """SELECT value FROM channel_settings WHERE
-            channel_id=? AND setting=?""", [channel_id, setting.lower()])
-        if value:
-            return json.loads(value[0])
-        return default
+        return self._get((channel_id,), setting,
+            """SELECT value, expires_at FROM channel_settings WHERE
+            channel_id=? AND setting=?""", default)
     def find(self, channel_id: int, pattern: str, default: typing.Any=[]):
-        values = self.database.execute_fetchall(
+        return self._find((channel_id,), pattern,
             """SELECT setting, value FROM channel_settings WHERE
-            channel_id=? AND setting LIKE ?""", [channel_id, pattern.lower()])
-        if values:
-            for i, value in enumerate(values):
-                values[i] = value[0], json.loads(value[1])
-            return values
-        return default
+            channel_id=? AND setting LIKE ? AND %s""" % _live(), default)
     def find_prefix(self, channel_id: int, prefix: str, default: typing.Any=[]):
-        return self.find(channel_id, "%s%%" % prefix,
-            default)
+        return self._find_prefix((channel_id,), prefix, default)
     def delete(self, channel_id: int, setting: str):
-        self.database.execute(
+        self._delete((channel_id,), setting,
             """DELETE FROM channel_settings WHERE channel_id=?
-            AND setting=?""", [channel_id, setting.lower()])
+            AND setting=?""")
 
     def find_by_setting(self, setting: str, default: typing.Any=[]):
-        values = self.database.execute_fetchall(
-            """SELECT channels.server_id, channels.name,
-            channel_settings.value FROM channel_settings
-            INNER JOIN channels ON
-            channel_settings.channel_id=channels.channel_id
-            WHERE channel_settings.setting=?""", [setting])
+        if not self._kv == None:
+            values = [] # type: typing.List[typing.Any]
+            for (channel_id,), value in self._kv.find_setting(setting):
+                channel = self.database.channels.by_id(channel_id)
+                if channel:
+                    values.append((channel[0], channel[1], value))
+        else:
+            values = self.database.execute_fetchall(
+                """SELECT channels.server_id, channels.name,
+                channel_settings.value FROM channel_settings
+                INNER JOIN channels ON
+                channel_settings.channel_id=channels.channel_id
+                WHERE channel_settings.setting=? AND %s""" % _live(
+                "channel_settings"), [setting, time.time()])
         if values:
             for i, value in enumerate(values):
                 values[i] = value[0], value[1], json.loads(value[2])
             return values
         return default
 
-class UserSettings(Table):
-    def set(self, user_id: int, setting: str, value: typing.Any):
-        self.database.execute(
-            "INSERT OR REPLACE INTO user_settings VALUES (?, ?, ?)",
-            [user_id, setting.lower(), json.dumps(value)])
+class UserSettings(SettingsTable):
+    _table = "user_settings"
+    _id_columns = ["user_id"]
+
+    def set(self, user_id: int, setting: str, value: typing.Any,
+            ttl: typing.Optional[float]=None):
+        self._set((user_id,), setting, value,
+            """INSERT OR REPLACE INTO user_settings
+            (user_id, setting, value, expires_at) VALUES (?, ?, ?, ?)""", ttl)
     def get(self, user_id: int, setting: str, default: typing.Any=None):
-        value = self.database.execute_fetchone(
-            """SELECT value FROM user_settings WHERE
-            user_id=? and setting=?""", [user_id, setting.lower()])
-        if value:
-            return json.loads(value[0])
-        return default
+        return self._get((user_id,), setting,
+            """SELECT value, expires_at FROM user_settings WHERE
+            user_id=? and setting=?""", default)
     def find_all_by_setting(self, server_id: int, setting: str,
             default: typing.Any=[]):
-        values = self.database.execute_fetchall(
-            """SELECT users.nickname, user_settings.value FROM
-            user_settings INNER JOIN users ON
-            user_settings.user_id=users.user_id WHERE
-            users.server_id=? AND user_settings.setting=?""",
-            [server_id, setting])
+        if not self._kv == None:
+            values = [] # type: typing.List[typing.Any]
+            for (user_id,), value in self._kv.find_setting(setting):
+                nickname = self.database.users.get_nickname(server_id,
+                    user_id)
+                if not nickname == None:
+                    values.append((nickname, value))
+        else:
+            values = self.database.execute_fetchall(
+                """SELECT users.nickname, user_settings.value FROM
+                user_settings INNER JOIN users ON
+                user_settings.user_id=users.user_id WHERE
+                users.server_id=? AND user_settings.setting=?
+                AND %s""" % _live("user_settings"),
+                [server_id, setting, time.time()])
         if values:
             for i, value in enumerate(values):
                 values[i] = value[0], json.loads(value[1])
             return values
         return default
     def find(self, user_id: int, pattern: str, default: typing.Any=[]):
-        values = self.database.execute_fetchall(
+        return self._find((user_id,), pattern,
             """SELECT setting, value FROM user_settings WHERE
-            user_id=? AND setting LIKE ?""", [user_id, pattern.lower()])
-        if values:
-            for i, value in enumerate(values):
-                values[i] = value[0], json.loads(value[1])
-            return values
-        return default
+            user_id=? AND setting LIKE ? AND %s""" % _live(), default)
     def find_prefix(self, user_id: int, prefix: str, default: typing.Any=[]):
-        return self.find(user_id, "%s%%" % prefix, default)
+        return self._find_prefix((user_id,), prefix, default)
     def delete(self, user_id: int, setting: str):
-        self.database.execute(
+        self._delete((user_id,), setting,
             """DELETE FROM user_settings WHERE
-            user_id=? AND setting=?""", [user_id, setting.lower()])
+            user_id=? AND setting=?""")
+
+class UserChannelSettings(SettingsTable):
+    _table = "user_channel_settings"
+    _id_columns = ["user_id", "channel_id"]
 
-class UserChannelSettings(Table):
     def set(self, user_id: int, channel_id: int, setting: str,
-            value: typing.Any):
-        self.database.execute(
-            """INSERT OR REPLACE INTO user_channel_settings VALUES
-            (?, ?, ?, ?)""",
-            [user_id, channel_id, setting.lower(), json.dumps(value)])
+            value: typing.Any, ttl: typing.Optional[float]=None):
+        self._set((user_id, channel_id), setting, value,
+            """INSERT OR REPLACE INTO user_channel_settings
+            (user_id, channel_id, setting, value, expires_at) VALUES
+            (?, ?, ?, ?, ?)""", ttl)
     def get(self, user_id: int, channel_id: int, setting: str,
             default: typing.Any=None):
-        value = self.database.execute_fetchone(
-            """SELECT value FROM user_channel_settings WHERE
-            user_id=? AND channel_id=? AND setting=?""",
-            [user_id, channel_id, setting.lower()])
-        if value:
-            return json.loads(value[0])
-        return default
+        return self._get((user_id, channel_id), setting,
+            """SELECT value, expires_at FROM user_channel_settings WHERE
+            user_id=? AND channel_id=? AND setting=?""", default)
     def find(self, user_id: int, channel_id: int, pattern: str,
             default: typing.Any=[]):
-        values = self.database.execute_fetchall(
+        return self._find((user_id, channel_id), pattern,
             """SELECT setting, value FROM user_channel_settings WHERE
-            user_id=? AND channel_id=? AND setting LIKE ?""",
-            [user_id, channel_id, pattern.lower()])
-        if values:
-            for i, value in enumerate(values):
-                values[i] = value[0], json.loads(value[1])
-            return values
-        return default
+            user_id=? AND channel_id=? AND setting LIKE ? AND %s""" % _live(),
+            default)
     def find_prefix(self, user_id: int, channel_id: int, prefix: str,
             default: typing.Any=[]):
-        return self.find(user_id, channel_id, "%s%%" % prefix,
-            default)
+        return self._find_prefix((user_id, channel_id), prefix, default)
     def find_by_setting(self, user_id: int, setting: str,
             default: typing.Any=[]):
-        values = self.database.execute_fetchall(
-            """SELECT channels.name, user_channel_settings.value FROM
-            user_channel_settings INNER JOIN channels ON
-            user_channel_settings.channel_id=channels.channel_id
-            WHERE user_channel_settings.setting=?
-            AND user_channel_settings.user_id=?""", [setting, user_id])
+        if not self._kv == None:
+            values = [] # type: typing.List[typing.Any]
+            for ids, value in self._kv.find_setting(setting):
+                channel = self.database.channels.by_id(ids[1])
+                if ids[0] == user_id and channel:
+                    values.append((channel[1], value))
+        else:
+            values = self.database.execute_fetchall(
+                """SELECT channels.name, user_channel_settings.value FROM
+                user_channel_settings INNER JOIN channels ON
+                user_channel_settings.channel_id=channels.channel_id
+                WHERE user_channel_settings.setting=?
+                AND user_channel_settings.user_id=? AND %s""" % _live(
+                "user_channel_settings"), [setting, user_id,
+                time.time()])
         if values:
             for i, value in enumerate(values):
                 values[i] = value[0], json.loads(value[1])
@@ -287,29 +960,42 @@ class UserChannelSettings(Table):
         return default
     def find_all_by_setting(self, server_id: int, setting: str,
             default: typing.Any=[]):
-        values = self.database.execute_fetchall(
-            """SELECT channels.name, users.nickname,
-            user_channel_settings.value FROM
-            user_channel_settings INNER JOIN channels ON
-            user_channel_settings.channel_id=channels.channel_id
-            INNER JOIN users on user_channel_settings.user_id=users.user_id
-            WHERE user_channel_settings.setting=? AND
-            users.server_id=?""", [setting, server_id])
+        if not self._kv == None:
+            values = [] # type: typing.List[typing.Any]
+            for ids, value in self._kv.find_setting(setting):
+                nickname = self.database.users.get_nickname(server_id,
+                    ids[0])
+                channel = self.database.channels.by_id(ids[1])
+                if not nickname == None and channel:
+                    values.append((channel[1], nickname, value))
+        else:
+            values = self.database.execute_fetchall(
+                """SELECT channels.name, users.nickname,
+                user_channel_settings.value FROM
+                user_channel_settings INNER JOIN channels ON
+                user_channel_settings.channel_id=channels.channel_id
+                INNER JOIN users ON
+                user_channel_settings.user_id=users.user_id
+                WHERE user_channel_settings.setting=? AND
+                users.server_id=? AND %s""" % _live(
+                "user_channel_settings"), [setting, server_id,
+                time.time()])
         if values:
             for i, value in enumerate(values):
                 values[i] = value[0], value[1], json.loads(value[2])
             return values
         return default
     def delete(self, user_id: int, channel_id: int, setting: str):
-        self.database.execute(
+        self._delete((user_id, channel_id), setting,
             """DELETE FROM user_channel_settings WHERE
-            user_id=? AND channel_id=? AND setting=?""",
-            [user_id, channel_id, setting.lower()])
+            user_id=? AND channel_id=? AND setting=?""")
 
-class Database(object):
+class Database(PollHook.PollHook):
     _engine: DatabaseEngine
 
-    def __init__(self, log: "Logging.Log", database: str):
+    def __init__(self, log: "Logging.Log", database: str,
+            settings_cache_size: int=SETTINGS_CACHE_SIZE,
+            options: typing.Dict[str, str]={}):
         db_parts = urllib.parse.urlparse(database)
 
         if db_parts.scheme == "sqlite3":
@@ -320,10 +1006,69 @@ class Database(object):
             path=db_parts.path, username=db_parts.username,
             password=db_parts.password)
         self._engine.connect()
+        # [database] config section
+        self._engine.tune(options)
 
         self.log = log
         self._lock = threading.Lock()
 
+        self._read_pool = None # type: typing.Optional[ReadPool]
+        read_connections = int(options.get("read-connections",
+            READ_CONNECTIONS))
+        if read_connections > 0:
+            if self._engine.concurrent_reads():
+                self._read_pool = ReadPool(self._engine, read_connections)
+            elif "read-connections" in options:
+                self.log.warn("[database] read-connections needs "
+                    "journal-mode = wal, other threads can't read")
+        # reads of *_settings tables, kept up to date by their set()/delete()
+        self.settings_cache = SettingsCache(settings_cache_size)
+
+        # settings tables that are kept out of the database, by table name
+        self._key_values = {} # type: typing.Dict[str, KeyValueEngine]
+        self._key_values_dirty = set([]) # type: typing.Set[KeyValueEngine]
+        # like sqlite, only fsync on commit with synchronous = full/extra
+        key_value_sync = options.get("synchronous", "full").lower() in [
+            "full", "extra", "2", "3"]
+        for table in SETTINGS_TABLES:
+            storage = options.get("%s-storage" % table.replace("_", "-"),
+                "sqlite3")
+            if not storage in KEY_VALUE_ENGINES:
+                raise ValueError("Unknown settings storage '%s'" % storage)
+            engine_type = KEY_VALUE_ENGINES[storage]
+            if not engine_type == None:
+                self._key_values[table] = engine_type(
+                    self._key_value_path(table), sync=key_value_sync)
+
+        # when not None, writes are grouped in to transactions that are
+        # committed this many seconds after they start (0 = end of this
+        # event loop iteration)
+        self._commit_interval = None # type: typing.Optional[float]
+        self._commit_writes = GROUP_COMMIT_WRITES
+        self._transaction_start = None # type: typing.Optional[float]
+        self._transaction_writes = 0
+        self.commits = 0
+        self.committed_writes = 0
+
+        checkpoint = options.get("wal-checkpoint", None)
+        self._checkpoint_interval = (float(checkpoint) if checkpoint else None
+            ) # type: typing.Optional[float]
+        self._next_checkpoint = None # type: typing.Optional[float]
+        if not self._checkpoint_interval == None:
+            self._next_checkpoint = (time.monotonic()+
+                typing.cast(float, self._checkpoint_interval))
+
+        # expired settings are deleted in batches, so a backlog of them is
+        # worked through a batch per event loop iteration
+        self._expiry_interval = float(options.get("expiry-interval",
+            EXPIRY_INTERVAL))
+        self._expiry_batch = int(options.get("expiry-batch", EXPIRY_BATCH))
+        self._next_expiry = None # type: typing.Optional[float]
+        if self._expiry_interval > 0:
+            self._next_expiry = time.monotonic()+self._expiry_interval
+        self.expiry_runs = 0
+        self.expired = dict((table, 0) for table in SETTINGS_TABLES)
+
         self.make_servers_table()
         self.make_channels_table()
         self.make_users_table()
@@ -332,6 +1077,7 @@ class Database(object):
         self.make_channel_settings_table()
         self.make_user_settings_table()
         self.make_user_channel_settings_table()
+        self._migrate()
 
         self.servers = Servers(self)
         self.channels = Channels(self)
@@ -341,39 +1087,233 @@ class Database(object):
         self.channel_settings = ChannelSettings(self)
         self.user_settings = UserSettings(self)
         self.user_channel_settings = UserChannelSettings(self)
+        self._settings_tables = [self.bot_settings, self.server_settings,
+            self.channel_settings, self.user_settings,
+            self.user_channel_settings] # type: typing.List[SettingsTable]
 
     def _execute_fetch(self, query: str,
             fetch_func: typing.Callable[[DatabaseEngineCursor], typing.Any],
-            params: typing.List=[]):
-        if not utils.is_main_thread():
-            raise RuntimeError("Can't access Database outside of main thread")
+            params: typing.List=[], many: bool=False, read: bool=False):
+        if utils.is_main_thread():
+            return self._execute_on(self._engine, self._lock, query,
+                fetch_func, params, many)
+        elif read and not self._read_pool == None:
+            with self._read_pool.connection() as reader:
+                return self._execute_on(reader, contextlib.nullcontext(),
+                    query, fetch_func, params, many)
+        raise RuntimeError("Can't access Database outside of main thread")
 
-        printable_query = " ".join(query.split())
-        start = time.monotonic()
+    def _execute_on(self, engine: DatabaseEngine, lock: typing.ContextManager,
+            query: str,
+            fetch_func: typing.Callable[[DatabaseEngineCursor], typing.Any],
+            params: typing.List, many: bool):
+        tracing = self.log.tracing(query)
+        if tracing:
+            start = time.monotonic()
 
-        cursor = self._engine.cursor()
-        with self._lock:
-            cursor.execute(query, params)
+        cursor = engine.cursor()
+        with lock:
+            if many:
+                cursor.executemany(query, params)
+            else:
+                cursor.execute(query, params)
         value = fetch_func(cursor)
 
-        end = time.monotonic()
-        total_milliseconds = (end - start) * 1000
-        self.log.trace("executed query in %fms: \"%s\" (params: %s)",
-            [total_milliseconds, printable_query, params])
+        if tracing:
+            end = time.monotonic()
+            total_milliseconds = (end - start) * 1000
+            printable_query = " ".join(query.split())
+            printable_params = ("%d rows" % len(params)) if many else params
+            self.log.trace("executed query in %fms: \"%s\" (params: %s)",
+                [total_milliseconds, printable_query, printable_params],
+                subject=query)
 
         return value
+    # these two can be called from any thread when there's a read pool
     def execute_fetchall(self, query: str, params: typing.List=[]):
         return self._execute_fetch(query,
-            lambda cursor: cursor.fetchall(), params)
+            lambda cursor: cursor.fetchall(), params, read=True)
     def execute_fetchone(self, query: str, params: typing.List=[]):
         return self._execute_fetch(query,
-            lambda cursor: cursor.fetchone(), params)
+            lambda cursor: cursor.fetchone(), params, read=True)
+    def can_read(self) -> bool:
+        # whether the calling thread can use execute_fetchall/fetchone
+        return utils.is_main_thread() or not self._read_pool == None
+    def read_pool_stats(self) -> typing.Optional[typing.Dict[str, int]]:
+        if self._read_pool == None:
+            return None
+        return self._read_pool.stats()
     def execute(self, query: str, params: typing.List=[]):
-        return self._execute_fetch(query, lambda cursor: None, params)
+        return self._execute_write(query, lambda cursor: None, params)
+    def execute_insert(self, query: str, params: typing.List=[]
+            ) -> typing.Optional[int]:
+        return self._execute_write(query, lambda cursor: cursor.inserted_id(),
+            params)
+    def _execute_write(self, query: str,
+            fetch_func: typing.Callable[[DatabaseEngineCursor], typing.Any],
+            params: typing.List):
+        if (not self._commit_interval == None and
+                self._transaction_start == None):
+            self._begin()
+
+        value = self._execute_fetch(query, fetch_func, params)
+
+        if not self._transaction_start == None:
+            self._wrote(1)
+        return value
+    def execute_many(self, query: str,
+            params: typing.List[typing.List[typing.Any]]):
+        # every row is written in one transaction: the open group commit
+        # transaction if there is one, otherwise one of our own
+        own_transaction = (self._commit_interval == None and
+            self._transaction_start == None)
+        if self._transaction_start == None:
+            self._begin()
+
+        try:
+            self._execute_fetch(query, lambda cursor: None, params, True)
+        except:
+            if own_transaction:
+                self._execute_fetch("ROLLBACK", lambda cursor: None)
+                self._transaction_start = None
+                self._transaction_writes = 0
+            raise
+
+        if own_transaction:
+            self._transaction_writes += len(params)
+            self.commit()
+        else:
+            self._wrote(len(params))
+
+    def _begin(self):
+        self._execute_fetch("BEGIN", lambda cursor: None)
+        self._transaction_start = time.monotonic()
+    def _wrote(self, count: int):
+        self._transaction_writes += count
+        if self._transaction_writes >= self._commit_writes:
+            self.commit()
+
+    def set_group_commit(self, interval: typing.Optional[float],
+            writes: int=GROUP_COMMIT_WRITES):
+        self._commit_interval = interval
+        self._commit_writes = writes
+        if interval == None:
+            self.commit()
+
+    def commit(self):
+        # reads see uncommitted writes (same connection) so this is only
+        # needed to make writes durable
+        if not self._transaction_start == None:
+            self._execute_fetch("COMMIT", lambda cursor: None)
+            self.commits += 1
+            self.committed_writes += self._transaction_writes
+            self._transaction_start = None
+            self._transaction_writes = 0
+            self._sync_key_values()
+
+    def checkpoint(self):
+        # a checkpoint can only copy committed pages back to the database
+        self.commit()
+        with self._lock:
+            result = self._engine.checkpoint()
+        self.log.debug("database checkpoint: %s", [result])
+        for engine in self._key_values.values():
+            engine.compact()
+
+    def _key_value_path(self, table: str) -> typing.Optional[str]:
+        path = self._engine.database_name()
+        if path in ["", ":memory:"]:
+            return None
+        return "%s.%s.log" % (path, table)
+    def key_value_engine(self, table: str) -> typing.Optional[KeyValueEngine]:
+        return self._key_values.get(table, None)
+    def key_value_wrote(self, engine: KeyValueEngine, count: int=1):
+        # key-value writes are made durable when database writes would be
+        self._key_values_dirty.add(engine)
+        if self._commit_interval == None and self._transaction_start == None:
+            self._sync_key_values()
+        else:
+            if self._transaction_start == None:
+                self._begin()
+            self._wrote(count)
+    def _sync_key_values(self):
+        for engine in self._key_values_dirty:
+            engine.sync()
+        self._key_values_dirty.clear()
+    def storage_stats(self) -> typing.Dict[str, typing.Dict[str, int]]:
+        return {table: engine.stats() for table, engine in
+            self._key_values.items()}
+
+    def expire(self) -> bool:
+        # delete a batch of expired settings from each table, returning
+        # whether any table might have more
+        now = time.time()
+        more = False
+        for table in self._settings_tables:
+            count = table.reap(now, self._expiry_batch)
+            self.expired[table._table] += count
+            more = more or count >= self._expiry_batch
+        self.expiry_runs += 1
+        return more
+    def expiry_stats(self) -> typing.Dict[str, int]:
+        stats = {"runs": self.expiry_runs,
+            "expired": sum(self.expired.values())}
+        stats.update(self.expired)
+        return stats
+
+    def tuning(self) -> typing.Dict[str, typing.Any]:
+        with self._lock:
+            return self._engine.tuning()
+
+    def _deadlines(self) -> typing.List[float]:
+        deadlines = [] # type: typing.List[float]
+        if not self._transaction_start == None:
+            deadlines.append(typing.cast(float, self._transaction_start)+
+                (self._commit_interval or 0))
+        if not self._next_checkpoint == None:
+            deadlines.append(typing.cast(float, self._next_checkpoint))
+        if not self._next_expiry == None:
+            deadlines.append(typing.cast(float, self._next_expiry))
+        return deadlines
+    def next(self) -> typing.Optional[float]:
+        deadlines = self._deadlines()
+        if not deadlines:
+            return None
+        return max(0, min(deadlines)-time.monotonic())
+    def call(self):
+        now = time.monotonic()
+        if (not self._next_checkpoint == None and
+                self._next_checkpoint <= now):
+            self._next_checkpoint = now+typing.cast(float,
+                self._checkpoint_interval)
+            self.checkpoint()
+        elif (not self._transaction_start == None and
+                self._transaction_start+(self._commit_interval or 0) <= now):
+            self.commit()
+
+        if not self._next_expiry == None and self._next_expiry <= now:
+            more = self.expire()
+            self._next_expiry = now+(0 if more else self._expiry_interval)
+
+    def group_commit_stats(self) -> typing.Dict[str, int]:
+        return {"commits": self.commits, "writes": self.committed_writes,
+            "pending-writes": self._transaction_writes}
 
     def has_table(self, table_name: str):
         return self._engine.has_table(table_name)
 
+    def _migrate(self):
+        with self._lock:
+            version = self._engine.schema_version()
+        for i, migration in enumerate(MIGRATIONS[version:], version):
+            self._begin()
+            for query in migration:
+                self.execute(query)
+            with self._lock:
+                self._engine.set_schema_version(i+1)
+            self.commit()
+            self.log.info("Migrated database to schema version %d", [i+1])
+
     def make_servers_table(self):
         if not self.has_table("servers"):
             self.execute("""CREATE TABLE servers
@@ -388,8 +1328,6 @@ class Database(object):
                 name TEXT, FOREIGN KEY (server_id) REFERENCES
                 servers (server_id) ON DELETE CASCADE,
                 UNIQUE (server_id, name))""")
-            self.execute("""CREATE INDEX channels_index
-                on channels (server_id, name)""")
     def make_users_table(self):
         if not self.has_table("users"):
             self.execute("""CREATE TABLE users
@@ -397,14 +1335,10 @@ class Database(object):
                 nickname TEXT, FOREIGN KEY (server_id) REFERENCES
                 servers (server_id) ON DELETE CASCADE,
                 UNIQUE (server_id, nickname))""")
-            self.execute("""CREATE INDEX users_index
-                on users (server_id, nickname)""")
     def make_bot_settings_table(self):
         if not self.has_table("bot_settings"):
             self.execute("""CREATE TABLE bot_settings
                 (setting TEXT PRIMARY KEY, value TEXT)""")
-            self.execute("""CREATE INDEX bot_settings_index
-                ON bot_settings (setting)""")
     def make_server_settings_table(self):
         if not self.has_table("server_settings"):
             self.execute("""CREATE TABLE server_settings
@@ -412,24 +1346,18 @@ class Database(object):
                 FOREIGN KEY(server_id) REFERENCES
                 servers(server_id) ON DELETE CASCADE,
                 PRIMARY KEY (server_id, setting))""")
-            self.execute("""CREATE INDEX server_settings_index
-                ON server_settings (server_id, setting)""")
     def make_channel_settings_table(self):
         if not self.has_table("channel_settings"):
             self.execute("""CREATE TABLE channel_settings
                 (channel_id INTEGER, setting TEXT, value TEXT,
                 FOREIGN KEY (channel_id) REFERENCES channels(channel_id)
                 ON DELETE CASCADE, PRIMARY KEY (channel_id, setting))""")
-            self.execute("""CREATE INDEX channel_settings_index
-                ON channel_settings (channel_id, setting)""")
     def make_user_settings_table(self):
         if not self.has_table("user_settings"):
             self.execute("""CREATE TABLE user_settings
                 (user_id INTEGER, setting TEXT, value TEXT,
                 FOREIGN KEY (user_id) REFERENCES users(user_id)
                 ON DELETE CASCADE, PRIMARY KEY (user_id, setting))""")
-            self.execute("""CREATE INDEX user_settings_index ON
-                user_settings (user_id, setting)""")
     def make_user_channel_settings_table(self):
         if not self.has_table("user_channel_settings"):
             self.execute("""CREATE TABLE user_channel_settings
@@ -439,5 +1367,3 @@ class Database(object):
                 (channel_id) REFERENCES channels(channel_id) ON
                 DELETE CASCADE, PRIMARY KEY (user_id, channel_id,
                 setting))""")
-            self.execute("""CREATE INDEX user_channel_settings_index
-                ON user_channel_settings (user_id, channel_id, setting)""")
@@ -1,13 +1,19 @@
-import dataclasses, typing
+import dataclasses, heapq, json, os, threading, time, typing, urllib.parse
 import sqlite3
 
 class DatabaseEngineCursor(object):
     def execute(self, query: str, args: typing.List[str]):
         pass
+    def executemany(self, query: str,
+            args: typing.Iterable[typing.List[typing.Any]]):
+        pass
     def fetchone(self) -> typing.Any:
         pass
     def fetchall(self) -> typing.List[typing.Any]:
         pass
+    def inserted_id(self) -> typing.Optional[int]:
+        # id of the row the last INSERT added, None if it didn't add one
+        pass
 
 class DatabaseEngine(object):
     def config(self, hostname: str=None, port: int=None, path: str=None,
@@ -20,13 +26,32 @@ class DatabaseEngine(object):
 
     def database_name(self):
         return self.path
-    def connect(self):
+    def connect(self, read_only: bool=False):
         pass
+    def reader(self) -> typing.Optional["DatabaseEngine"]:
+        # a new read-only connection to the same database, for use on another
+        # thread, or None if that isn't possible
+        return None
+    def concurrent_reads(self) -> bool:
+        # whether readers on other connections can run alongside writes
+        return False
     def cursor(self) -> DatabaseEngineCursor:
         pass
     def has_table(self, name: str):
         pass
 
+    def tune(self, options: typing.Dict[str, str]):
+        pass
+    def tuning(self) -> typing.Dict[str, typing.Any]:
+        return {}
+    def checkpoint(self):
+        pass
+
+    def schema_version(self) -> int:
+        return 0
+    def set_schema_version(self, version: int):
+        pass
+
     def execute(self, query: str, args: typing.List[str]):
         pass
     def fetchone(self, query: str, args: typing.List[str]):
@@ -39,19 +64,78 @@ class SQLite3Cursor(DatabaseEngineCursor):
         self._cursor = cursor
     def execute(self, query: str, args: typing.List[str]):
         self._cursor.execute(query, args)
+    def executemany(self, query: str,
+            args: typing.Iterable[typing.List[typing.Any]]):
+        self._cursor.executemany(query, args)
     def fetchone(self):
         return self._cursor.fetchone()
     def fetchall(self):
         return self._cursor.fetchall()
+    def inserted_id(self) -> typing.Optional[int]:
+        # lastrowid isn't reset by an INSERT that was ignored
+        if self._cursor.rowcount > 0:
+            return self._cursor.lastrowid
+        return None
+def _sqlite3_int(value: str) -> str:
+    return str(int(value))
+def _sqlite3_options(*options: str) -> typing.Callable[[str], str]:
+    def _validate(value: str) -> str:
+        if not value.upper() in options:
+            raise ValueError("'%s' is not one of %s" % (value,
+                ", ".join(options)))
+        return value.upper()
+    return _validate
+
+# [database] config key: (pragma, value validator). pragma values can't be
+# query parameters so they're checked here instead
+SQLITE3_PRAGMAS = {
+    "journal-mode": ("journal_mode", _sqlite3_options("DELETE", "TRUNCATE",
+        "PERSIST", "MEMORY", "WAL", "OFF")),
+    "synchronous": ("synchronous", _sqlite3_options("OFF", "NORMAL", "FULL",
+        "EXTRA")),
+    "cache-size": ("cache_size", _sqlite3_int),
+    "mmap-size": ("mmap_size", _sqlite3_int),
+    "temp-store": ("temp_store", _sqlite3_options("DEFAULT", "FILE",
+        "MEMORY")),
+    "busy-timeout": ("busy_timeout", _sqlite3_int)
+} # type: typing.Dict[str, typing.Tuple[str, typing.Callable[[str], str]]]
+# pragmas that are stored in the database file rather than per connection
+SQLITE3_PERSISTENT_PRAGMAS = set(["journal-mode", "synchronous"])
+
 class SQLite3Engine(DatabaseEngine):
     _connection: sqlite3.Connection
+    _read_only = False
+    _options = {} # type: typing.Dict[str, str]
 
-    def connect(self):
+    def connect(self, read_only: bool=False):
         sqlite3.register_converter("BOOLEAN", lambda v: bool(int(v)))
-        self._connection = sqlite3.connect(self.path,
-            check_same_thread=False, isolation_level=None,
-            detect_types=sqlite3.PARSE_DECLTYPES)
-        self._connection.execute("PRAGMA foreign_keys = ON")
+        self._read_only = read_only
+        path = typing.cast(str, self.path)
+        if read_only:
+            self._connection = sqlite3.connect(
+                "file:%s?mode=ro" % urllib.parse.quote(path), uri=True,
+                check_same_thread=False, isolation_level=None,
+                detect_types=sqlite3.PARSE_DECLTYPES)
+            self._connection.execute("PRAGMA query_only = ON")
+        else:
+            self._connection = sqlite3.connect(path,
+                check_same_thread=False, isolation_level=None,
+                detect_types=sqlite3.PARSE_DECLTYPES)
+            self._connection.execute("PRAGMA foreign_keys = ON")
+
+    def reader(self) -> typing.Optional[DatabaseEngine]:
+        if self.path in ["", ":memory:"]:
+            # every connection to these gets its own, empty, database
+            return None
+        reader = SQLite3Engine()
+        reader.config(path=self.path)
+        reader.connect(read_only=True)
+        reader.tune(self._options)
+        return reader
+    def concurrent_reads(self) -> bool:
+        # outside of WAL mode, a reader stops writes from committing
+        return self._connection.execute("PRAGMA journal_mode"
+            ).fetchone()[0].lower() == "wal"
 
     def has_table(self, name: str):
         cursor = self.cursor()
@@ -62,3 +146,335 @@ class SQLite3Engine(DatabaseEngine):
 
     def cursor(self):
         return SQLite3Cursor(self._connection.cursor())
+
+    def tune(self, options: typing.Dict[str, str]):
+        self._options = options
+        for key, value in options.items():
+            if self._read_only and key in SQLITE3_PERSISTENT_PRAGMAS:
+                continue
+            if key in SQLITE3_PRAGMAS:
+                pragma, validate = SQLITE3_PRAGMAS[key]
+                try:
+                    value = validate(value)
+                except ValueError as e:
+                    raise ValueError("Invalid [database] %s: %s" % (key,
+                        str(e)))
+                self._connection.execute("PRAGMA %s = %s" % (pragma, value))
+    def tuning(self) -> typing.Dict[str, typing.Any]:
+        values = {"foreign-keys": "foreign_keys"}
+        values.update({key: pragma for key, (pragma, _) in
+            SQLITE3_PRAGMAS.items()})
+        return {key: self._connection.execute("PRAGMA %s" % pragma
+            ).fetchone()[0] for key, pragma in values.items()}
+    def checkpoint(self):
+        # passive so we never wait for (or block) readers
+        return self._connection.execute("PRAGMA wal_checkpoint(PASSIVE)"
+            ).fetchone()
+
+    def schema_version(self) -> int:
+        return self._connection.execute("PRAGMA user_version").fetchone()[0]
+    def set_schema_version(self, version: int):
+        self._connection.execute("PRAGMA user_version = %d" % version)
+
+# (*owner ids, setting)
+T_KV_KEY = typing.Tuple[typing.Any, ...]
+T_KV_IDS = typing.Tuple[int, ...]
+# (value offset, value length, record length, expires at)
+T_KV_LOCATION = typing.Tuple[int, int, int, typing.Optional[float]]
+T_KV_INDEX = typing.Dict[T_KV_IDS, typing.Dict[str, T_KV_LOCATION]]
+# (value, expires at)
+T_KV_VALUE = typing.Tuple[str, typing.Optional[float]]
+# (expires at, owner ids, setting)
+T_KV_EXPIRY = typing.Tuple[float, T_KV_IDS, str]
+
+class KeyValueEngine(object):
+    # storage for one settings table, keyed on owner ids and setting name,
+    # with values kept as JSON text. settings past their expiry (unix time)
+    # aren't returned by any of these
+    def get(self, ids: T_KV_IDS, setting: str) -> typing.Optional[T_KV_VALUE]:
+        pass
+    def set(self, ids: T_KV_IDS, setting: str, value: str,
+            expires_at: typing.Optional[float]=None):
+        pass
+    def delete(self, ids: T_KV_IDS, setting: str):
+        pass
+    def delete_owner(self, ids: T_KV_IDS):
+        pass
+
+    def owner(self, ids: T_KV_IDS) -> typing.List[typing.Tuple[str, str]]:
+        # every (setting, value) for the given owner, sorted by setting
+        return []
+    def owners(self) -> typing.List[T_KV_IDS]:
+        return []
+    def find_setting(self, setting: str
+            ) -> typing.List[typing.Tuple[T_KV_IDS, str]]:
+        # every (owner ids, value) for the given setting
+        return []
+    def expired(self, now: float, limit: int
+            ) -> typing.List[typing.Tuple[T_KV_IDS, str]]:
+        # up to `limit` (owner ids, setting) that expired by `now`
+        return []
+
+    def sync(self):
+        pass
+    def compact(self, force: bool=False):
+        pass
+    def close(self):
+        pass
+    def stats(self) -> typing.Dict[str, int]:
+        return {}
+
+# compact a log once at least this many bytes of it are overwritten or
+# deleted records, and they're at least half of it
+LOG_COMPACT_MINIMUM = 4*1024*1024
+# rebuild the expiry heap when stale entries outnumber live ones by this much
+EXPIRY_COMPACT_THRESHOLD = 64
+
+class LogKeyValueEngine(KeyValueEngine):
+    # every change is appended to a file as a line of JSON and the file is
+    # replayed when it's opened. the in-memory index only holds where each
+    # value is in the file, and the file is rewritten without dead records
+    # when they're most of it
+    def __init__(self, path: typing.Optional[str], sync: bool=True):
+        self._path = path
+        self._sync = sync
+        self._lock = threading.Lock()
+        self._index = {} # type: T_KV_INDEX
+        # settings with an expiry. like Scheduler, entries for settings that
+        # have since been changed or deleted are skipped when they're popped
+        self._expiring = [] # type: typing.List[T_KV_EXPIRY]
+        self._expiring_live = 0
+        self._size = 0
+        self._live = 0
+        self._dirty = False
+        self._fd = -1
+        self._memory = bytearray()
+        if not path == None:
+            self._open()
+
+    def _open(self):
+        path = typing.cast(str, self._path)
+        created = not os.path.exists(path)
+        self._fd = os.open(path, os.O_RDWR|os.O_CREAT|os.O_APPEND, 0o600)
+        if created:
+            self._sync_directory()
+        with open(path, "rb") as log:
+            offset = 0
+            for line in log:
+                if not line.endswith(b"\n") or not self._replay(line, offset):
+                    # the end of a write that didn't finish
+                    os.ftruncate(self._fd, offset)
+                    break
+                offset += len(line)
+        self._size = offset
+        self.compact()
+
+    def _replay(self, line: bytes, offset: int) -> bool:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return False
+        op, ids = record[0], tuple(record[1])
+        if op in ["s", "x"]:
+            expires_at = record[3] if op == "x" else None
+            prefix = self._set_prefix(ids, record[2], expires_at)
+            if not line.startswith(prefix):
+                return False
+            self._index_set(ids, record[2], (offset+len(prefix),
+                len(line)-len(prefix)-2, len(line), expires_at))
+        elif op == "d":
+            self._index_delete(ids, record[2])
+        elif op == "o":
+            self._index_delete_owner(ids)
+        return True
+
+    def _set_prefix(self, ids: T_KV_IDS, setting: str,
+            expires_at: typing.Optional[float]) -> bytes:
+        # a set record is this, the value's JSON and "]\n", so the value
+        # can be read straight out of the file
+        if expires_at == None:
+            return ("[\"s\", %s, %s, " % (json.dumps(list(ids)),
+                json.dumps(setting))).encode("utf8")
+        return ("[\"x\", %s, %s, %s, " % (json.dumps(list(ids)),
+            json.dumps(setting), json.dumps(expires_at))).encode("utf8")
+
+    def _index_set(self, ids: T_KV_IDS, setting: str,
+            location: T_KV_LOCATION):
+        self._index_delete(ids, setting)
+        if not ids in self._index:
+            self._index[ids] = {}
+        self._index[ids][setting] = location
+        self._live += location[2]
+        if not location[3] == None:
+            self._expiring_live += 1
+            heapq.heappush(self._expiring, (typing.cast(float, location[3]),
+                ids, setting))
+            if len(self._expiring) > (self._expiring_live*2
+                    )+EXPIRY_COMPACT_THRESHOLD:
+                self._compact_expiring()
+    def _compact_expiring(self):
+        self._expiring = [(typing.cast(float, location[3]), ids, setting)
+            for ids, owner in self._index.items()
+            for setting, location in owner.items()
+            if not location[3] == None]
+        heapq.heapify(self._expiring)
+    def _index_delete(self, ids: T_KV_IDS, setting: str):
+        owner = self._index.get(ids, None)
+        if owner and setting in owner:
+            self._forget(owner.pop(setting))
+            if not owner:
+                del self._index[ids]
+    def _index_delete_owner(self, ids: T_KV_IDS):
+        for location in self._index.pop(ids, {}).values():
+            self._forget(location)
+    def _forget(self, location: T_KV_LOCATION):
+        self._live -= location[2]
+        if not location[3] == None:
+            self._expiring_live -= 1
+
+    def _append(self, data: bytes) -> int:
+        offset = self._size
+        if self._fd == -1:
+            self._memory += data
+        else:
+            os.write(self._fd, data)
+        self._size += len(data)
+        self._dirty = True
+        return offset
+    def _read(self, offset: int, length: int) -> str:
+        if self._fd == -1:
+            data = bytes(self._memory[offset:offset+length])
+        else:
+            data = os.pread(self._fd, length, offset)
+        return data.decode("utf8")
+
+    def _unexpired(self, location: typing.Optional[T_KV_LOCATION],
+            now: float) -> bool:
+        return not location == None and (location[3] == None or
+            typing.cast(float, location[3]) > now)
+    def _live_settings(self, owner: typing.Dict[str, T_KV_LOCATION]
+            ) -> typing.List[typing.Tuple[str, T_KV_LOCATION]]:
+        now = time.time()
+        return [(setting, location) for setting, location in owner.items()
+            if self._unexpired(location, now)]
+
+    def get(self, ids: T_KV_IDS, setting: str) -> typing.Optional[T_KV_VALUE]:
+        with self._lock:
+            location = self._index.get(ids, {}).get(setting, None)
+            if location == None or not self._unexpired(location, time.time()):
+                return None
+            return self._read(location[0], location[1]), location[3]
+    def set(self, ids: T_KV_IDS, setting: str, value: str,
+            expires_at: typing.Optional[float]=None):
+        prefix = self._set_prefix(ids, setting, expires_at)
+        value_bytes = value.encode("utf8")
+        record = prefix+value_bytes+b"]\n"
+        with self._lock:
+            offset = self._append(record)
+            self._index_set(ids, setting, (offset+len(prefix),
+                len(value_bytes), len(record), expires_at))
+    def delete(self, ids: T_KV_IDS, setting: str):
+        with self._lock:
+            if setting in self._index.get(ids, {}):
+                self._append(("%s\n" % json.dumps(["d", list(ids), setting])
+                    ).encode("utf8"))
+                self._index_delete(ids, setting)
+    def delete_owner(self, ids: T_KV_IDS):
+        with self._lock:
+            if ids in self._index:
+                self._append(("%s\n" % json.dumps(["o", list(ids)])
+                    ).encode("utf8"))
+                self._index_delete_owner(ids)
+
+    def owner(self, ids: T_KV_IDS) -> typing.List[typing.Tuple[str, str]]:
+        with self._lock:
+            return [(setting, self._read(location[0], location[1])) for
+                setting, location in sorted(self._live_settings(
+                self._index.get(ids, {})))]
+    def owners(self) -> typing.List[T_KV_IDS]:
+        with self._lock:
+            return list(self._index.keys())
+    def find_setting(self, setting: str
+            ) -> typing.List[typing.Tuple[T_KV_IDS, str]]:
+        now = time.time()
+        with self._lock:
+            return [(ids, self._read(owner[setting][0], owner[setting][1]))
+                for ids, owner in self._index.items() if
+                self._unexpired(owner.get(setting, None), now)]
+    def expired(self, now: float, limit: int
+            ) -> typing.List[typing.Tuple[T_KV_IDS, str]]:
+        expired = [] # type: typing.List[typing.Tuple[T_KV_IDS, str]]
+        with self._lock:
+            while (self._expiring and self._expiring[0][0] <= now and
+                    len(expired) < limit):
+                expires_at, ids, setting = heapq.heappop(self._expiring)
+                location = self._index.get(ids, {}).get(setting, None)
+                if not location == None and location[3] == expires_at:
+                    expired.append((ids, setting))
+        return expired
+
+    def _sync_directory(self):
+        # a new or renamed file's directory entry isn't durable until the
+        # directory itself is fsynced
+        if self._sync:
+            path = typing.cast(str, self._path)
+            directory = os.open(os.path.dirname(os.path.abspath(path)),
+                os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+
+    def sync(self):
+        if self._dirty and self._sync and not self._fd == -1:
+            os.fsync(self._fd)
+        self._dirty = False
+
+    def compact(self, force: bool=False):
+        with self._lock:
+            dead = self._size-self._live
+            if self._fd == -1 or (not force and (dead < LOG_COMPACT_MINIMUM or
+                    dead < self._live)):
+                return
+
+            path = typing.cast(str, self._path)
+            temporary = "%s.compact" % path
+            index = {} # type: T_KV_INDEX
+            offset = 0
+            with open(temporary, "wb") as log:
+                for ids, owner in self._index.items():
+                    index[ids] = {}
+                    for setting, location in owner.items():
+                        prefix = self._set_prefix(ids, setting, location[3])
+                        value = os.pread(self._fd, location[1], location[0])
+                        log.write(prefix+value+b"]\n")
+                        index[ids][setting] = (offset+len(prefix),
+                            location[1], location[2], location[3])
+                        offset += location[2]
+                log.flush()
+                os.fsync(log.fileno())
+            os.replace(temporary, path)
+            self._sync_directory()
+
+            os.close(self._fd)
+            self._fd = os.open(path, os.O_RDWR|os.O_APPEND, 0o600)
+            self._index = index
+            self._size = offset
+            self._dirty = False
+
+    def close(self):
+        self.sync()
+        if not self._fd == -1:
+            os.close(self._fd)
+            self._fd = -1
+
+    def stats(self) -> typing.Dict[str, int]:
+        return {"owners": len(self._index), "settings": sum(len(owner) for
+            owner in self._index.values()), "size": self._size,
+            "live": self._live, "expiring": self._expiring_live}
+
+# [database] *-settings-storage values, None being the database's own tables
+KEY_VALUE_ENGINES = {
+    "sqlite3": None,
+    "log": LogKeyValueEngine
+} # type: typing.Dict[str, typing.Optional[typing.Type[LogKeyValueEngine]]]
@@ -1,4 +1,4 @@
-import itertools, time, traceback, typing
+import bisect, itertools, time, traceback, typing
 from src import Logging, utils
 
 PRIORITY_URGENT = 0
@@ -11,6 +11,10 @@ DEFAULT_PRIORITY = PRIORITY_MEDIUM
 DEFAULT_EVENT_DELIMITER = "."
 DEFAULT_MULTI_DELIMITER = "|"
 
+# upper bounds (milliseconds) of hook duration histogram buckets. there's one
+# more bucket than this for everything slower
+HISTOGRAM_BUCKETS = [0.1, 1.0, 10.0, 100.0, 1000.0]
+
 class Event(object):
     def __init__(self, name: str, kwargs):
         self.name = name
@@ -26,11 +30,43 @@ class Event(object):
         self.eaten = True
 
 CALLBACK_TYPE = typing.Callable[[Event], typing.Any]
+# called with a child's name and its hooks (empty when it's no longer hooked)
+WATCH_CALLBACK_TYPE = typing.Callable[[str, typing.Tuple["EventHook", ...]],
+    None]
+# (event path, hook context)
+STATS_KEY_TYPE = typing.Tuple[str, typing.Optional[str]]
+
+class HookStats(object):
+    __slots__ = ("count", "total", "max", "histogram")
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = 0.0 # milliseconds
+        self.max = 0.0
+        self.histogram = [0]*(len(HISTOGRAM_BUCKETS)+1)
+
+    def add(self, milliseconds: float):
+        self.count += 1
+        self.total += milliseconds
+        if milliseconds > self.max:
+            self.max = milliseconds
+        self.histogram[bisect.bisect_left(HISTOGRAM_BUCKETS,
+            milliseconds)] += 1
+
+    def merge(self, other: "HookStats"):
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        for i, count in enumerate(other.histogram):
+            self.histogram[i] += count
 
 class EventHook(object):
-    def __init__(self, event_name: str, func: CALLBACK_TYPE,
-            context: typing.Optional[str], priority: int,
+    def __init__(self, root: "EventRoot", event_name: str,
+            func: CALLBACK_TYPE, context: typing.Optional[str], priority: int,
             kwargs: typing.List[typing.Tuple[str, typing.Any]]):
+        self._root = root
         self.event_name = event_name
         self.function = func
         self.context = context
@@ -38,6 +74,7 @@ class EventHook(object):
         self.docstring = utils.parse.docstring(func.__doc__ or "")
 
         self.call_count = 0
+        self.stats = HookStats()
         self._kwargs: typing.Dict[str, typing.Any] = {}
         self._multi_kwargs: typing.Dict[str, typing.List[typing.Any]] = {}
         for key, value in kwargs:
@@ -50,7 +87,15 @@ class EventHook(object):
 
     def call(self, event: Event) -> typing.Any:
         self.call_count += 1
-        return self.function(event)
+        start = time.perf_counter()
+        try:
+            return self.function(event)
+        finally:
+            milliseconds = (time.perf_counter()-start)*1000
+            self.stats.add(milliseconds)
+            threshold = self._root.slow_hook_threshold
+            if not threshold == None and milliseconds >= threshold:
+                self._root._slow_hook(self, milliseconds)
 
     def get_kwargs(self, key: str) -> typing.List[typing.Any]:
         if key in self._kwargs:
@@ -65,12 +110,20 @@ class EventHook(object):
     def get_kwarg(self, key: str, default: typing.Any=None) -> typing.Any:
         return (self.get_kwargs(key) or [default])[0]
 
+# an Events is a handle on one event path; hold on to one for an event that's
+# called often so its path string is only worked out once
 class Events(object):
     def __init__(self, root: "EventRoot", path: typing.List[str],
             context: typing.Optional[str]):
         self._root = root
         self._path = path
         self._context = context
+        self._path_str_cache = None # type: typing.Optional[str]
+
+    def _path_str(self) -> str:
+        if self._path_str_cache == None:
+            self._path_str_cache = self._root._path_str(self._path)
+        return typing.cast(str, self._path_str_cache)
 
     def new_root(self):
         return self._root._new_root()
@@ -79,7 +132,7 @@ class Events(object):
         return self._root._new_context(context)
 
     def make_event(self, **kwargs):
-        return self._root._make_event(self._path, kwargs)
+        return self._root._make_event(self._path_str(), kwargs)
 
     def on(self, subname):
         parts = subname.split(DEFAULT_EVENT_DELIMITER)
@@ -96,15 +149,18 @@ class Events(object):
             if key == "priority":
                 priority = value
                 break
-        self._root._hook(self._path, func, self._context, priority, kwargs)
+        self._root._hook(self._path_str(), func, self._context, priority,
+            kwargs)
 
     def call(self, **kwargs):
-        return self._root._call(self._path, kwargs, True, self._context, None)
+        return self._root._call(self._path_str(), kwargs, True, self._context,
+            None)
     def call_unsafe(self, **kwargs):
-        return self._root._call(self._path, kwargs, False, self._context, None)
+        return self._root._call(self._path_str(), kwargs, False,
+            self._context, None)
 
     def _call_limited(self, maximum: int, safe: bool, kwargs):
-        return self._root._call(self._path, kwargs, safe, self._context,
+        return self._root._call(self._path_str(), kwargs, safe, self._context,
             maximum)
     def call_limited(self, maximum: int, **kwargs):
         return self._call_limited(maximum, True, kwargs)
@@ -117,9 +173,12 @@ class Events(object):
         return (self._call_limited(1, False, kwargs) or [default])[0]
 
     def get_children(self):
-        return self._root._get_children(self._path)
+        return self._root._get_children(self._path_str())
     def get_hooks(self):
-        return self._root._get_hooks(self._path)
+        return self._root._get_hooks(self._path_str())
+
+    def watch_children(self, callback: WATCH_CALLBACK_TYPE):
+        self._root._watch_children(self._path_str(), self._context, callback)
 
     def purge_context(self, context: str):
         self._root._purge_context(context)
@@ -127,18 +186,45 @@ class Events(object):
     def all_hooks(self):
         return self._root.all_hooks()
 
+    def hook_stats(self):
+        return self._root._hook_stats()
+    def reset_hook_stats(self):
+        self._root._reset_hook_stats()
+    def set_slow_hook_threshold(self, milliseconds: typing.Optional[float]):
+        self._root.slow_hook_threshold = milliseconds
+
+class PathNode(object):
+    __slots__ = ("children", "hooked")
+    def __init__(self):
+        self.children = {} # type: typing.Dict[str, PathNode]
+        # whether there are hooks for the path that ends at this node
+        self.hooked = False
+
 class EventRoot(object):
-    def __init__(self, log: Logging.Log):
+    def __init__(self, log: Logging.Log,
+            slow_hook_threshold: typing.Optional[float]=None):
         self.log = log
-        self._hooks: typing.Dict[str, typing.List[EventHook]] = {}
-
-    def _make_event(self, path: typing.List[str], kwargs: dict):
-        return Event(self._path_str(path), kwargs)
+        # log any one hook call that takes this many milliseconds or more
+        self.slow_hook_threshold = slow_hook_threshold
+        # hook tuples are never changed in place, only replaced, so a call can
+        # iterate the tuple it started with without copying it
+        self._hooks: typing.Dict[str, typing.Tuple[EventHook, ...]] = {}
+        # context: paths that context has hooks on
+        self._context_paths: typing.Dict[typing.Optional[str],
+            typing.Set[str]] = {}
+        # every path in _hooks, split on DEFAULT_EVENT_DELIMITER
+        self._path_tree = PathNode()
+        # path: (context, callback) for each watcher of that path's children
+        self._watchers: typing.Dict[str, typing.List[typing.Tuple[
+            typing.Optional[str], WATCH_CALLBACK_TYPE]]] = {}
+
+    def _make_event(self, path_str: str, kwargs: dict):
+        return Event(path_str, kwargs)
 
     def _new_context(self, context: str):
         return Events(self, [], context)
     def _new_root(self):
-        return EventRoot(self.log).wrap()
+        return EventRoot(self.log, self.slow_hook_threshold).wrap()
 
     def wrap(self):
         return Events(self, [], None)
@@ -147,55 +233,108 @@ class EventRoot(object):
         path_lower = [p.lower() for p in path]
         return DEFAULT_EVENT_DELIMITER.join(path_lower)
 
-    def _hook(self, path: typing.List[str], func: CALLBACK_TYPE,
+    def _hook(self, path_str: str, func: CALLBACK_TYPE,
             context: typing.Optional[str], priority: int,
             kwargs: typing.List[typing.Tuple[str, typing.Any]] = []
             ) -> EventHook:
-        path_str = self._path_str(path)
-        new_hook = EventHook(path_str, func, context, priority, kwargs)
+        new_hook = EventHook(self, path_str, func, context, priority, kwargs)
+        hooks = self._hooks.get(path_str, ())
 
-        if not path_str in self._hooks:
-            self._hooks[path_str] = []
-        hook_array = self._hooks[path_str]
-
-        hooked = False
-        for i, other_hook in enumerate(hook_array):
+        index = len(hooks)
+        for i, other_hook in enumerate(hooks):
             if other_hook.priority >= new_hook.priority:
-                hooked = True
-                hook_array.insert(i, new_hook)
+                index = i
                 break
-        if not hooked:
-            hook_array.append(new_hook)
+        self._hooks[path_str] = hooks[:index]+(new_hook,)+hooks[index:]
+
+        if not hooks:
+            self._tree_add(path_str)
+        if not context in self._context_paths:
+            self._context_paths[context] = set([])
+        self._context_paths[context].add(path_str)
+        self._hooks_changed(path_str)
         return new_hook
 
-    def _call(self, path: typing.List[str], kwargs: dict, safe: bool,
+    def _watch_children(self, path_str: str, context: typing.Optional[str],
+            callback: WATCH_CALLBACK_TYPE):
+        if not path_str in self._watchers:
+            self._watchers[path_str] = []
+        self._watchers[path_str].append((context, callback))
+
+        for child in self._get_children(path_str):
+            if not DEFAULT_EVENT_DELIMITER in child:
+                callback(child, self._hooks[DEFAULT_EVENT_DELIMITER.join(
+                    [path_str, child])])
+    def _hooks_changed(self, path_str: str):
+        parent, _, child = path_str.rpartition(DEFAULT_EVENT_DELIMITER)
+        if parent in self._watchers:
+            hooks = self._hooks.get(path_str, ())
+            for context, callback in self._watchers[parent]:
+                callback(child, hooks)
+
+    def _tree_add(self, path_str: str):
+        node = self._path_tree
+        for part in path_str.split(DEFAULT_EVENT_DELIMITER):
+            if not part in node.children:
+                node.children[part] = PathNode()
+            node = node.children[part]
+        node.hooked = True
+    def _tree_remove(self, path_str: str):
+        nodes = [self._path_tree]
+        parts = path_str.split(DEFAULT_EVENT_DELIMITER)
+        for part in parts:
+            nodes.append(nodes[-1].children[part])
+        nodes[-1].hooked = False
+
+        # prune nodes that no longer lead to any hooks
+        for i in range(len(parts), 0, -1):
+            if nodes[i].hooked or nodes[i].children:
+                break
+            del nodes[i-1].children[parts[i-1]]
+    def _tree_find(self, path_str: str) -> typing.Optional[PathNode]:
+        node = self._path_tree
+        for part in path_str.split(DEFAULT_EVENT_DELIMITER):
+            if not part in node.children:
+                return None
+            node = node.children[part]
+        return node
+
+    def _call(self, path_str: str, kwargs: dict, safe: bool,
             context: typing.Optional[str], maximum: typing.Optional[int]
             ) -> typing.List[typing.Any]:
         if not utils.is_main_thread():
             raise RuntimeError("Can't call events outside of main thread")
 
         returns: typing.List[typing.Any] = []
-        path_str = self._path_str(path)
+        tracing = self.log.tracing(path_str)
         if not path_str in self._hooks:
-            self.log.trace("not calling non-hooked event \"%s\" (params: %s)",
-                [path_str, str(kwargs)])
+            if tracing:
+                self.log.trace(
+                    "not calling non-hooked event \"%s\" (params: %s)",
+                    [path_str, kwargs], subject=path_str)
             return returns
 
-        self.log.trace("calling event: \"%s\" (params: %s)",
-            [path_str, str(kwargs)])
-        start = time.monotonic()
+        if tracing:
+            self.log.trace("calling event: \"%s\" (params: %s)",
+                [path_str, kwargs], subject=path_str)
+            start = time.monotonic()
+
+        # hooks added while calling this event aren't called by this loop
+        all_hooks = self._hooks[path_str]
+        hooks = all_hooks[:maximum] if maximum else all_hooks
+        event = self._make_event(path_str, kwargs)
 
-        # .copy() hooks so we don't call new hooks in this loop
-        mutable_hooks = self._hooks[path_str]
-        hooks = mutable_hooks.copy()
-        if maximum:
-            hooks = hooks[:maximum]
-        event = self._make_event(path, kwargs)
+        # only built if the event's hooks change while it's being called
+        current_hooks = all_hooks
+        current_set = set([]) # type: typing.Set[EventHook]
 
         for hook in hooks:
             if event.eaten:
                 break
-            if not hook in mutable_hooks:
+            if not self._hooks.get(path_str, ()) is current_hooks:
+                current_hooks = self._hooks.get(path_str, ())
+                current_set = set(current_hooks)
+            if not current_hooks is all_hooks and not hook in current_set:
                 # this hook has been removed while handling this event
                 continue
 
@@ -210,38 +349,68 @@ class EventRoot(object):
                     raise
             returns.append(returned)
 
-        total_milliseconds = (time.monotonic() - start) * 1000
-        self.log.trace("event \"%s\" called in %fms",
-            [path_str, total_milliseconds])
+        if tracing:
+            total_milliseconds = (time.monotonic() - start) * 1000
+            self.log.trace("event \"%s\" called in %fms",
+                [path_str, total_milliseconds], subject=path_str)
 
         return returns
 
     def _purge_context(self, context: str):
-        context_hooks: typing.Dict[str, typing.List[EventHook]] = {}
-        for path in self._hooks.keys():
-            for hook in self._hooks[path]:
-                if hook.context == context:
-                    if not path in context_hooks:
-                        context_hooks[path] = []
-                    context_hooks[path].append(hook)
-        for path in context_hooks:
-            for hook in context_hooks[path]:
-                self._hooks[path].remove(hook)
-                if not self._hooks[path]:
-                    del self._hooks[path]
-
-    def _get_children(self, path):
-        path_prefix = "%s%s" % (self._path_str(path), DEFAULT_EVENT_DELIMITER)
-        matches = []
-        for key in self._hooks.keys():
-            if key.startswith(path_prefix):
-                matches.append(key.replace(path_prefix, "", 1))
+        for path, watchers in list(self._watchers.items()):
+            kept_watchers = [w for w in watchers if not w[0] == context]
+            if kept_watchers:
+                self._watchers[path] = kept_watchers
+            else:
+                del self._watchers[path]
+
+        for path in self._context_paths.pop(context, set([])):
+            hooks = self._hooks[path]
+            kept = tuple(hook for hook in hooks if not hook.context == context)
+            if not kept:
+                del self._hooks[path]
+                self._tree_remove(path)
+            else:
+                self._hooks[path] = kept
+            self._hooks_changed(path)
+
+    def _get_children(self, path_str: str):
+        # every hooked path under `path_str`, relative to it
+        node = self._tree_find(path_str)
+        matches = [] # type: typing.List[str]
+        if not node == None:
+            stack = [("", typing.cast(PathNode, node))]
+            while stack:
+                prefix, node = stack.pop()
+                for part, child in node.children.items():
+                    child_path = "%s%s" % (prefix, part)
+                    if child.hooked:
+                        matches.append(child_path)
+                    stack.append(("%s%s" % (child_path,
+                        DEFAULT_EVENT_DELIMITER), child))
         return matches
-    def _get_hooks(self, path):
-        path_str = self._path_str(path)
-        if path_str in self._hooks:
-            return self._hooks[path_str][:]
-        return []
+    def _get_hooks(self, path_str: str) -> typing.Sequence[EventHook]:
+        return self._hooks.get(path_str, ())
 
     def all_hooks(self):
         return self._hooks.copy()
+
+    def _slow_hook(self, hook: EventHook, milliseconds: float):
+        self.log.warn("slow hook for \"%s\" (context %s): %fms",
+            [hook.event_name, hook.context, milliseconds])
+
+    def _hook_stats(self) -> typing.Dict[STATS_KEY_TYPE, HookStats]:
+        # merged stats for all of a context's hooks on each event path
+        stats = {} # type: typing.Dict[STATS_KEY_TYPE, HookStats]
+        for path, hooks in self._hooks.items():
+            for hook in hooks:
+                if hook.stats.count:
+                    key = (path, hook.context)
+                    if not key in stats:
+                        stats[key] = HookStats()
+                    stats[key].merge(hook.stats)
+        return stats
+    def _reset_hook_stats(self):
+        for hooks in self._hooks.values():
+            for hook in hooks:
+                hook.stats.reset()
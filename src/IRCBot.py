@@ -4,10 +4,20 @@ with open("VERSION", "r") as version_file:
 SOURCE: str = "https://git.io/bitbot"
 URL: str = "https://bitbot.dev"
 
-import enum, queue, os, queue, select, socket, sys, threading, time, traceback
-import typing, uuid
-from src import Config, EventManager, Exports, IRCServer, Logging
-from src import ModuleManager, PollHook, PollSource, Socket, Timers, utils
+import collections, enum, queue, os, queue, select, socket, sys, threading
+import time, traceback, typing, uuid
+from src import Config, Database, EventManager, Exports, IRCLine, IRCServer
+from src import Logging, ModuleManager, PollHook, PollSource, Reactor
+from src import Scheduler, Socket, Timers, utils
+
+IO_MODE_THREADED = "threaded"
+IO_MODE_REACTOR = "reactor"
+IO_MODES = [IO_MODE_THREADED, IO_MODE_REACTOR]
+
+# how many queued events to handle between each _check()
+EVENT_BATCH_SIZE = 100
+# how long (milliseconds) to spend handling queued events between each _check()
+EVENT_BATCH_BUDGET = 50
 
 class TriggerResult(enum.Enum):
     Return = 1
@@ -22,20 +32,9 @@ class TriggerEvent(object):
         self.type = type
         self.callback = callback
 
-class ListLambdaPollHook(PollHook.PollHook):
-    def __init__(self,
-            collection: typing.Callable[[], typing.Iterable[typing.Any]],
-            func: typing.Callable[[typing.Any], None]):
-        self._collection = collection
-        self._func = func
-    def next(self):
-        timeouts = [self._func(i) for i in self._collection()]
-        timeouts = [t for t in timeouts if t is not None]
-        return min(timeouts or [None])
-
 class Bot(object):
     def __init__(self, directory, data_directory, args, cache, config, database,
-            events, exports, log, modules, timers):
+            events, exports, log, modules, scheduler, timers):
         self.directory = directory
         self.data_directory = data_directory
         self.args = args
@@ -46,6 +45,7 @@ class Bot(object):
         self._exports = exports
         self.log = log
         self.modules = modules
+        self.scheduler = scheduler
         self._timers = timers
 
         self.start_time = time.time()
@@ -55,6 +55,11 @@ class Bot(object):
         self.reconnections = {}
 
         self._event_queue = queue.Queue() # type: typing.Queue[TriggerEvent]
+        self._event_batches = 0
+        self._event_batch_items = 0
+        self._event_batch_last = 0
+        self._event_batch_max = 0
+        self._event_queue_max = 0
 
         self._read_poll = select.poll()
         self._write_poll = select.poll()
@@ -69,17 +74,32 @@ class Bot(object):
         self._read_thread = None
         self._write_thread = None
 
-        self._poll_timeouts = [] # typing.List[PollHook.PollHook]
-        self._poll_timeouts.append(ListLambdaPollHook(
-            lambda: self.servers.values(),
-            lambda server: server.until_read_timeout()))
+        self._io_mode = config.get("io-mode", IO_MODE_THREADED).lower()
+        if not self._io_mode in IO_MODES:
+            raise ValueError("Unknown io-mode '%s'" % self._io_mode)
+
+        self._reactor = None # type: typing.Optional[Reactor.Reactor]
+        self._reactor_selecting = False
+        # servers whose read/write interest might have changed since the
+        # reactor last looked, or whether all of them might have
+        self._reactor_servers = set([]) # type: typing.Set[IRCServer.Server]
+        self._reactor_all_servers = True
+        self._reactor_sources_dirty = True
+        self._reactor_sources = {
+            } # type: typing.Dict[int, PollSource.PollSource]
+        if self._io_mode == IO_MODE_REACTOR:
+            self._reactor = Reactor.Reactor()
+            self._reactor.set_interest(self._rtrigger_server.fileno(),
+                Reactor.READ)
+
+        # servers that have called disconnect(), possibly from another thread
+        self._disconnected = collections.deque(
+            ) # type: typing.Deque[IRCServer.Server]
+        # servers that might be able to move lines out of their throttle queue
+        self._throttle_checks = set([]) # type: typing.Set[IRCServer.Server]
 
-        self._poll_timeouts.append(ListLambdaPollHook(
-            lambda: self.servers.values(),
-            lambda server: server.until_next_ping()))
-
-        self._poll_timeouts.append(ListLambdaPollHook(
-            lambda: self.servers.values(), self._throttle_timeout))
+        self._poll_timeouts = [] # typing.List[PollHook.PollHook]
+        self._poll_timeouts.append(self.scheduler)
 
         self._poll_sources = [] # typing.List[PollSource.PollSource]
 
@@ -87,21 +107,86 @@ class Bot(object):
         self._poll_timeouts.append(hook)
     def add_poll_source(self, source: PollSource.PollSource):
         self._poll_sources.append(source)
-
-    def _throttle_timeout(self, server: IRCServer.Server):
-        if server.socket.waiting_throttled_send():
-            return server.socket.send_throttle_timeout()
-        return None
+        self._reactor_sources_dirty = True
+
+    def check_throttle(self, server: IRCServer.Server):
+        self._throttle_checks.add(server)
+
+    def _check_throttle(self, server: IRCServer.Server):
+        if not self.get_server_by_fileno(server.fileno()) is server:
+            return
+
+        socket = server.socket
+        if not socket.waiting_throttled_send():
+            return
+
+        if socket.throttle_done():
+            socket._fill_throttle()
+            self.trigger_write(server)
+
+        if (socket.waiting_throttled_send() and
+                not socket.waiting_immediate_send()):
+            # if we're waiting on a write, _post_send() will check again
+            self.scheduler.schedule((server, "throttle"),
+                socket.send_throttle_timeout(),
+                lambda: self._check_throttle(server))
+
+    def server_disconnected(self, server: IRCServer.Server):
+        self._disconnected.append(server)
+        if not utils.is_main_thread():
+            # wake up the main thread so it deals with this promptly
+            self._event_queue.put(TriggerEvent(TriggerEventType.Action,
+                lambda: None))
+            if not self._reactor == None:
+                self.trigger_read()
+
+    def _schedule_server_timeout(self, server: IRCServer.Server):
+        timeout = server.until_read_timeout()
+        next_ping = server.until_next_ping()
+        if next_ping == None:
+            # we've sent a PING, look again later in case it was answered
+            next_ping = IRCServer.PING_INTERVAL_SECONDS
+
+        self.scheduler.schedule((server, "timeout"),
+            min(timeout, typing.cast(float, next_ping)),
+            lambda: self._server_timeout(server))
+    def _server_timeout(self, server: IRCServer.Server):
+        if not self.get_server_by_fileno(server.fileno()) is server:
+            return
+
+        if server.read_timed_out():
+            self.log.warn("Pinged out from %s", [str(server)])
+            server.disconnect()
+            return
+        elif server.ping_due() and not server.ping_sent:
+            server.send_ping()
+            server.ping_sent = True
+        self._schedule_server_timeout(server)
 
     def _trigger_both(self):
         self.trigger_read()
         self.trigger_write()
     def trigger_read(self):
+        if not self._reactor == None:
+            if utils.is_main_thread() and not self._reactor_selecting:
+                # the main thread isn't blocked in select() (we're not in a
+                # signal handler) so there's nothing to wake up
+                return
+
         with self._rtrigger_lock:
             if not self._rtriggered:
                 self._rtriggered = True
                 self._rtrigger_client.send(b"TRIGGER")
-    def trigger_write(self):
+    def trigger_write(self, server: typing.Optional[IRCServer.Server]=None):
+        if not self._reactor == None:
+            if not utils.is_main_thread():
+                # changes from other threads aren't tracked per server
+                self._reactor_all_servers = True
+                self.trigger_read()
+            elif not server == None:
+                self._reactor_servers.add(server)
+            return
+
         with self._write_condition:
             self._write_condition.notify()
 
@@ -125,9 +210,15 @@ class Bot(object):
             except Exception as e:
                 returned = e
                 type = TriggerResult.Exception
+            # the caller is on another thread and expects anything `func`
+            # wrote to have been committed by the time we return
+            self.database.commit()
             func_queue.put([type, returned])
         event_item = TriggerEvent(TriggerEventType.Action, _action)
         self._event_queue.put(event_item)
+        if not self._reactor == None:
+            # wake the reactor up so it sees the queued action
+            self.trigger_read()
 
         type, returned = func_queue.get(block=True)
 
@@ -177,6 +268,11 @@ class Bot(object):
             *self.database.servers.get(server_id))
         connection_params.args = connection_param_args
 
+        # load this server's user and channel ids now rather than when the
+        # first burst of JOINs/NAMES arrives
+        self.database.users.preload(server_id)
+        self.database.channels.preload(server_id)
+
         new_server = IRCServer.Server(self, self._events,
             connection_params.id, connection_params.alias, connection_params)
         self._events.on("new.server").call(server=new_server)
@@ -188,6 +284,9 @@ class Bot(object):
 
         return new_server
 
+    def get_server_by_fileno(self, fileno: int
+            ) -> typing.Optional[IRCServer.Server]:
+        return self.servers.get(fileno, None)
     def get_server_by_id(self, id: int) -> typing.Optional[IRCServer.Server]:
         for server in self.servers.values():
             if server.id == id:
@@ -213,19 +312,40 @@ class Bot(object):
             self.log.debug("Connection failure reason:", exc_info=True)
             return False
         self.servers[server.fileno()] = server
-        self._read_poll.register(server.fileno(), select.POLLIN)
+        if not self._reactor == None:
+            self._reactor.forget(server.fileno())
+            self._reactor_servers.add(server)
+        else:
+            self._read_poll.register(server.fileno(), select.POLLIN)
+        self._schedule_server_timeout(server)
+        self.check_throttle(server)
         return True
 
-    def get_poll_timeout(self) -> float:
+    def get_poll_timeout(self) -> typing.Optional[float]:
+        if (self._throttle_checks or self._disconnected or
+                not self._event_queue.empty()):
+            # _check() has work to do right away
+            return 0
+
         timeouts = []
         for poll_timeout in self._poll_timeouts:
-            timeouts.append(poll_timeout.next())
+            timeout = poll_timeout.next()
+            if not timeout == None:
+                timeouts.append(timeout)
 
-        min_secs = min([timeout for timeout in timeouts if not timeout == None])
-        return max([min_secs, 0])
+        if not timeouts:
+            return None
+        return max([min(timeouts), 0])
 
     def disconnect(self, server: IRCServer.Server):
         del self.servers[server.fileno()]
+        self.scheduler.unschedule((server, "timeout"))
+        self.scheduler.unschedule((server, "throttle"))
+        self._throttle_checks.discard(server)
+        if not self._reactor == None:
+            self._reactor.forget(server.fileno())
+            self._reactor_servers.discard(server)
+        IRCLine.HOSTMASKS.flush()
         self._trigger_both()
 
     def _timed_reconnect(self, timer: Timers.Timer):
@@ -249,8 +369,10 @@ class Bot(object):
             return True
         return False
 
-    def set_setting(self, setting: str, value: typing.Any):
-        self.database.bot_settings.set(setting, value)
+    def set_setting(self, setting: str, value: typing.Any,
+            ttl: typing.Optional[float]=None):
+        # settings with a `ttl` (seconds) are deleted once it's passed
+        self.database.bot_settings.set(setting, value, ttl)
     def get_setting(self, setting: str, default: typing.Any=None) -> typing.Any:
         return self.database.bot_settings.get(setting, default)
     def find_settings(self, pattern: str=None, prefix: str=None,
@@ -265,6 +387,18 @@ class Bot(object):
     def del_setting(self, setting: str):
         self.database.bot_settings.delete(setting)
 
+    def set_settings(self, settings: typing.Dict[str, typing.Any],
+            ttl: typing.Optional[float]=None):
+        self.database.bot_settings.set_many(settings.items(), ttl)
+    def get_settings(self, settings: typing.List[str],
+            default: typing.Any=None) -> typing.Dict[str, typing.Any]:
+        values = self.database.bot_settings.get_many(
+            [[setting] for setting in settings], default)
+        return dict(zip(settings, values))
+    def del_settings(self, settings: typing.List[str]):
+        self.database.bot_settings.delete_many(
+            [[setting] for setting in settings])
+
     def _daemon_thread(self, target: typing.Callable[[], None]):
         thread = threading.Thread(target=target)
         thread.daemon = True
@@ -275,6 +409,10 @@ class Bot(object):
         self._writing = True
         self._reading = True
 
+        if not self._reactor == None:
+            self._reactor_loop()
+            return
+
         self._read_thread = self._daemon_thread(
             lambda: self._loop_catch("read", self._read_loop))
         self._write_thread = self._daemon_thread(
@@ -283,6 +421,7 @@ class Bot(object):
 
     def stop(self, reason: str="Stopping"):
         self._reading = False # disable read thread
+        self._reactor_all_servers = True
         self.trigger_read()
         for server in self.servers.values():
             line = server.send_quit(reason)
@@ -298,6 +437,7 @@ class Bot(object):
     def _kill(self):
         self._writing = False
         self._reading = False
+        self._reactor_all_servers = True
         self._trigger_both()
 
     def _event_loop(self):
@@ -308,21 +448,187 @@ class Bot(object):
                     timeout=self.get_poll_timeout())
             except queue.Empty:
                 # caused by timeout being hit.
+                self._check()
+                continue
+
+            if not self._handle_batch(item):
+                break
+            self._check()
+
+    def _handle_batch(self, item: typing.Optional[TriggerEvent]=None) -> bool:
+        # handle `item` and then drain whatever else is queued, up to a
+        # count/time limit, so _check() runs once per batch and not per event
+        batch_size = int(self.config.get("event-batch-size", EVENT_BATCH_SIZE))
+        budget = float(self.config.get("event-batch-budget",
+            EVENT_BATCH_BUDGET))/1000
+        deadline = time.monotonic()+budget
+
+        depth = self._event_queue.qsize()+int(not item == None)
+        self._event_queue_max = max(self._event_queue_max, depth)
+
+        handled = 0
+        running = True
+        while True:
+            if item == None:
+                try:
+                    item = self._event_queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            handled += 1
+            running = self._handle_event(item)
+            item = None
+            if (not running or
+                    handled >= batch_size or
+                    time.monotonic() >= deadline):
+                break
+
+        if handled:
+            self._event_batches += 1
+            self._event_batch_items += handled
+            self._event_batch_last = handled
+            self._event_batch_max = max(self._event_batch_max, handled)
+        return running
+
+    def slow_hook_threshold(self) -> typing.Optional[float]:
+        threshold = self.config.get("slow-hook-threshold", None)
+        return float(threshold) if threshold else None
+
+    def group_commit(self) -> typing.Tuple[typing.Optional[float], int]:
+        interval = self.config.get("group-commit", None)
+        writes = self.config.get("group-commit-writes", None)
+        return ((float(interval)/1000 if interval else None),
+            int(writes or Database.GROUP_COMMIT_WRITES))
+
+    def settings_cache_size(self) -> int:
+        return int(self.config.get("settings-cache-size", None) or
+            Database.SETTINGS_CACHE_SIZE)
+
+    def event_queue_stats(self) -> typing.Dict[str, int]:
+        return {
+            "queue-depth": self._event_queue.qsize(),
+            "queue-depth-max": self._event_queue_max,
+            "batches": self._event_batches,
+            "events": self._event_batch_items,
+            "batch-size-last": self._event_batch_last,
+            "batch-size-max": self._event_batch_max
+        }
+
+    def _handle_event(self, item):
+        if item.type == TriggerEventType.Action:
+            try:
+                item.callback()
+            except:
+                self._kill()
+                raise
+        elif item.type == TriggerEventType.Kill:
+            self._kill()
+            if not item.callback == None:
+                item.callback()
+            return False
+        return True
+
+    def _reactor_sync(self):
+        reactor = typing.cast(Reactor.Reactor, self._reactor)
+
+        if self._reactor_all_servers:
+            self._reactor_all_servers = False
+            servers = list(self.servers.values())
+        else:
+            servers = list(self._reactor_servers)
+        self._reactor_servers.clear()
+
+        for server in servers:
+            fd = server.fileno()
+            if not self.servers.get(fd, None) is server:
                 continue
+            mask = 0
+            if self._reading:
+                mask |= Reactor.READ
+            if (self._writing and server.socket.connected and
+                    server.socket.waiting_immediate_send()):
+                mask |= Reactor.WRITE
+            reactor.set_interest(fd, mask)
+
+        if self._reactor_sources_dirty:
+            self._reactor_sources_dirty = False
+            masks = {} # type: typing.Dict[int, int]
+            sources = {} # type: typing.Dict[int, PollSource.PollSource]
+            for poll_source in self._poll_sources:
+                if self._reading:
+                    for fileno in poll_source.get_readables():
+                        masks[fileno] = masks.get(fileno, 0)|Reactor.READ
+                        sources[fileno] = poll_source
+                for fileno in poll_source.get_writables():
+                    masks[fileno] = masks.get(fileno, 0)|Reactor.WRITE
+                    sources[fileno] = poll_source
+
+            for fileno in list(self._reactor_sources.keys()):
+                if not fileno in sources:
+                    reactor.forget(fileno)
+            for fileno, mask in masks.items():
+                reactor.set_interest(fileno, mask)
+            self._reactor_sources = sources
+
+    def _reactor_loop(self):
+        reactor = typing.cast(Reactor.Reactor, self._reactor)
+        trigger_fd = self._rtrigger_server.fileno()
+
+        while ((self._writing or self._reading) or
+                not self._event_queue.empty()):
+            self._reactor_sync()
+
+            self._reactor_selecting = True
+            try:
+                events = reactor.select(self.get_poll_timeout())
             finally:
-                self._check()
+                self._reactor_selecting = False
 
-            if item.type == TriggerEventType.Action:
+            for fd, mask in events:
                 try:
-                    item.callback()
+                    if fd == trigger_fd:
+                        # throw away data from trigger socket
+                        with self._rtrigger_lock:
+                            self._rtrigger_server.recv(1024)
+                            self._rtriggered = False
+                    elif fd in self.servers:
+                        self._reactor_server(self.servers[fd], mask)
+                    elif fd in self._reactor_sources:
+                        self._reactor_sources_dirty = True
+                        source = self._reactor_sources[fd]
+                        if mask & Reactor.READ:
+                            source.is_readable(fd)
+                        if mask & Reactor.WRITE:
+                            source.is_writable(fd)
+                    else:
+                        reactor.forget(fd)
                 except:
                     self._kill()
                     raise
-            elif item.type == TriggerEventType.Kill:
-                self._kill()
-                if not item.callback == None:
-                    item.callback()
-                break
+
+            if not self._handle_batch():
+                return
+
+            self._check()
+
+    def _reactor_server(self, server: IRCServer.Server, mask: int):
+        self._reactor_servers.add(server)
+
+        if mask & Reactor.READ and self._reading:
+            lines = server.read()
+            if lines == None:
+                server.disconnect()
+                return
+            server._post_read(typing.cast(typing.List[str], lines))
+
+        if (mask & Reactor.WRITE and server.socket.connected and
+                server.socket.waiting_immediate_send()):
+            try:
+                sent_lines = server._send()
+            except:
+                self.log.error("Failed to write to %s", [str(server)])
+                raise
+            server._post_send(sent_lines)
 
     def _post_send_factory(self, server, lines):
         return lambda: server._post_send(lines)
@@ -430,34 +736,29 @@ class Bot(object):
             if poll_timeout.next() == 0:
                 poll_timeout.call()
 
-        throttle_filled = False
-        for server in list(self.servers.values()):
-            if server.read_timed_out():
-                self.log.warn("Pinged out from %s", [str(server)])
-                server.disconnect()
-            elif server.ping_due() and not server.ping_sent:
-                server.send_ping()
-                server.ping_sent = True
-
-            if not server.socket.connected:
-                self._events.on("server.disconnect").call(server=server)
-                self.disconnect(server)
-
-                if not self.get_server_by_id(server.id):
-                    reconnect_delay = self.config.get("reconnect-delay", 10)
-
-                    timer = self._timers.add("timed-reconnect",
-                        self._timed_reconnect, reconnect_delay,
-                        server_id=server.id)
-                    self.reconnections[server.id] = timer
-
-                    self.log.warn(
-                        "Disconnected from %s, reconnecting in %d seconds",
-                        [str(server), reconnect_delay])
-            elif (server.socket.waiting_throttled_send() and
-                    server.socket.throttle_done()):
-                server.socket._fill_throttle()
-                throttle_filled = True
-
-        if throttle_filled:
-            self.trigger_write()
+        while self._disconnected:
+            server = self._disconnected.popleft()
+            if not self.get_server_by_fileno(server.fileno()) is server:
+                # already dealt with
+                continue
+
+            self._events.on("server.disconnect").call(server=server)
+            self.disconnect(server)
+
+            if not self.get_server_by_id(server.id):
+                reconnect_delay = self.config.get("reconnect-delay", 10)
+
+                timer = self._timers.add("timed-reconnect",
+                    self._timed_reconnect, reconnect_delay,
+                    server_id=server.id)
+                self.reconnections[server.id] = timer
+
+                self.log.warn(
+                    "Disconnected from %s, reconnecting in %d seconds",
+                    [str(server), reconnect_delay])
+
+        if self._throttle_checks:
+            throttle_checks = self._throttle_checks
+            self._throttle_checks = set([])
+            for server in throttle_checks:
+                self._check_throttle(server)
@@ -7,7 +7,8 @@ class Channels(object):
         self._server = server
         self._bot = bot
         self._events = events
-        self._channels = {} # type: typing.Dict[str, IRCChannel.Channel]
+        self._channels = utils.irc.CaseFoldedDict(
+            server.irc_lower) # type: typing.Dict[str, IRCChannel.Channel]
 
     def __iter__(self) -> typing.Iterable[IRCChannel.Channel]:
         return (channel for channel in self._channels.values())
@@ -27,19 +28,19 @@ class Channels(object):
 
     def get_id(self, channel_name: str, create: bool=True) -> int:
         if create:
-            self._bot.database.channels.add(self._server.id, channel_name)
+            return self._bot.database.channels.add(self._server.id,
+                channel_name)
         return self._bot.database.channels.get_id(self._server.id, channel_name)
 
-    def _name_lower(self, channel_name: str) -> str:
-        return self._server.irc_lower(channel_name)
+    def refold(self):
+        typing.cast(utils.irc.CaseFoldedDict, self._channels).refold()
 
     def contains(self, name: str) -> bool:
-        return (self._server.is_channel(name) and
-            self._name_lower(name) in self._channels)
+        return self._server.is_channel(name) and name in self._channels
 
     def add(self, name: str) -> IRCChannel.Channel:
         id = self.get_id(name)
-        lower = self._name_lower(name)
+        lower = self._server.irc_lower(name)
         new_channel = IRCChannel.Channel(lower, id, self._server, self._bot)
         self._channels[lower] = new_channel
         self._events.on("new.channel").call(channel=new_channel,
@@ -47,18 +48,15 @@ class Channels(object):
         return new_channel
 
     def remove(self, channel: IRCChannel.Channel):
-        lower = self._name_lower(channel.name)
-        del self._channels[lower]
+        del self._channels[channel.name]
 
     def get(self, name: str):
-        return self._channels[self._name_lower(name)]
+        return self._channels[name]
 
     def rename(self, old_name, new_name):
-        old_lower = self._name_lower(old_name)
-        new_lower = self._name_lower(new_name)
-
-        channel = self._channels.pop(old_lower)
+        channel = self._channels.pop(old_name)
         channel.name = new_name
         self._channels[new_name] = channel
 
-        self._bot.database.channels.rename(channel.id, new_lower)
+        self._bot.database.channels.rename(channel.id,
+            self._server.irc_lower(new_name))
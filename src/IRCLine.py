@@ -1,11 +1,15 @@
-import codecs, datetime, typing, uuid
+import collections, datetime, typing, uuid
 from src import EventManager, IRCObject, utils
 
 LINE_MAX = 510
+HOSTMASK_CACHE_MAX = 4096
 
 class IRCArgs(object):
+    __slots__ = ("_args", "version")
     def __init__(self, args: typing.List[str]):
         self._args = args
+        # bumped on every change so ParsedLine knows when to re-format
+        self.version = 0
 
     def get(self, index: int) -> typing.Optional[str]:
         if index < 0:
@@ -23,17 +27,23 @@ class IRCArgs(object):
         return self._args[index]
     def __setitem__(self, index: int, value: str):
         self._args[index] = value
+        self.version += 1
 
     def append(self, value: str):
         self._args.append(value)
+        self.version += 1
 
 class Hostmask(object):
+    __slots__ = ("nickname", "username", "hostname", "hostmask")
     def __init__(self, nickname: str, username: str, hostname: str,
             hostmask: str):
-        self.nickname = nickname
-        self.username = username
-        self.hostname = hostname
-        self.hostmask = hostmask
+        # immutable because HostmaskCache shares them between lines
+        object.__setattr__(self, "nickname", nickname)
+        object.__setattr__(self, "username", username)
+        object.__setattr__(self, "hostname", hostname)
+        object.__setattr__(self, "hostmask", hostmask)
+    def __setattr__(self, key: str, value: typing.Any):
+        raise AttributeError("Hostmask objects are immutable")
     def __repr__(self):
         return "Hostmask(%s)" % self.__str__()
     def __str__(self):
@@ -44,6 +54,41 @@ def parse_hostmask(hostmask: str) -> Hostmask:
     username, _, hostname = username.partition("@")
     return Hostmask(nickname, username, hostname, hostmask)
 
+class HostmaskCache(object):
+    def __init__(self, max_size: int=HOSTMASK_CACHE_MAX):
+        self._max_size = max_size
+        self._hostmasks = collections.OrderedDict(
+            ) # type: typing.OrderedDict[str, Hostmask]
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._hostmasks)
+
+    def get(self, hostmask: str) -> Hostmask:
+        parsed = self._hostmasks.get(hostmask, None)
+        if not parsed == None:
+            self._hostmasks.move_to_end(hostmask)
+            self.hits += 1
+            return parsed
+
+        self.misses += 1
+        parsed = parse_hostmask(hostmask)
+        self._hostmasks[hostmask] = parsed
+        if len(self._hostmasks) > self._max_size:
+            self._hostmasks.popitem(last=False)
+        return parsed
+
+    def flush(self):
+        self._hostmasks.clear()
+
+    def stats(self) -> typing.Dict[str, int]:
+        return {"size": len(self._hostmasks), "max-size": self._max_size,
+            "hits": self.hits, "misses": self.misses}
+
+# sources of lines we receive, only used from the main thread
+HOSTMASKS = HostmaskCache()
+
 MESSAGE_TAG_ESCAPED = [r"\:", r"\s", r"\\", r"\r", r"\n"]
 MESSAGE_TAG_UNESCAPED = [";", " ", "\\", "\r", "\n"]
 def message_tag_escape(s):
@@ -55,15 +100,19 @@ def message_tag_unescape(s):
     return unescaped.replace("\\", "")
 
 class ParsedLine(object):
+    __slots__ = ("_id", "_command", "_args", "args", "_source", "_tags",
+        "_formatted", "_formatted_version", "_valid", "_assured")
     def __init__(self, command: str, args: typing.List[str],
             source: Hostmask=None,
             tags: typing.Dict[str, str]=None):
-        self.id = str(uuid.uuid4())
-        self.command = command
+        self._id = None # type: typing.Optional[str]
+        self._formatted = None # type: typing.Optional[typing.Tuple[str, str]]
+        self._formatted_version = 0
+        self._command = command
         self._args = args
         self.args = IRCArgs(args)
-        self.source = source
-        self.tags = tags or {} # type: typing.Dict[str, str]
+        self._source = source # type: typing.Optional[Hostmask]
+        self._tags = tags or {} # type: typing.Dict[str, str]
         self._valid = True
         self._assured = False
 
@@ -72,6 +121,48 @@ class ParsedLine(object):
     def __str__(self):
         return self.format()
 
+    # most lines never have their id looked at, so don't generate one until
+    # something does
+    @property
+    def id(self) -> str:
+        if self._id == None:
+            self._id = str(uuid.uuid4())
+        return typing.cast(str, self._id)
+    @id.setter
+    def id(self, id: str):
+        self._id = id
+
+    # format() is memoised, so anything that can change how this line is
+    # formatted has to throw away what we've memoised
+    def _format_changed(self):
+        self._formatted = None
+
+    @property
+    def command(self) -> str:
+        return self._command
+    @command.setter
+    def command(self, command: str):
+        self._command = command
+        self._format_changed()
+
+    @property
+    def source(self) -> typing.Optional[Hostmask]:
+        return self._source
+    @source.setter
+    def source(self, source: typing.Optional[Hostmask]):
+        self._source = source
+        self._format_changed()
+
+    # change tags through add_tag() or by setting .tags, not by changing the
+    # dict this returns, so the memoised format() is thrown away
+    @property
+    def tags(self) -> typing.Dict[str, str]:
+        return self._tags
+    @tags.setter
+    def tags(self, tags: typing.Dict[str, str]):
+        self._tags = tags
+        self._format_changed()
+
     def valid(self) -> bool:
         return self._valid
     def invalidate(self):
@@ -83,7 +174,8 @@ class ParsedLine(object):
         self._assured = True
 
     def add_tag(self, tag: str, value: str=None):
-        self.tags[tag] = value or ""
+        self._tags[tag] = value or ""
+        self._format_changed()
     def has_tag(self, tag: str) -> bool:
         return "tag" in self.tags
     def get_tag(self, tag: str) -> typing.Optional[str]:
@@ -103,15 +195,19 @@ class ParsedLine(object):
         return ""
 
     def _format(self) -> typing.Tuple[str, str]:
+        if (not self._formatted == None and
+                self._formatted_version == self.args.version):
+            return typing.cast(typing.Tuple[str, str], self._formatted)
+
         pieces = []
         tags = ""
-        if self.tags:
-            tags = self._tag_str(self.tags)
+        if self._tags:
+            tags = self._tag_str(self._tags)
 
-        if self.source:
-            pieces.append(":%s" % str(self.source))
+        if self._source:
+            pieces.append(":%s" % str(self._source))
 
-        pieces.append(self.command.upper())
+        pieces.append(self._command.upper())
 
         if self.args:
             for i, arg in enumerate(self._args):
@@ -121,7 +217,9 @@ class ParsedLine(object):
                 else:
                     pieces.append(arg)
 
-        return tags, " ".join(pieces).replace("\r", "")
+        self._formatted = (tags, " ".join(pieces).replace("\r", ""))
+        self._formatted_version = self.args.version
+        return self._formatted
     def format(self) -> str:
         tags, line = self._format()
         if tags:
@@ -130,6 +228,7 @@ class ParsedLine(object):
             return line
 
 class SendableLine(ParsedLine):
+    __slots__ = ("_margin",)
     def __init__(self, command: str, args: typing.List[str],
             margin: int=0, tags: typing.Dict[str, str]=None):
         ParsedLine.__init__(self, command, args, None, tags)
@@ -137,6 +236,8 @@ class SendableLine(ParsedLine):
 
     def push_last(self, arg: str, extra_margin: int=0,
             human_trunc: bool=False) -> typing.Optional[str]:
+        if not arg:
+            return None
         last_arg = self.args[-1]
         tags, line = self._format()
         n = len(line.encode("utf8")) # get length of current line
@@ -145,19 +246,26 @@ class SendableLine(ParsedLine):
             n += 1                   # +1 for colon on new arg
         n += extra_margin            # used for things like (more ...)
 
-        overflow: typing.Optional[str] = None
-
-        if (n+len(arg.encode("utf8"))) > LINE_MAX:
-            for i, char in enumerate(codecs.iterencode(arg, "utf8")):
-                n += len(char)
-                if n > LINE_MAX:
-                    arg, overflow = arg[:i], arg[i:]
-                    if human_trunc and not overflow[0] == " ":
-                        new_arg, sep, new_overflow = arg.rpartition(" ")
-                        if sep:
-                            arg = new_arg
-                            overflow = new_overflow+overflow
-                    break
+        overflow = None # type: typing.Optional[str]
+
+        # every char is at least one byte, so there's no need to encode more
+        # than one char past what could fit
+        budget = max(0, LINE_MAX-n)
+        arg_encoded = arg[:budget+1].encode("utf8")
+        if (n+len(arg_encoded)) > LINE_MAX:
+            # step back from the byte budget to the start of a utf8 char
+            # (continuation bytes are 0b10xxxxxx)
+            cut = budget
+            while cut > 0 and (arg_encoded[cut] & 0xC0) == 0x80:
+                cut -= 1
+            i = len(arg_encoded[:cut].decode("utf8"))
+
+            arg, overflow = arg[:i], arg[i:]
+            if human_trunc and not overflow[0] == " ":
+                new_arg, sep, new_overflow = arg.rpartition(" ")
+                if sep:
+                    arg = new_arg
+                    overflow = new_overflow+overflow
         if arg:
             self.args[-1] = last_arg+arg
         return overflow
@@ -185,7 +293,7 @@ def parse_line(line: str) -> ParsedLine:
 
     if line[0] == ":":
         source_str, line = line[1:].split(" ", 1)
-        source = parse_hostmask(source_str)
+        source = HOSTMASKS.get(source_str)
 
     command, sep, line = line.partition(" ")
     args = [] # type: typing.List[str]
@@ -213,6 +321,7 @@ class SentLine(IRCObject.Object):
         self.send_time = send_time
         self._hostmask = hostmask
         self.parsed_line = line
+        self._wire = None # type: typing.Optional[bytes]
 
     def __repr__(self) -> str:
         return "IRCLine.SentLine(%s)" % self.__str__()
@@ -222,7 +331,9 @@ class SentLine(IRCObject.Object):
     def _for_wire(self) -> str:
         return str(self.parsed_line)
     def for_wire(self) -> bytes:
-        return b"%s\r\n" % self._for_wire().encode("utf8")
+        if self._wire == None:
+            self._wire = b"%s\r\n" % self._for_wire().encode("utf8")
+        return typing.cast(bytes, self._wire)
 
 class IRCBatch(object):
     def __init__(self, identifier: str, batch_type: str, args: typing.List[str],
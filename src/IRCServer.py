@@ -14,6 +14,10 @@ class Server(IRCObject.Object):
             connection_params: utils.irc.IRCConnectionParameters):
         self.bot = bot
         self.events = events
+        # handles for events we call for every line
+        self._raw_received = events.on("raw.received")
+        self._raw_send = events.on("raw.send")
+        self._preprocess_send = events.on("preprocess.send")
         self.id = id
         self.alias = alias
         self.connection_params = connection_params
@@ -39,7 +43,12 @@ class Server(IRCObject.Object):
         self.server_capabilities = {} # type: typing.Dict[str, str]
         self.batches = {} # type: typing.Dict[str, IRCLine.IRCBatch]
 
-        self.users = {} # type: typing.Dict[str, IRCUser.User]
+        self._case_mapping = "rfc1459"
+        self._case_mapping_table = utils.irc.case_mapping_table(
+            self._case_mapping)
+
+        self.users = utils.irc.CaseFoldedDict(
+            self.irc_lower) # type: typing.Dict[str, IRCUser.User]
         self.channels = IRCChannels.Channels(self, self.bot, self.events)
         self.own_modes = {} # type: typing.Dict[str, typing.Optional[str]]
 
@@ -59,7 +68,6 @@ class Server(IRCObject.Object):
         self.quiet: typing.Optional[typing.List[str]] = None
 
         self.channel_types = ["#"]
-        self.case_mapping = "rfc1459"
         self.statusmsg = [] # type: typing.List[str]
         self.targmax: typing.Dict[str, int] = {}
 
@@ -114,10 +122,12 @@ class Server(IRCObject.Object):
 
     def disconnect(self):
         self.socket.disconnect()
+        self.bot.server_disconnected(self)
 
-    def set_setting(self, setting: str, value: typing.Any):
+    def set_setting(self, setting: str, value: typing.Any,
+            ttl: typing.Optional[float]=None):
         self.bot.database.server_settings.set(self.id, setting,
-            value)
+            value, ttl)
     def get_setting(self, setting: str, default: typing.Any=None
             ) -> typing.Any:
         return self.bot.database.server_settings.get(self.id,
@@ -135,13 +145,28 @@ class Server(IRCObject.Object):
     def del_setting(self, setting: str):
         self.bot.database.server_settings.delete(self.id, setting)
 
+    def set_settings(self, settings: typing.Dict[str, typing.Any],
+            ttl: typing.Optional[float]=None):
+        self.bot.database.server_settings.set_many(
+            [(self.id, setting, value) for setting, value in settings.items()],
+            ttl)
+    def get_settings(self, settings: typing.List[str],
+            default: typing.Any=None) -> typing.Dict[str, typing.Any]:
+        values = self.bot.database.server_settings.get_many(
+            [(self.id, setting) for setting in settings], default)
+        return dict(zip(settings, values))
+    def del_settings(self, settings: typing.List[str]):
+        self.bot.database.server_settings.delete_many(
+            [(self.id, setting) for setting in settings])
+
     def get_user_setting(self, nickname: str, setting: str,
             default: typing.Any=None) -> typing.Any:
         user_id = self.get_user_id(nickname)
         return self.bot.database.user_settings.get(user_id, setting, default)
-    def set_user_setting(self, nickname: str, setting: str, value: typing.Any):
+    def set_user_setting(self, nickname: str, setting: str, value: typing.Any,
+            ttl: typing.Optional[float]=None):
         user_id = self.get_user_id(nickname)
-        self.bot.database.user_settings.set(user_id, setting, value)
+        self.bot.database.user_settings.set(user_id, setting, value, ttl)
 
     def get_all_user_settings(self, setting: str, default: typing.Any=[]
             ) -> typing.List[typing.Any]:
@@ -171,7 +196,7 @@ class Server(IRCObject.Object):
             self.add_own_mode(mode, arg)
 
     def has_user(self, nickname: str) -> bool:
-        return self.irc_lower(nickname) in self.users
+        return nickname in self.users
     def get_user(self, nickname: str, username: typing.Optional[str]=None, hostname: str=None,
             create: bool=True) -> typing.Optional[IRCUser.User]:
         new = False
@@ -179,9 +204,9 @@ class Server(IRCObject.Object):
             new = True
             user_id = self.get_user_id(nickname)
             new_user = IRCUser.User(nickname, user_id, self, self.bot)
-            self.users[new_user.nickname_lower] = new_user
+            self.users[nickname] = new_user
 
-        user = self.users.get(self.irc_lower(nickname), None)
+        user = self.users.get(nickname, None)
         if user:
             if username is not None:
                 user.username = username
@@ -192,9 +217,7 @@ class Server(IRCObject.Object):
         return user
 
     def get_user_id(self, nickname: str) -> int:
-        nickname_lower = self.irc_lower(nickname)
-        self.bot.database.users.add(self.id, nickname_lower)
-        return self.bot.database.users.get_id(self.id, nickname_lower)
+        return self.bot.database.users.add(self.id, self.irc_lower(nickname))
     def has_user_id(self, nickname: str) -> bool:
         id = self.bot.database.users.get_id(self.id, self.irc_lower(nickname))
         return not id == None
@@ -227,19 +250,30 @@ class Server(IRCObject.Object):
         return None
 
     def change_user_nickname(self, old_nickname: str, new_nickname: str):
-        user = self.users.pop(self.irc_lower(old_nickname))
+        user = self.users.pop(old_nickname)
         user._id = self.get_user_id(new_nickname)
-        self.users[self.irc_lower(new_nickname)] = user
+        self.users[new_nickname] = user
+
+    @property
+    def case_mapping(self) -> str:
+        return self._case_mapping
+    @case_mapping.setter
+    def case_mapping(self, case_mapping: str):
+        self._case_mapping_table = utils.irc.case_mapping_table(case_mapping)
+        self._case_mapping = case_mapping
+        typing.cast(utils.irc.CaseFoldedDict, self.users).refold()
+        self.channels.refold()
 
     def irc_lower(self, s: str) -> str:
-        return utils.irc.lower(self.case_mapping, s)
+        return s.translate(self._case_mapping_table)
     def irc_equals(self, s1: str, s2: str) -> bool:
-        return utils.irc.equals(self.case_mapping, s1, s2)
+        return (s1.translate(self._case_mapping_table) ==
+            s2.translate(self._case_mapping_table))
 
     def _post_read(self, lines: typing.List[str]):
         for line in lines:
-            self.bot.log.debug("%s (raw recv) | %s", [str(self), line])
-            self.events.on("raw.received").call_unsafe(server=self,
+            self.bot.log.debug("%s (raw recv) | %s", [self, line])
+            self._raw_received.call_unsafe(server=self,
                 line=IRCLine.parse_line(line))
             self.check_users()
     def check_users(self):
@@ -274,13 +308,13 @@ class Server(IRCObject.Object):
     def _send(self) -> typing.List[IRCLine.SentLine]:
         lines = self.socket._send()
         for line in lines:
-            self.bot.log.debug("%s (raw send) | %s", [
-                str(self), line.parsed_line.format()])
+            self.bot.log.debug("%s (raw send) | %s", [self, line])
         return lines
     def _post_send(self, lines: typing.List[IRCLine.SentLine]):
+        self.bot.check_throttle(self)
         for line in lines:
             line.events.on("send").call()
-            self.events.on("raw.send").call_unsafe(server=self,
+            self._raw_send.call_unsafe(server=self,
                 line=line.parsed_line)
 
     def send(self, line_parsed: IRCLine.ParsedLine, immediate: bool=False
@@ -290,19 +324,20 @@ class Server(IRCObject.Object):
 
         line_events = self.events.new_root()
 
-        self.events.on("preprocess.send").on(line_parsed.command
+        self._preprocess_send.on(line_parsed.command
             ).call_unsafe(server=self, line=line_parsed, events=line_events)
-        self.events.on("preprocess.send").call_unsafe(server=self,
+        self._preprocess_send.call_unsafe(server=self,
             line=line_parsed, events=line_events)
 
         if line_parsed.valid() or line_parsed.assured():
-            line = line_parsed.format()
             line_obj = IRCLine.SentLine(line_events, datetime.datetime.utcnow(),
                 self.hostmask(), line_parsed)
             self.socket.send(line_obj, immediate=immediate)
 
             if immediate:
-                self.bot.trigger_write()
+                self.bot.trigger_write(self)
+            else:
+                self.bot.check_throttle(self)
 
             return line_obj
         return None
@@ -1,10 +1,22 @@
-import datetime, socket, ssl, time, threading, typing
+import collections, datetime, itertools, os, socket, ssl, time, threading
+import typing
 from src import IRCLine, Logging, IRCObject, utils
 
 THROTTLE_LINES = 4
 THROTTLE_SECONDS = 1
 UNTHROTTLED_MAX_LINES = 10
 
+# recv_into() size grows towards READ_SIZE_MAX while reads fill it and
+# shrinks back towards READ_SIZE_MIN when they don't
+READ_SIZE_MIN = 4096
+READ_SIZE_MAX = 65536
+
+# most buffers we can hand to a single sendmsg()
+try:
+    IOV_MAX = min(os.sysconf("SC_IOV_MAX"), 1024)
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 16
+
 class Socket(IRCObject.Object):
     def __init__(self, log: Logging.Log, encoding: str, fallback_encoding: str,
             hostname: str, port: int, bindhost: str, tls: bool,
@@ -27,11 +39,19 @@ class Socket(IRCObject.Object):
 
         self.connected = False
 
-        self._write_buffer = b""
+        # one buffer per line in _buffered_lines, the first of which has had
+        # its first _write_offset bytes sent already
+        self._write_buffer = collections.deque(
+            ) # type: typing.Deque[memoryview]
+        self._write_offset = 0
         self._write_buffer_lock = threading.Lock()
         self._queued_lines = [] # type: typing.List[IRCLine.SentLine]
-        self._buffered_lines = [] # type: typing.List[IRCLine.SentLine]
-        self._read_buffer = b""
+        self._buffered_lines = collections.deque(
+            ) # type: typing.Deque[IRCLine.SentLine]
+        # the first _read_length bytes of _read_buffer are a non-complete line
+        self._read_buffer = bytearray(READ_SIZE_MIN*2)
+        self._read_length = 0
+        self._read_size = READ_SIZE_MIN
         self._recent_sends = [] # type: typing.List[float]
         self.cached_fileno = None # type: typing.Optional[int]
         self.bytes_written = 0
@@ -90,29 +110,57 @@ class Socket(IRCObject.Object):
             pass
 
     def read(self) -> typing.Optional[typing.List[str]]:
-        data = b""
-        try:
-            data = self._socket.recv(4096)
-        except (ConnectionResetError, socket.timeout, OSError):
-            self.disconnect()
-            return None
-        if not data:
-            self.disconnect()
-            return None
-        self.bytes_read += len(data)
-        data = self._read_buffer+data
-        self._read_buffer = b""
-
-        data_lines = [line.strip(b"\r") for line in data.split(b"\n")]
-        if data_lines[-1]:
-            self._read_buffer = data_lines[-1]
-            self.log.trace("recevied and buffered non-complete line: %s",
-                [data_lines[-1]])
-
-        data_lines.pop(-1)
-        decoded_lines = []
+        buffer = self._read_buffer
+        read_size = self._read_size
+        if len(buffer) < self._read_length+read_size:
+            # can't resize while there's a memoryview of it
+            buffer.extend(bytes(self._read_length+read_size-len(buffer)))
 
-        for line in data_lines:
+        with memoryview(buffer) as view:
+            try:
+                read = self._socket.recv_into(
+                    view[self._read_length:self._read_length+read_size])
+            except (ConnectionResetError, socket.timeout, OSError):
+                self.disconnect()
+                return None
+            if not read:
+                self.disconnect()
+                return None
+            self.bytes_read += read
+
+            if read == read_size:
+                self._read_size = min(READ_SIZE_MAX, read_size*2)
+            elif read < read_size//4:
+                self._read_size = max(READ_SIZE_MIN, read_size//2)
+
+            end = self._read_length+read
+            start = buffer.rfind(b"\n", 0, end)+1
+            complete = view[:start]
+            try:
+                # one decode for everything we've got complete lines for
+                data = str(complete, self._encoding)
+            except UnicodeDecodeError:
+                decoded_lines = self._decode_lines(complete.tobytes())
+            else:
+                decoded_lines = [line.strip("\r") for line in
+                    data.split("\n")[:-1]]
+            del complete
+
+        # move the non-complete line, if any, to the start of the buffer
+        self._read_length = end-start
+        if self._read_length:
+            buffer[:self._read_length] = buffer[start:end]
+            if self.log.tracing():
+                self.log.trace("recevied and buffered non-complete line: %s",
+                    [bytes(buffer[:self._read_length])])
+
+        self.last_read = time.monotonic()
+        return decoded_lines
+
+    def _decode_lines(self, data: bytes) -> typing.List[str]:
+        decoded_lines = []
+        for line in data.split(b"\n")[:-1]:
+            line = line.strip(b"\r")
             try:
                 decoded_line = line.decode(self._encoding)
             except UnicodeDecodeError:
@@ -123,12 +171,10 @@ class Socket(IRCObject.Object):
                 except UnicodeDecodeError:
                     continue
             decoded_lines.append(decoded_line)
-
-        self.last_read = time.monotonic()
         return decoded_lines
 
     def _immediate_buffer(self, line: IRCLine.SentLine):
-        self._write_buffer += line.for_wire()
+        self._write_buffer.append(memoryview(line.for_wire()))
         self._buffered_lines.append(line)
 
     def send(self, line: IRCLine.SentLine, immediate: bool=False):
@@ -155,19 +201,32 @@ class Socket(IRCObject.Object):
     def _send(self) -> typing.List[IRCLine.SentLine]:
         sent_lines = [] # type: typing.List[IRCLine.SentLine]
         with self._write_buffer_lock:
-            bytes_written_i = self._socket.send(self._write_buffer)
-            bytes_written = self._write_buffer[:bytes_written_i]
+            buffers = list(itertools.islice(self._write_buffer, IOV_MAX))
+            if self._write_offset:
+                buffers[0] = buffers[0][self._write_offset:]
+
+            if self._tls:
+                # SSLSocket doesn't do sendmsg()
+                bytes_written_i = self._socket.send(b"".join(buffers))
+            else:
+                bytes_written_i = self._socket.sendmsg(buffers)
 
-            sent_lines_count = bytes_written.count(b"\n")
-            for i in range(sent_lines_count):
-                sent_lines.append(self._buffered_lines.pop(0))
+            remaining = bytes_written_i
+            while remaining:
+                line_left = len(self._write_buffer[0])-self._write_offset
+                if remaining < line_left:
+                    self._write_offset += remaining
+                    break
 
-            self._write_buffer = self._write_buffer[bytes_written_i:]
+                remaining -= line_left
+                self._write_buffer.popleft()
+                self._write_offset = 0
+                sent_lines.append(self._buffered_lines.popleft())
 
         self.bytes_written += bytes_written_i
 
         now = time.monotonic()
-        self._recent_sends.extend([now]*sent_lines_count)
+        self._recent_sends.extend([now]*len(sent_lines))
         self.last_send = now
 
         return sent_lines
@@ -51,8 +51,10 @@ class User(IRCObject.Object):
     def part_channel(self, channel: "IRCChannel.Channel"):
         self.channels.remove(channel)
 
-    def set_setting(self, setting: str, value: typing.Any):
-        self.bot.database.user_settings.set(self.get_id(), setting, value)
+    def set_setting(self, setting: str, value: typing.Any,
+            ttl: typing.Optional[float]=None):
+        self.bot.database.user_settings.set(self.get_id(), setting, value,
+            ttl)
     def get_setting(self, setting: str, default: typing.Any=None) -> typing.Any:
         return self.bot.database.user_settings.get(self.get_id(), setting,
             default)
@@ -70,6 +72,23 @@ class User(IRCObject.Object):
 
     def del_setting(self, setting):
         self.bot.database.user_settings.delete(self.get_id(), setting)
+
+    def set_settings(self, settings: typing.Dict[str, typing.Any],
+            ttl: typing.Optional[float]=None):
+        user_id = self.get_id()
+        self.bot.database.user_settings.set_many(
+            [(user_id, setting, value) for setting, value in settings.items()],
+            ttl)
+    def get_settings(self, settings: typing.List[str],
+            default: typing.Any=None) -> typing.Dict[str, typing.Any]:
+        user_id = self.get_id()
+        values = self.bot.database.user_settings.get_many(
+            [(user_id, setting) for setting in settings], default)
+        return dict(zip(settings, values))
+    def del_settings(self, settings: typing.List[str]):
+        user_id = self.get_id()
+        self.bot.database.user_settings.delete_many(
+            [(user_id, setting) for setting in settings])
     def get_channel_settings_per_setting(self, setting: str,
             default: typing.Any=[]) -> typing.List[typing.Any]:
         return self.bot.database.user_channel_settings.find_by_setting(
@@ -1,4 +1,4 @@
-import datetime, logging, logging.handlers, os, queue, sys, time, typing
+import datetime, logging, logging.handlers, os, queue, re, sys, time, typing
 from src import utils
 
 LEVELS = {
@@ -32,6 +32,7 @@ class Log(object):
             location: str,
             file_levels: typing.List[str]):
         self._hooks = []
+        self._trace_filter = None # type: typing.Optional[typing.Pattern]
 
         logging.addLevelName(LEVELS["trace"], "TRACE")
         self.logger = logging.getLogger(__name__)
@@ -40,8 +41,6 @@ class Log(object):
             raise ValueError("Unknown log level '%s'" % level)
         stdout_level = LEVELS[level.lower()]
 
-        self.logger.setLevel(LEVELS["trace"])
-
         formatter = BitBotFormatter("%(asctime)s [%(levelname)s] %(message)s")
 
         stdout_handler = logging.StreamHandler(sys.stdout)
@@ -49,10 +48,11 @@ class Log(object):
         stdout_handler.setFormatter(formatter)
         self.logger.addHandler(stdout_handler)
 
-        hook_handler = HookedHandler(self._on_log)
-        hook_handler.setLevel(LEVELS["trace"])
-        hook_handler.setFormatter(formatter)
-        self.logger.addHandler(hook_handler)
+        # nothing gets through this until a hook asks for a level
+        self._hook_handler = HookedHandler(self._on_log)
+        self._hook_handler.setLevel(logging.CRITICAL+1)
+        self._hook_handler.setFormatter(formatter)
+        self.logger.addHandler(self._hook_handler)
 
         if to_file:
             if "TRACE" in file_levels:
@@ -78,14 +78,50 @@ class Log(object):
                 warn_handler.setFormatter(formatter)
                 self.logger.addHandler(warn_handler)
 
+        self._update_level()
+
+    def _update_level(self):
+        # don't make records that no handler is going to output
+        self.logger.setLevel(min(h.level for h in self.logger.handlers))
+
     def hook(self, func: typing.Callable[[int, str], None]):
         self._hooks.append(func)
+    def set_hook_level(self, level: typing.Optional[int]):
+        if level == None:
+            level = logging.CRITICAL+1
+        self._hook_handler.setLevel(typing.cast(int, level))
+        self._update_level()
+
+    def set_trace_filter(self, pattern: typing.Optional[str]):
+        if pattern:
+            self._trace_filter = re.compile(pattern)
+        else:
+            self._trace_filter = None
+    def get_trace_filter(self) -> typing.Optional[str]:
+        if self._trace_filter == None:
+            return None
+        return typing.cast(typing.Pattern, self._trace_filter).pattern
+
+    # check this before building anything expensive to trace. with a trace
+    # filter set, only traces with a `subject` (e.g. an event path or an SQL
+    # query) that matches it get through
+    def tracing(self, subject: typing.Optional[str]=None) -> bool:
+        if not self.logger.isEnabledFor(LEVELS["trace"]):
+            return False
+        elif self._trace_filter == None:
+            return True
+        return (not subject == None and
+            bool(self._trace_filter.search(typing.cast(str, subject))))
+    def debugging(self) -> bool:
+        return self.logger.isEnabledFor(logging.DEBUG)
     def _on_log(self, levelno, line):
         for func in self._hooks:
             func(levelno, line)
 
-    def trace(self, message: str, params: typing.List=None, **kwargs):
-        self._log(message, params, LEVELS["trace"], kwargs)
+    def trace(self, message: str, params: typing.List=None,
+            subject: typing.Optional[str]=None, **kwargs):
+        if self.tracing(subject):
+            self._log(message, params, LEVELS["trace"], kwargs)
     def debug(self, message: str, params: typing.List=None, **kwargs):
         self._log(message, params, logging.DEBUG, kwargs)
     def info(self, message: str, params: typing.List=None, **kwargs):
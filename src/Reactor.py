@@ -0,0 +1,42 @@
+import selectors, typing
+
+READ = selectors.EVENT_READ
+WRITE = selectors.EVENT_WRITE
+
+class Reactor(object):
+    def __init__(self):
+        selector_type = getattr(selectors, "EpollSelector",
+            selectors.DefaultSelector)
+        self._selector = selector_type() # type: selectors.BaseSelector
+        self._masks = {} # type: typing.Dict[int, int]
+
+    def set_interest(self, fileno: int, mask: int):
+        current = self._masks.get(fileno, 0)
+        if mask == current:
+            return
+
+        if not mask:
+            self.forget(fileno)
+        elif not current:
+            self._selector.register(fileno, mask)
+            self._masks[fileno] = mask
+        else:
+            try:
+                self._selector.modify(fileno, mask)
+            except OSError:
+                # fd was closed (and maybe reused) under us
+                self.forget(fileno)
+                self._selector.register(fileno, mask)
+            self._masks[fileno] = mask
+
+    def forget(self, fileno: int):
+        if fileno in self._masks:
+            del self._masks[fileno]
+            try:
+                self._selector.unregister(fileno)
+            except (KeyError, ValueError, OSError):
+                pass
+
+    def select(self, timeout: typing.Optional[float]
+            ) -> typing.List[typing.Tuple[int, int]]:
+        return [(key.fd, mask) for key, mask in self._selector.select(timeout)]
@@ -0,0 +1,69 @@
+import heapq, itertools, time, typing
+from src import PollHook
+
+T_CALLBACK = typing.Callable[[], None]
+# (deadline, sequence, key) - sequence breaks ties so keys are never compared
+T_ENTRY = typing.Tuple[float, int, typing.Any]
+
+# rebuild the heap when stale entries outnumber live ones by this much
+COMPACT_THRESHOLD = 64
+
+class Scheduler(PollHook.PollHook):
+    def __init__(self):
+        self._heap = [] # type: typing.List[T_ENTRY]
+        self._entries = {
+            } # type: typing.Dict[typing.Any, typing.Tuple[float, int, T_CALLBACK]]
+        self._sequence = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def schedule(self, key: typing.Any, delay: float, callback: T_CALLBACK):
+        self.schedule_at(key, time.monotonic()+delay, callback)
+    def schedule_at(self, key: typing.Any, deadline: float,
+            callback: T_CALLBACK):
+        # any previous entry for `key` is left in the heap and skipped when
+        # it's popped, rather than searching the heap for it
+        sequence = next(self._sequence)
+        self._entries[key] = (deadline, sequence, callback)
+        heapq.heappush(self._heap, (deadline, sequence, key))
+
+        if len(self._heap) > (len(self._entries)*2)+COMPACT_THRESHOLD:
+            self._compact()
+
+    def unschedule(self, key: typing.Any):
+        if key in self._entries:
+            del self._entries[key]
+    def scheduled(self, key: typing.Any) -> bool:
+        return key in self._entries
+
+    def _compact(self):
+        self._heap = [(deadline, sequence, key) for key, (deadline, sequence,
+            _) in self._entries.items()]
+        heapq.heapify(self._heap)
+
+    def _stale(self, entry: T_ENTRY) -> bool:
+        deadline, sequence, key = entry
+        current = self._entries.get(key, None)
+        return current == None or not current[1] == sequence
+
+    def next(self) -> typing.Optional[float]:
+        while self._heap and self._stale(self._heap[0]):
+            heapq.heappop(self._heap)
+
+        if not self._heap:
+            return None
+        return max(0, self._heap[0][0]-time.monotonic())
+
+    def call(self):
+        now = time.monotonic()
+        due = [] # type: typing.List[T_CALLBACK]
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            if not self._stale(entry):
+                due.append(self._entries.pop(entry[2])[2])
+
+        # callbacks are called after popping everything that's due so that
+        # anything they reschedule waits for the next call()
+        for callback in due:
+            callback()
@@ -1,5 +1,5 @@
 import time, typing, uuid
-from src import Database, EventManager, Logging, PollHook
+from src import Database, EventManager, Logging, Scheduler
 
 T_CALLBACK = typing.Callable[["Timer"], None]
 
@@ -18,6 +18,14 @@ class Timer(object):
         self.kwargs = kwargs
         self.callback = callback
         self._done = False
+        # set once Timers has dropped this timer, after which it's never
+        # scheduled again
+        self._removed = False
+        self._on_change = None # type: typing.Optional[T_CALLBACK]
+
+    def _changed(self):
+        if not self._on_change == None:
+            self._on_change(self)
 
     def set_next_due(self):
         self.next_due = time.time()+self.delay
@@ -29,22 +37,27 @@ class Timer(object):
     def redo(self):
         self._done = False
         self.set_next_due()
+        self._changed()
     def finish(self):
         self._done = True
+        self._changed()
     def cancel(self):
         self.finish()
     def done(self) -> bool:
         return self._done
 
-class Timers(PollHook.PollHook):
+class Timers(object):
     def __init__(self, database: Database.Database,
             events: EventManager.Events,
-            log: Logging.Log):
+            log: Logging.Log,
+            scheduler: Scheduler.Scheduler):
         self.database = database
         self.events = events
         self.log = log
+        self._scheduler = scheduler
         self.timers = [] # type: typing.List[Timer]
         self.context_timers = {} # type: typing.Dict[str, typing.List[Timer]]
+        self._firing = None # type: typing.Optional[Timer]
 
     def new_context(self, context: str) -> "TimersContext":
         return TimersContext(self, context)
@@ -60,6 +73,8 @@ class Timers(PollHook.PollHook):
             "name": timer.name, "delay": timer.delay,
             "next-due": timer.next_due, "kwargs": timer.kwargs})
     def _remove(self, timer: Timer):
+        timer._removed = True
+        self._scheduler.unschedule(timer)
         if timer.context:
             self.context_timers[timer.context].remove(timer)
             if not self.context_timers[timer.context]:
@@ -95,14 +110,48 @@ class Timers(PollHook.PollHook):
             self.context_timers[context].append(timer)
         else:
             self.timers.append(timer)
+
+        timer._on_change = self._timer_changed
+        self._schedule(timer)
         return timer
 
-    def next(self) -> typing.Optional[float]:
-        times = list(filter(None,
-            [timer.time_left() for timer in self.get_timers()]))
-        if not times:
-            return None
-        return max(min(times), 0)
+    def _schedule(self, timer: Timer):
+        self._scheduler.schedule(timer, timer.time_left(),
+            lambda: self._fire(timer))
+    def _timer_changed(self, timer: Timer):
+        if timer._removed:
+            return
+        elif timer is self._firing:
+            # _fire() deals with this once the callback has returned
+            return
+        if timer.done():
+            # even if it's already been popped from the scheduler, e.g. by
+            # another timer due in the same Scheduler.call()
+            self._remove(timer)
+        else:
+            self._schedule(timer)
+
+    def _fire(self, timer: Timer):
+        if not timer.due():
+            if not timer.done():
+                # wall clock moved since this was scheduled
+                self._schedule(timer)
+            return
+
+        self._firing = timer
+        try:
+            timer.finish()
+            timer.callback(timer)
+        finally:
+            self._firing = None
+
+        if timer._removed:
+            # e.g. the callback's module was unloaded
+            return
+        elif timer.done():
+            self._remove(timer)
+        else:
+            self._schedule(timer)
 
     def get_timers(self) -> typing.List[Timer]:
         return self.timers + sum(self.context_timers.values(), [])
@@ -117,17 +166,11 @@ class Timers(PollHook.PollHook):
 
         return found
 
-    def call(self):
-        for timer in self.get_timers():
-            if timer.due():
-                timer.finish()
-                timer.callback(timer)
-            if timer.done():
-                self._remove(timer)
-
     def purge_context(self, context: str):
         if context in self.context_timers:
-            del self.context_timers[context]
+            for timer in self.context_timers.pop(context):
+                timer._removed = True
+                self._scheduler.unschedule(timer)
 
 class TimersContext(object):
     def __init__(self, parent: Timers, context: str):
@@ -2,7 +2,7 @@
 
 import enum, re, shlex, string, traceback, typing
 from src import EventManager, IRCLine, ModuleManager, utils
-from . import outs
+from . import outs, regex_filter
 
 COMMAND_METHOD = "command-method"
 COMMAND_METHODS = ["PRIVMSG", "NOTICE"]
@@ -28,6 +28,15 @@ class CommandEvent(object):
         self.command = command
         self.args = args
 
+class RegisteredCommand(object):
+    __slots__ = ("hooks", "aliases_of")
+    def __init__(self, hooks: typing.Tuple[EventManager.EventHook, ...]):
+        self.hooks = hooks
+        # per hook, in the same order as `hooks`
+        self.aliases_of = tuple(
+            (hook.get_kwarg("alias_of", None) or "").lower() or None
+            for hook in hooks)
+
 SETTING_COMMANDMETHOD = utils.OptionsSetting(COMMAND_METHODS, COMMAND_METHOD,
     "Set the method used to respond to commands")
 
@@ -46,6 +55,26 @@ SETTING_COMMANDMETHOD = utils.OptionsSetting(COMMAND_METHODS, COMMAND_METHOD,
 @utils.export("channelset", utils.BoolSetting("prefixed-commands",
     "Disable/enable responding to prefixed commands in-channel"))
 class Module(ModuleManager.BaseModule):
+    def on_load(self):
+        # handles for the events we call for every command
+        self._command_events = self.events.on("received.command")
+        self._regex_events = self.events.on("command.regex")
+        self._regex_filter = regex_filter.RegexFilter(())
+        self._check_events = {
+            context: self.events.on(context).on("command") for context in
+            ["check", "preprocess", "postprocess"]}
+
+        # lowercase command name (or alias): its hooks, kept up to date as
+        # received.command.* hooks are added and removed
+        self._commands = {} # type: typing.Dict[str, RegisteredCommand]
+        self._command_events.watch_children(self._command_hooks_changed)
+
+    def _command_hooks_changed(self, command, hooks):
+        if hooks:
+            self._commands[command] = RegisteredCommand(hooks)
+        elif command in self._commands:
+            del self._commands[command]
+
     @utils.hook("new.user")
     @utils.hook("new.channel")
     def new(self, event):
@@ -55,11 +84,17 @@ class Module(ModuleManager.BaseModule):
             target = event["channel"]
 
     def has_command(self, command):
-        return command.lower() in self.events.on("received").on(
-            "command").get_children()
+        return command.lower() in self._commands
     def get_hooks(self, command):
-        return self.events.on("received.command").on(command
-            ).get_hooks()
+        registered = self._commands.get(command.lower(), None)
+        return registered.hooks if registered else ()
+
+    @utils.export("get-command")
+    def get_command(self, command: str) -> typing.Optional[RegisteredCommand]:
+        return self._commands.get(command.lower(), None)
+    @utils.export("all-commands")
+    def all_commands(self) -> typing.Dict[str, RegisteredCommand]:
+        return self._commands.copy()
 
     def is_highlight(self, server, s):
         if s and s[-1] in [":", ","]:
@@ -74,7 +109,8 @@ class Module(ModuleManager.BaseModule):
 
     def _find_command_hook(self, server, target, is_channel, command, user,
             command_prefix, args):
-        if not self.has_command(command):
+        registered = self._commands.get(command.lower(), None)
+        if registered == None:
             command_event = CommandEvent(command, args)
             self.events.on("get.command").call(command=command_event,
                 server=server, target=target, is_channel=is_channel, user=user,
@@ -82,21 +118,22 @@ class Module(ModuleManager.BaseModule):
 
             command = command_event.command
             args = command_event.args
+            registered = self._commands.get(command.lower(), None)
 
         hook = None
         args_split = []
         channel_skip = False
         private_skip = False
-        if self.has_command(command):
-            for potential_hook in self.get_hooks(command):
-                alias_of = self._get_alias_of(potential_hook)
+        if not registered == None:
+            for potential_hook, alias_of in zip(registered.hooks,
+                    registered.aliases_of):
                 if alias_of:
-                    if self.has_command(alias_of):
-                        potential_hook = self.get_hooks(alias_of)[0]
+                    if alias_of in self._commands:
+                        potential_hook = self._commands[alias_of].hooks[0]
                     else:
                         raise ValueError(
                             "'%s' is an alias of unknown command '%s'"
-                           % (command.lower(), alias_of.lower()))
+                           % (command.lower(), alias_of))
 
                 if not is_channel and potential_hook.get_kwarg("channel_only",
                         False):
@@ -124,7 +161,7 @@ class Module(ModuleManager.BaseModule):
         return hook, command, args_split
 
     def _check(self, context, kwargs, requests=[]):
-        event_hook = self.events.on(context).on("command")
+        event_hook = self._check_events[context]
 
         returns = []
         if requests:
@@ -198,7 +235,8 @@ class Module(ModuleManager.BaseModule):
         if check_success:
             event_kwargs.update(event_kwargs.pop("kwargs"))
             new_event = self.events.on(hook.event_name).make_event(**event_kwargs)
-            self.log.trace("calling command '%s': %s", [command, new_event.kwargs])
+            self.log.trace("calling command '%s': %s",
+                [command, new_event.kwargs], subject=hook.event_name)
 
             try:
                 hook.call(new_event)
@@ -328,28 +366,29 @@ class Module(ModuleManager.BaseModule):
                     command=command, command_prefix=command_prefix,
                     is_channel=True)
         else:
-            regex_hooks = self.events.on("command.regex").get_hooks()
-            for hook in regex_hooks:
-                if event["action"] and hook.get_kwarg("ignore_action", True):
+            regex_hooks = self._regex_events.get_hooks()
+            if not regex_hooks is self._regex_filter.hooks:
+                self._regex_filter = regex_filter.RegexFilter(regex_hooks)
+
+            for regex_hook in self._regex_filter.candidates(event["message"]):
+                if event["action"] and regex_hook.ignore_action:
                     continue
-                if event["statusmsg"] and not hook.get_kwarg("statusmsg", False
-                        ):
+                if event["statusmsg"] and not regex_hook.statusmsg:
                     continue
 
-                pattern = hook.get_kwarg("pattern", None)
-                if pattern:
-                    match = re.search(pattern, event["message"])
-                    if match:
-                        command = hook.get_kwarg("command", "")
-                        res = self.command(event["server"], event["channel"],
-                            event["target_str"], True, event["user"], command,
-                            "", event["line"], hook, match=match,
-                            message=event["message"], command_prefix="",
-                            action=event["action"], expect_output=False,
-                            buffer_line=event["buffer_line"])
-
-                        if res:
-                            break
+                match = regex_hook.pattern.search(event["message"])
+                if match:
+                    hook = regex_hook.hook
+                    command = hook.get_kwarg("command", "")
+                    res = self.command(event["server"], event["channel"],
+                        event["target_str"], True, event["user"], command,
+                        "", event["line"], hook, match=match,
+                        message=event["message"], command_prefix="",
+                        action=event["action"], expect_output=False,
+                        buffer_line=event["buffer_line"])
+
+                    if res:
+                        break
 
     @utils.hook("received.message.private", priority=EventManager.PRIORITY_LOW)
     def private_message(self, event):
@@ -394,8 +433,6 @@ class Module(ModuleManager.BaseModule):
 
     def _get_prefix(self, hook):
         return hook.get_kwarg("prefix", None)
-    def _get_alias_of(self, hook):
-        return hook.get_kwarg("alias_of", None)
 
     @utils.hook("send.stdout")
     def _stdout(self, event):
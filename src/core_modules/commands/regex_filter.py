@@ -0,0 +1,126 @@
+import re, typing
+from src import EventManager
+
+try:
+    from re import _parser as sre_parse # type: ignore
+except ImportError:
+    import sre_parse # type: ignore
+
+_REPEATS = [sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT,
+    getattr(sre_parse, "POSSESSIVE_REPEAT", None)]
+_ATOMIC_GROUP = getattr(sre_parse, "ATOMIC_GROUP", None)
+
+# a set of literal strings, at least one of which has to appear in a string
+# for a pattern to be able to match it
+T_REQUIREMENT = typing.FrozenSet[str]
+
+def _requirements(parsed: typing.Any) -> typing.List[T_REQUIREMENT]:
+    requirements = [] # type: typing.List[T_REQUIREMENT]
+    run = [] # type: typing.List[str]
+    for op, av in parsed:
+        if op is sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+
+        if run:
+            requirements.append(frozenset(["".join(run)]))
+            run.clear()
+
+        if op is sre_parse.SUBPATTERN:
+            group, add_flags, del_flags, subpattern = av
+            # scoped flags (e.g. "(?i:...)") change what the literals match
+            if not add_flags and not del_flags:
+                requirements.extend(_requirements(subpattern))
+        elif op in _REPEATS:
+            minimum, maximum, subpattern = av
+            if minimum > 0:
+                requirements.extend(_requirements(subpattern))
+        elif op is _ATOMIC_GROUP:
+            requirements.extend(_requirements(av))
+        elif op is sre_parse.BRANCH:
+            _, branches = av
+            # one of the branches has to match, so one of their requirements
+            # has to be met
+            options = [_best(_requirements(branch)) for branch in branches]
+            if all(options):
+                requirements.append(frozenset(literal for option in options
+                    for literal in typing.cast(T_REQUIREMENT, option)))
+
+    if run:
+        requirements.append(frozenset(["".join(run)]))
+    return requirements
+
+def _best(requirements: typing.List[T_REQUIREMENT]
+        ) -> typing.Optional[T_REQUIREMENT]:
+    # the requirement whose shortest literal is longest is least likely to be
+    # met by a string the pattern doesn't match
+    if requirements:
+        return max(requirements, key=lambda r: min(len(s) for s in r))
+    return None
+
+def requirement(pattern: typing.Pattern) -> typing.Optional[T_REQUIREMENT]:
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:
+        return None
+    required = _best(_requirements(parsed))
+
+    if required and pattern.flags & re.IGNORECASE:
+        # unicode case-insensitive matching isn't just lower(); e.g. "s"
+        # matches "ſ", so only use ascii literals and ascii strings
+        if not all(literal.isascii() for literal in required):
+            return None
+        required = frozenset(literal.lower() for literal in required)
+    return required
+
+class RegexHook(object):
+    __slots__ = ("hook", "pattern", "ignore_action", "statusmsg",
+        "requirement", "ignorecase")
+    def __init__(self, hook: EventManager.EventHook, pattern: typing.Pattern):
+        self.hook = hook
+        self.pattern = pattern
+        self.ignore_action = hook.get_kwarg("ignore_action", True)
+        self.statusmsg = hook.get_kwarg("statusmsg", False)
+        self.requirement = requirement(pattern)
+        self.ignorecase = bool(pattern.flags & re.IGNORECASE)
+
+class RegexFilter(object):
+    def __init__(self, hooks: typing.Sequence[EventManager.EventHook]):
+        self.hooks = hooks
+        self._regex_hooks = [] # type: typing.List[RegexHook]
+        self._literals = set([]) # type: typing.Set[str]
+        self._literals_lower = set([]) # type: typing.Set[str]
+
+        for hook in hooks:
+            pattern = hook.get_kwarg("pattern", None)
+            if pattern:
+                regex_hook = RegexHook(hook, re.compile(pattern))
+                self._regex_hooks.append(regex_hook)
+                if regex_hook.requirement:
+                    if regex_hook.ignorecase:
+                        self._literals_lower.update(regex_hook.requirement)
+                    else:
+                        self._literals.update(regex_hook.requirement)
+
+    def candidates(self, s: str) -> typing.List[RegexHook]:
+        # each distinct literal is looked for once, not once per pattern
+        present = set(literal for literal in self._literals if literal in s)
+
+        is_ascii = s.isascii()
+        present_lower = set([]) # type: typing.Set[str]
+        if is_ascii and self._literals_lower:
+            s_lower = s.lower()
+            present_lower = set(literal for literal in self._literals_lower
+                if literal in s_lower)
+
+        candidates = [] # type: typing.List[RegexHook]
+        for regex_hook in self._regex_hooks:
+            required = regex_hook.requirement
+            if required == None:
+                candidates.append(regex_hook)
+            elif regex_hook.ignorecase:
+                if not is_ascii or not required.isdisjoint(present_lower):
+                    candidates.append(regex_hook)
+            elif not required.isdisjoint(present):
+                candidates.append(regex_hook)
+        return candidates
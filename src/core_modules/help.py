@@ -26,9 +26,9 @@ class Module(ModuleManager.BaseModule):
         return None
 
     def _get_hook(self, command):
-        hooks = self.events.on("received.command").on(command).get_hooks()
-        if hooks:
-            return hooks[0]
+        registered = self.exports.get("get-command")(command)
+        if registered:
+            return registered.hooks[0]
         else:
             return None
 
@@ -66,13 +66,8 @@ class Module(ModuleManager.BaseModule):
                 (IRCBot.URL, modules_command, commands_command, help_command))
 
     def _all_command_hooks(self):
-        all_hooks = {}
-        for child_name in self.events.on("received.command").get_children():
-            hooks = self.events.on("received.command").on(child_name
-                ).get_hooks()
-            if hooks:
-                all_hooks[child_name.lower()] = hooks[0]
-        return all_hooks
+        return {command: registered.hooks[0] for command, registered in
+            self.exports.get("all-commands")().items()}
 
     @utils.hook("received.command.modules")
     def modules(self, event):
@@ -32,7 +32,7 @@ class Module(ModuleManager.BaseModule):
             if label == None:
                 tag_key = CAP_TO_TAG[available_cap]
                 label = str(uuid.uuid4())
-                event["line"].tags[tag_key] = label
+                event["line"].add_tag(tag_key, label)
 
             event["server"]._label_cache[label] = WaitingForLabel(event["line"],
                 event["events"])
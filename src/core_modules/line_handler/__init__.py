@@ -1,20 +1,44 @@
-import enum
+import collections, enum
 from src import EventManager, IRCLine, ModuleManager, utils
 from . import channel, core, ircv3, message, user
 
+# how many different commands to keep looked up events for
+COMMAND_CACHE_SIZE = 256
+
 class Module(ModuleManager.BaseModule):
+    def on_load(self):
+        # command: [raw.received.<command>, received.<command>,
+        # raw.received.<command> hooks, whether to call received.<command>],
+        # the last two worked out again when those hooks change. servers can
+        # send any command, so only the most recently seen are kept
+        self._commands = collections.OrderedDict()
+
     def _handle(self, server, line):
-        hooks = self.events.on("raw.received").on(line.command).get_hooks()
-        default_events = []
-        for hook in hooks:
-            default_events.append(hook.get_kwarg("default_event", False))
+        command = line.command
+        entry = self._commands.get(command, None)
+        if entry == None:
+            entry = [self.events.on("raw.received").on(command),
+                self.events.on("received").on(command), (), True]
+            self._commands[command] = entry
+            if len(self._commands) > COMMAND_CACHE_SIZE:
+                self._commands.popitem(last=False)
+        else:
+            self._commands.move_to_end(command)
+        raw_events, default_events, snapshot, call_default = entry
+
+        hooks = raw_events.get_hooks()
+        if not snapshot is hooks:
+            call_default = not hooks or any(hook.get_kwarg("default_event",
+                False) for hook in hooks)
+            entry[2] = hooks
+            entry[3] = call_default
 
         kwargs = {"server": server, "line": line,
             "direction": utils.Direction.Recv}
 
-        self.events.on("raw.received").on(line.command).call_unsafe(**kwargs)
-        if any(default_events) or not hooks:
-            self.events.on("received").on(line.command).call(**kwargs)
+        raw_events.call_unsafe(**kwargs)
+        if call_default:
+            default_events.call(**kwargs)
 
     @utils.hook("raw.received")
     def handle_raw(self, event):
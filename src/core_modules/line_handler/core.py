@@ -1,4 +1,5 @@
 import codecs, re
+from src import utils
 
 RE_ISUPPORT_ESCAPE = re.compile(r"\\x(\d\d)", re.I)
 RE_MODES = re.compile(r"[-+]\w+")
@@ -51,7 +52,8 @@ def handle_005(events, event):
         event["server"].channel_modes = list(modes[3])
     if "CHANTYPES" in isupport:
         event["server"].channel_types = list(isupport["CHANTYPES"])
-    if "CASEMAPPING" in isupport and isupport["CASEMAPPING"]:
+    if (isupport.get("CASEMAPPING", None) in
+            utils.irc.CASE_MAPPINGS):
         event["server"].case_mapping = isupport["CASEMAPPING"]
     if "STATUSMSG" in isupport:
         event["server"].statusmsg = list(isupport["STATUSMSG"])
@@ -15,20 +15,54 @@ def multi_replace(s: str,
     for char1, char2 in zip(chars1, chars2):
         s = s.replace(char1, char2)
     return s
-def lower(case_mapping: str, s: str) -> str:
-    if case_mapping == "ascii":
-        return multi_replace(s, ASCII_UPPER, ASCII_LOWER)
-    elif case_mapping == "rfc1459":
-        return multi_replace(s, RFC1459_UPPER, RFC1459_LOWER)
-    elif case_mapping == "strict-rfc1459":
-        return multi_replace(s, STRICT_RFC1459_UPPER, STRICT_RFC1459_LOWER)
-    else:
+
+CASE_MAPPINGS = {
+    "ascii": str.maketrans(ASCII_UPPER, ASCII_LOWER),
+    "rfc1459": str.maketrans(RFC1459_UPPER, RFC1459_LOWER),
+    "strict-rfc1459": str.maketrans(STRICT_RFC1459_UPPER,
+        STRICT_RFC1459_LOWER)
+} # type: typing.Dict[str, typing.Dict[int, int]]
+def case_mapping_table(case_mapping: str) -> typing.Dict[int, int]:
+    if not case_mapping in CASE_MAPPINGS:
         raise ValueError("unknown casemapping '%s'" % case_mapping)
+    return CASE_MAPPINGS[case_mapping]
+
+def lower(case_mapping: str, s: str) -> str:
+    return s.translate(case_mapping_table(case_mapping))
 
 # compare a string while respecting case mapping
 def equals(case_mapping: str, s1: str, s2: str) -> bool:
     return lower(case_mapping, s1) == lower(case_mapping, s2)
 
+# a dict that folds its keys with `fold`, e.g. IRCServer.Server.irc_lower
+class CaseFoldedDict(dict):
+    def __init__(self, fold: typing.Callable[[str], str]):
+        dict.__init__(self)
+        self._fold = fold
+
+    def refold(self):
+        # for when what `fold` does has changed (e.g. a new CASEMAPPING)
+        items = list(dict.items(self))
+        dict.clear(self)
+        for key, value in items:
+            dict.__setitem__(self, self._fold(key), value)
+
+    def __getitem__(self, key: str) -> typing.Any:
+        return dict.__getitem__(self, self._fold(key))
+    def __setitem__(self, key: str, value: typing.Any):
+        dict.__setitem__(self, self._fold(key), value)
+    def __delitem__(self, key: str):
+        dict.__delitem__(self, self._fold(key))
+    def __contains__(self, key: typing.Any) -> bool:
+        if isinstance(key, str):
+            return dict.__contains__(self, self._fold(key))
+        else:
+            raise TypeError("Expected string, not %r" % key)
+    def get(self, key: str, default: typing.Any=None) -> typing.Any:
+        return dict.get(self, self._fold(key), default)
+    def pop(self, key: str, *args: typing.Any) -> typing.Any:
+        return dict.pop(self, self._fold(key), *args)
+
 REGEX_COLOR = re.compile("%s(?:(\d{1,2})(?:,(\d{1,2}))?)?" % consts.COLOR)
 
 def color(s: str, foreground: consts.IRCColor,